@@ -0,0 +1 @@
+# Benchmarks of the transformer pipeline
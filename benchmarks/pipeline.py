@@ -0,0 +1,160 @@
+# benchmark of the transformation pipeline, stage by stage
+#
+# usage: python -m benchmarks.pipeline --columns 0 50 --rows 0 100000 --output bench.json
+#
+# Every fixture is transformed as is, and then scaled up with extra columns and rows.
+# The output is a json list with one entry per (fixture, columns, rows) run.
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import traceback
+import tracemalloc
+import numpy as np
+import pandas as pd
+from transformer import TelematicZapTransformer
+from transformer import similarity
+from transformer.io import read_dataframe, save_dataframe, parse_datetime_column
+from transformer.find import find_dataframe, find_features, prepare_dataframe
+from transformer.translate import set_translator_backend
+
+
+# inputs, formats and expected outputs of data/
+FIXTURES = [
+    {
+        'name': 'vehicles',
+        'before': 'data/before/example-dataset1.csv',
+        'format': 'data/format/format-example-vehicles.csv',
+        'after': 'data/after/transformed-dataset1.csv',
+    },
+    {
+        'name': 'trips',
+        'before': 'data/before/example-dataset2.xls',
+        'format': 'data/format/format-example-trips.csv',
+        'after': 'data/after/transformed-dataset2.csv',
+    },
+]
+
+
+class StandInTranslator:
+    """
+    Translator that returns the text unchanged, so benchmarks do not depend on the network.
+    """
+    calls = 0
+
+    def __init__(self, source='auto', target='en'):
+        pass
+
+    def translate(self, text: str) -> str:
+        StandInTranslator.calls += 1
+        return text
+
+
+class EncoderCounter:
+    """
+    Counts the calls to the encoder, and the strings encoded.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.strings = 0
+        model = similarity.get_model()
+        encode = model.encode
+        def counted_encode(strings, *args, **kwargs):
+            self.calls += 1
+            self.strings += 1 if isinstance(strings, str) else len(strings)
+            return encode(strings, *args, **kwargs)
+        model.encode = counted_encode
+
+
+def scale_up(dataframe: pd.DataFrame, n_columns: int, n_rows: int, seed=0) -> pd.DataFrame:
+    """
+    Widen a dataframe with n_columns extra columns (shuffled copies of its columns),
+    and lengthen it to n_rows rows (sampled with replacement).
+    """
+    rng = np.random.default_rng(seed)
+    extra = {}
+    for i in range(n_columns):
+        column_name = dataframe.columns[i % dataframe.shape[1]]
+        extra[f'{column_name} {i // dataframe.shape[1] + 2}'] = rng.permutation(dataframe[column_name].to_numpy())
+    dataframe = pd.concat([dataframe, pd.DataFrame(extra, index=dataframe.index)], axis=1)
+    if n_rows:
+        dataframe = dataframe.iloc[rng.integers(0, len(dataframe), n_rows)].reset_index(drop=True)
+    return dataframe
+
+
+def run_stage(results: dict, name: str, function, *args, **kwargs):
+    """
+    Run a stage of the pipeline, recording its wall time and peak memory.
+    """
+    tracemalloc.reset_peak()
+    start_memory = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    output = function(*args, **kwargs)
+    results['stages'][name] = {
+        'seconds': time.perf_counter() - start,
+        'peak_memory_mb': (tracemalloc.get_traced_memory()[1] - start_memory) / 2**20,
+    }
+    return output
+
+
+def benchmark(fixture: dict, n_columns: int, n_rows: int, encoder: EncoderCounter) -> dict:
+    model = TelematicZapTransformer(derive=False)
+    results = {'fixture': fixture['name'], 'extra_columns': n_columns, 'rows': n_rows, 'stages': {}}
+    encoder_calls, encoder_strings, translator_calls = encoder.calls, encoder.strings, StandInTranslator.calls
+    # the stages of TelematicZapTransformer.transform_from_file
+    before_df = run_stage(results, 'read', read_dataframe, fixture['before'], parse_datetimes=False)
+    format_df = read_dataframe(fixture['format'])
+    before_df = scale_up(before_df, n_columns, n_rows)
+    results['input_shape'] = list(before_df.shape)
+    before_df = run_stage(results, 'datetime_parsing', before_df.apply, parse_datetime_column, axis=0)
+    before_df = run_stage(results, 'translation', model.translate, before_df, format_df)
+    before_df = prepare_dataframe(before_df)
+    features = run_stage(results, 'similarity', find_features, before_df, format_df)
+    after_df = run_stage(results, 'assignment', find_dataframe, before_df, format_df,
+        params=model.params, features=features, drop_duplicates=model.drop_duplicates)
+    with tempfile.TemporaryDirectory() as tmp:
+        run_stage(results, 'write', save_dataframe, after_df, os.path.join(tmp, 'after.csv'))
+        # the output as written, read back like the expected output
+        written_df = read_dataframe(os.path.join(tmp, 'after.csv'))
+    results['total_seconds'] = sum(stage['seconds'] for stage in results['stages'].values())
+    results['encoder_calls'] = encoder.calls - encoder_calls
+    results['encoder_strings'] = encoder.strings - encoder_strings
+    results['translator_calls'] = StandInTranslator.calls - translator_calls
+    # accuracy against the expected output (only meaningful without scale-ups)
+    if n_columns == 0 and n_rows == 0:
+        expected_df = read_dataframe(fixture['after'])
+        written_df.columns = expected_df.columns
+        results['score'] = model.score(written_df, expected_df)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--columns', type=int, nargs='+', default=[0, 50], help='numbers of extra columns')
+    parser.add_argument('--rows', type=int, nargs='+', default=[0, 100000], help='numbers of rows (0: unchanged)')
+    parser.add_argument('--fixtures', nargs='+', default=[fixture['name'] for fixture in FIXTURES])
+    parser.add_argument('--output', help='json file to write the results to (default: stdout)')
+    args = parser.parse_args()
+    set_translator_backend(StandInTranslator)
+    encoder = EncoderCounter()
+    tracemalloc.start()
+    results = []
+    for fixture in FIXTURES:
+        if fixture['name'] not in args.fixtures:
+            continue
+        for n_columns in args.columns:
+            for n_rows in args.rows:
+                # a failing run is reported, instead of stopping the whole benchmark
+                try:
+                    results.append(benchmark(fixture, n_columns, n_rows, encoder))
+                except Exception:
+                    results.append({'fixture': fixture['name'], 'extra_columns': n_columns, 'rows': n_rows,
+                        'error': traceback.format_exc()})
+    tracemalloc.stop()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
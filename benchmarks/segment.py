@@ -0,0 +1,57 @@
+# throughput benchmark of the trip segmentation, in points per second
+#
+# usage: python -m benchmarks.segment --points 1000000 --vehicles 100 --chunksize 100000
+
+import argparse
+import json
+import time
+import numpy as np
+import pandas as pd
+from transformer.segment import segment_trips, segment_trips_chunked
+
+
+def synthetic_points(n_points: int, n_vehicles: int, seed=0) -> pd.DataFrame:
+    """
+    Generate a random stream of position points, as random walks with idle gaps.
+    """
+    rng = np.random.default_rng(seed)
+    seconds = np.sort(rng.integers(0, 30 * 86400, n_points))
+    return pd.DataFrame({
+        'vehicle_external_id': rng.integers(0, n_vehicles, n_points),
+        'timestamp': pd.Timestamp('2021-01-01') + pd.to_timedelta(seconds, unit='s'),
+        'latitude': 48 + np.cumsum(rng.normal(0, 0.001, n_points)),
+        'longitude': 11 + np.cumsum(rng.normal(0, 0.001, n_points)),
+    })
+
+
+def benchmark(n_points: int, n_vehicles: int, chunksize: int, repeat=3) -> dict:
+    points = synthetic_points(n_points, n_vehicles)
+    results = {'points': n_points, 'vehicles': n_vehicles, 'chunksize': chunksize}
+    runs = {
+        'whole': lambda: segment_trips(points),
+        'chunked': lambda: pd.concat(list(segment_trips_chunked(
+            points.iloc[i:i + chunksize] for i in range(0, n_points, chunksize)))),
+    }
+    for name, run in runs.items():
+        # keep the best of a few runs
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            trips = run()
+            seconds.append(time.perf_counter() - start)
+        results[name] = {
+            'seconds': min(seconds),
+            'points_per_second': n_points / min(seconds),
+            'trips': len(trips),
+        }
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--points', type=int, default=1000000)
+    parser.add_argument('--vehicles', type=int, default=100)
+    parser.add_argument('--chunksize', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(benchmark(args.points, args.vehicles, args.chunksize, args.repeat), indent=2))
@@ -169,6 +169,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_PAGINATION_CLASS': 'zap.pagination.CreatedAtCursorPagination',
 }
 
 SPECTACULAR_SETTINGS = {
@@ -189,8 +190,18 @@ LOGOUT_REDIRECT_URL = '/'
 MEDIA_URL = '/data/'
 MEDIA_ROOT = BASE_DIR / 'data'
 
+# header handing the downloads off to the front proxy: 'X-Sendfile' (apache, lighttpd),
+# 'X-Accel-Redirect' (nginx), or unset to stream them from django
+DOWNLOAD_SENDFILE_HEADER = os.environ.get('DOWNLOAD_SENDFILE_HEADER')
+# the internal location of nginx serving MEDIA_ROOT, for X-Accel-Redirect
+DOWNLOAD_ACCEL_REDIRECT_LOCATION = os.environ.get('DOWNLOAD_ACCEL_REDIRECT_LOCATION', '/protected/')
+
+# fitted transformer saved with TelematicZapTransformer.save (default: built-in parameters)
+TRANSFORMER_ARTIFACT = os.environ.get('TRANSFORMER_ARTIFACT')
+
 # file upload settings
 FILE_UPLOAD_HANDLERS = [
     #"django.core.files.uploadhandler.MemoryFileUploadHandler",
-    "django.core.files.uploadhandler.TemporaryFileUploadHandler"
+    # hashes the files while they are uploaded to temporary files (see zap.storage)
+    "zap.storage.HashingUploadHandler"
 ]
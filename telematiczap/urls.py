@@ -66,11 +66,18 @@ urlpatterns = [
     path("signup", views.RegisterFormView.as_view(), name="signup"),
     path('', include('django.contrib.auth.urls')),
     path("data-before", views.DataBeforeList.as_view(), name="data-before"),
-    path("data-before/<id>", views.DataBeforeRUD.as_view()),
+    path("data-before/<pk>", views.DataBeforeRUD.as_view(), name="databefore-detail"),
+    path("data-before/<pk>/download", views.DataBeforeDownload.as_view()),
     path("data-after", views.DataAfterList.as_view(), name="data-after"),
-    path("data-after/<id>", views.DataAfterRUD.as_view()),
+    path("data-after/<pk>", views.DataAfterRUD.as_view(), name="dataafter-detail"),
+    path("data-after/<pk>/download", views.DataAfterDownload.as_view()),
     path("data-format", views.DataFormatList.as_view(), name="data-format"),
-    path("data-format/<id>", views.DataFormatRUD.as_view()),
+    path("data-format/<pk>", views.DataFormatRUD.as_view(), name="dataformat-detail"),
+    path("transform-jobs", views.TransformJobList.as_view(), name="transform-jobs"),
+    path("transform-jobs/<pk>", views.TransformJobDetail.as_view(), name="transformjob-detail"),
+    path("uploads", views.UploadSessionList.as_view(), name="uploads"),
+    path("uploads/<pk>", views.UploadSessionDetail.as_view()),
+    path("uploads/<pk>/complete", views.UploadSessionComplete.as_view()),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 
 if settings.DEBUG: 
@@ -0,0 +1,85 @@
+# functions for deriving missing fields from the matched columns
+
+import numpy as np
+import pandas as pd
+from .find import find_location_columns, find_address_column
+
+
+# mean radius of the earth in kilometers
+EARTH_RADIUS_KM = 6371.0088
+
+# location columns of the trips format
+LOCATION_PREFIXES = ('start_location', 'end_location')
+
+
+def haversine(latitudes1, longitudes1, latitudes2, longitudes2) -> np.ndarray:
+    """
+    Great-circle distance between two arrays of coordinates.
+
+    Args:
+        latitudes1, longitudes1: coordinates of the start points, in degrees
+        latitudes2, longitudes2: coordinates of the end points, in degrees
+
+    Returns:
+        np.ndarray: the distances in kilometers
+    """
+    latitudes1, longitudes1, latitudes2, longitudes2 = (
+        np.radians(np.asarray(x, dtype=float)) for x in (latitudes1, longitudes1, latitudes2, longitudes2))
+    a = np.sin((latitudes2 - latitudes1) / 2)**2 + \
+        np.cos(latitudes1) * np.cos(latitudes2) * np.sin((longitudes2 - longitudes1) / 2)**2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def derive_dataframe(dataframe: pd.DataFrame, geocoder=None) -> pd.DataFrame:
+    """
+    Fill the missing values of a transformed dataframe with values derived from the other columns:
+    coordinates from addresses (and vice versa), distance from coordinates,
+    and duration or end time from the start and end times.
+    Only the columns that are already part of the dataframe schema are filled.
+
+    Args:
+        dataframe (pd.DataFrame): the transformed dataframe
+        geocoder: geocoder used for addresses and coordinates (default: None, no geocoding)
+
+    Returns:
+        pd.DataFrame: the dataframe with the derived values
+    """
+    dataframe = dataframe.copy()
+    columns = set(dataframe.columns)
+    def missing(column):
+        return dataframe[column].isnull().to_numpy() if column in columns else np.zeros(len(dataframe), dtype=bool)
+    def numeric(column):
+        return pd.to_numeric(dataframe[column], errors='coerce')
+    # coordinates from addresses, and addresses from coordinates
+    for prefix in LOCATION_PREFIXES:
+        address, latitude, longitude = prefix + '_address', prefix + '_lat', prefix + '_lon'
+        if geocoder is None or not {address, latitude, longitude} <= columns:
+            continue
+        rows = (missing(latitude) | missing(longitude)) & ~missing(address)
+        if rows.any():
+            locations = find_location_columns(dataframe.loc[rows, address], geocoder)
+            dataframe.loc[rows, latitude] = locations['latitude'].to_numpy()
+            dataframe.loc[rows, longitude] = locations['longitude'].to_numpy()
+        rows = missing(address) & ~missing(latitude) & ~missing(longitude)
+        if rows.any():
+            dataframe.loc[rows, address] = find_address_column(
+                numeric(latitude)[rows], numeric(longitude)[rows], geocoder).to_numpy()
+    # distance from the start and end coordinates
+    coordinates = [prefix + suffix for prefix in LOCATION_PREFIXES for suffix in ('_lat', '_lon')]
+    if 'distance' in columns and set(coordinates) <= columns:
+        rows = missing('distance')
+        if rows.any():
+            start_lat, start_lon, end_lat, end_lon = (numeric(column).to_numpy(dtype=float)[rows] for column in coordinates)
+            dataframe.loc[rows, 'distance'] = haversine(start_lat, start_lon, end_lat, end_lon)
+    # duration (in seconds) from the start and end times, and end times from durations
+    if {'started_at', 'ended_at'} <= columns:
+        started_at = pd.to_datetime(dataframe['started_at'], errors='coerce')
+        if 'duration' in columns:
+            rows = missing('duration') & ~missing('ended_at')
+            if rows.any():
+                ended_at = pd.to_datetime(dataframe['ended_at'], errors='coerce')
+                dataframe.loc[rows, 'duration'] = (ended_at - started_at).dt.total_seconds()[rows].to_numpy()
+            rows = missing('ended_at') & ~missing('duration')
+            if rows.any():
+                dataframe.loc[rows, 'ended_at'] = (started_at + pd.to_timedelta(numeric('duration'), unit='s'))[rows]
+    return dataframe
@@ -2,39 +2,37 @@
 
 import pandas as pd
 import numpy as np
-from .similarity import similarity_str, similarity_columns, is_column_text, is_time, is_date, count_columns_with_dates
-from .io import parse_datetime_column
-from datetime import time
-import geopy
+from .similarity import similarity_str, similarity_columns, is_column_text, is_time, is_date, \
+    encode, column_profiles_many, similarity_features, combine_similarity_features, is_date_profile, is_time_profile, \
+    candidate_pairs, profile_columns, embed_profiles, column_kinds, normalize_name, lexical_similarity, FEATURES
+from .formats import CompiledFormat
+from .io import parse_datetime_column, to_utc_datetime_column, to_timedelta_column
+from .rows import RowDeduplicator
+from pandas.api.types import is_datetime64_any_dtype
+from .geocode import Geocoder, default_geocoder
+from .trace import current_tracer
+import logging
+import re
 
 
-def find_location(address: str, geolocator=None):    
-    geolocator = geopy.ArcGIS() if geolocator is None else geolocator
-    location = geolocator.geocode(address)
-    try:
-        return (location.latitude, location.longitude)
-    except AttributeError:
-        return (np.nan, np.nan)
+logger = logging.getLogger(__name__)
 
-def find_address(latitude: float, longitude: float, geolocator=None):    
-    geolocator = geopy.ArcGIS() if geolocator is None else geolocator
-    location = geolocator.geocode(f"{latitude}, {longitude}")
-    try:
-        return location.address
-    except AttributeError:
-        return ''
 
-def find_location_columns(addresses: pd.Series):
-    return pd.DataFrame(
-        [find_location(address) for address in addresses], 
-        columns=['latitude', 'longitude'], index=addresses.index
-    )
+def find_location(address: str, geolocator=None):
+    geocoder = default_geocoder() if geolocator is None else Geocoder(geolocator)
+    return tuple(find_location_columns(pd.Series([address]), geocoder).iloc[0])
 
-def find_address_column(latitudes: pd.Series, longitudes: pd.Series):
-    return pd.Series(
-        [find_address(latitude, longitude) for latitude, longitude in zip(latitudes, longitudes)],
-        index=latitudes.index, name='address'
-    )
+def find_address(latitude: float, longitude: float, geolocator=None):
+    geocoder = default_geocoder() if geolocator is None else Geocoder(geolocator)
+    return find_address_column(pd.Series([latitude]), pd.Series([longitude]), geocoder).iloc[0]
+
+def find_location_columns(addresses: pd.Series, geocoder=None):
+    geocoder = default_geocoder() if geocoder is None else geocoder
+    return geocoder.locations(addresses)
+
+def find_address_column(latitudes: pd.Series, longitudes: pd.Series, geocoder=None):
+    geocoder = default_geocoder() if geocoder is None else geocoder
+    return geocoder.addresses(latitudes, longitudes)
 
 
 
@@ -85,8 +83,330 @@ def find_column(dataframe: pd.DataFrame, example_column: pd.Series, params={}, r
 
 
 
+def prepare_dataframe(dataframe: pd.DataFrame) -> pd.DataFrame:
+    """
+    Drop irrelevant columns filled with nans, 0s, or empty strings.
+
+    Args:
+        dataframe: The dataframe to search
+
+    Returns:
+        The dataframe without the irrelevant columns
+    """
+    dataframe = dataframe.dropna(axis=1, how='all')
+    dataframe = dataframe.loc[:, (dataframe != 0).any(axis=0)]
+    dataframe = dataframe.loc[:, (dataframe != '').any(axis=0)]
+    return dataframe
+
+
+
+
+def find_features(dataframe: pd.DataFrame, example_dataframe: pd.DataFrame, params={}, clues=[], resolve=True) -> dict:
+    """
+    Calculates everything find_dataframe needs that does not depend on the parameters,
+    so that the dataframe can be matched against the example with many sets of parameters cheaply.
+
+    Args:
+        dataframe: The dataframe to search (see prepare_dataframe)
+        example_dataframe: An example of the data to search for
+        params: The blocking parameters (see similarity.candidate_pairs)
+        clues: The clues of the columns of the dataframe (see match_clues)
+        resolve: If false, every pair of columns is scored, so that the features can be blocked
+            again for other parameters (see block_features)
+
+    Returns:
+        Dictionary with the profiles of the columns of both dataframes, the features of every pair
+        of columns, the pairs of columns that are candidates to match, and the features of every column
+        paired with the times of the example datetimes
+    """
+    return find_features_many([(dataframe, example_dataframe)], params=params, clues_list=[clues], resolve=resolve)[0]
+
+
+def find_features_many(pairs: list, params={}, clues_list=None, resolve=True) -> list:
+    """
+    Calculates the features of several (dataframe, example_dataframe) pairs (see find_features).
+    The columns whose names match the example (see resolve_columns) are not encoded nor scored,
+    the strings of all the other columns are encoded in a single batch, and the examples shared
+    by several pairs are profiled only once.
+
+    Args:
+        pairs: list of (dataframe, example_dataframe) tuples, where example_dataframe can be a CompiledFormat
+        params: The matching parameters (see resolve_columns and similarity.candidate_pairs)
+        clues_list: The clues of the columns of each dataframe (see match_clues), pinned columns
+            are matched without scoring, and the others narrow the candidates of their example columns
+        resolve: If false, the columns are not matched by their names before scoring them (see find_features)
+
+    Returns:
+        List with the features of each pair
+    """
+    # examples of the formats, without duplicates, and already compiled
+    examples = {}
+    for _, example_dataframe in pairs:
+        examples.setdefault(id(example_dataframe), example_dataframe)
+    compiled = {key: example for key, example in examples.items() if isinstance(example, CompiledFormat)}
+    examples = {key: example for key, example in examples.items() if key not in compiled}
+    examples_times = {key: example_time_columns(example_dataframe) for key, example_dataframe in examples.items()}
+    # profile everything, without embeddings
+    profiles_list = [profile_columns(dataframe) for dataframe, _ in pairs]
+    examples_profiles = {key: profile_columns(example_dataframe) for key, example_dataframe in examples.items()}
+    times_profiles = {key: profile_columns(example_times) for key, example_times in examples_times.items()}
+    for key, compiled_format in compiled.items():
+        examples_profiles[key] = compiled_format.profiles
+        times_profiles[key] = compiled_format.time_profiles
+    # match the columns pinned by the clues, and then the columns whose names are the same, or almost the same
+    if clues_list is None:
+        clues_list = [[]] * len(pairs)
+    resolved_list = [
+        pinned_columns(profiles, examples_profiles[id(example_dataframe)], clues) +
+        (resolve_columns(*unpinned_profiles(profiles, examples_profiles[id(example_dataframe)], clues), params)
+            if resolve else [])
+        for profiles, (_, example_dataframe), clues in zip(profiles_list, pairs, clues_list)
+    ]
+    unresolved_list = [
+        ~profiles.index.isin([match['column'] for match in resolved])
+        for profiles, resolved in zip(profiles_list, resolved_list)
+    ]
+    # encode the strings of the other columns at once
+    unresolved_profiles_list = embed_profiles(
+        [profiles.loc[unresolved].copy() for profiles, unresolved in zip(profiles_list, unresolved_list)] +
+        [examples_profiles[key] for key in examples] + [times_profiles[key] for key in examples]
+    )[:len(pairs)]
+    tracer = current_tracer()
+    features_list = []
+    for profiles, unresolved_profiles, unresolved, resolved, clues, (_, example_dataframe) in \
+            zip(profiles_list, unresolved_profiles_list, unresolved_list, resolved_list, clues_list, pairs):
+        key = id(example_dataframe)
+        profiles['id_name'] = unresolved_profiles['id_name'].reindex(profiles.index)
+        # only score the other columns
+        shape = (len(profiles), len(examples_profiles[key]))
+        columns_features = np.zeros(shape + (len(FEATURES),))
+        columns_features[unresolved] = similarity_features(unresolved_profiles, examples_profiles[key])
+        time_features = np.zeros((len(profiles), len(times_profiles[key]), len(FEATURES)))
+        time_features[unresolved] = similarity_features(unresolved_profiles, times_profiles[key])
+        candidates = block_columns(profiles, examples_profiles[key], columns_features, resolved, params, clues)
+        tracer.count('candidate_pairs', int(candidates.sum()))
+        tracer.count('blocked_pairs', int(candidates.size - candidates.sum()))
+        features_list.append({
+            'profiles': profiles,
+            'example_profiles': examples_profiles[key],
+            'resolved': resolved,
+            'columns': columns_features,
+            'candidates': candidates,
+            'times': {name: time_features[:, i] for i, name in enumerate(times_profiles[key].index)},
+        })
+    return features_list
+
+
+def block_columns(profiles: pd.DataFrame, example_profiles: pd.DataFrame, columns_features: np.ndarray,
+    resolved: list, params={}, clues=[]) -> np.ndarray:
+    """
+    Finds the pairs of columns worth scoring: only the pairs of compatible columns with similar names
+    (see similarity.candidate_pairs), among the columns not resolved by their names.
+
+    Args:
+        profiles: The profiles of the columns of the dataframe (see similarity.profile_columns)
+        example_profiles: The profiles of the columns of the example
+        columns_features: The features of every pair of columns (see similarity.similarity_features)
+        resolved: The columns matched by their names (see resolve_columns)
+        params: The blocking parameters (see similarity.candidate_pairs)
+        clues: The clues of the columns of the dataframe (see match_clues)
+
+    Returns:
+        Boolean array of shape (len(profiles), len(example_profiles))
+    """
+    unresolved = ~profiles.index.isin([match['column'] for match in resolved])
+    candidates = np.zeros((len(profiles), len(example_profiles)), dtype=bool)
+    candidates[unresolved] = candidate_pairs(profiles.loc[unresolved], example_profiles, columns_features[unresolved], params)
+    candidates[:, example_profiles.index.isin([match['example_column'] for match in resolved])] = False
+    # the example columns with clues only match the columns they point to
+    for example_column in {clue['example_column'] for clue in clues if not clue['pinned']}:
+        if example_column in example_profiles.index:
+            candidates[:, example_profiles.index.get_loc(example_column)] &= profiles.index.isin(
+                [clue['column'] for clue in clues if clue['example_column'] == example_column])
+    return candidates
+
+
+def block_features(features: dict, params={}) -> dict:
+    """
+    Matches the columns by their names and blocks the pairs of columns again, for other parameters,
+    from features calculated with resolve=False (see find_features). No strings are encoded.
+
+    Args:
+        features: The result of find_features for the dataframes, with resolve=False
+        params: The matching parameters (see resolve_columns and similarity.candidate_pairs)
+
+    Returns:
+        The features, with the 'resolved' columns and the 'candidates' of params
+    """
+    resolved = resolve_columns(features['profiles'], features['example_profiles'], params)
+    candidates = block_columns(features['profiles'], features['example_profiles'], features['columns'], resolved, params)
+    return {**features, 'resolved': resolved, 'candidates': candidates}
+
+
+def filter_columns(dataframe: pd.DataFrame, clues={}) -> pd.DataFrame:
+    """
+    Drop the columns that the clues ignore, or that are not among the columns the clues use.
+    Column names are compared once normalized (see similarity.normalize_name).
+
+    Args:
+        dataframe: The dataframe to filter
+        clues: Dictionary with the 'ignore_columns' and the 'use_columns' (lists of names, or comma-separated names)
+
+    Returns:
+        The dataframe without the columns left out
+    """
+    names = [normalize_name(str(column_name).lower()) for column_name in dataframe.columns]
+    ignore_columns, use_columns = clue_names(clues.get('ignore_columns')), clue_names(clues.get('use_columns'))
+    keep = [name not in ignore_columns and (not use_columns or name in use_columns) for name in names]
+    return dataframe.loc[:, keep]
+
+
+def clue_names(names) -> list:
+    # the normalized names of a list of names, or of comma-separated names
+    if not names:
+        return []
+    if isinstance(names, str):
+        names = names.split(',')
+    return [normalize_name(str(name).lower()) for name in names if str(name).strip()]
+
+
+def match_clues(dataframe: pd.DataFrame, example_columns, clues={}) -> list:
+    """
+    Finds the columns of the dataframe that the clues of the example columns point to.
+    A clue that is the name of a column pins the example column to it, and the other clues
+    are words that the names of the candidates of the example column must contain.
+    Clues that point to no column are ignored.
+
+    Args:
+        dataframe: The dataframe to search, before translating it
+        example_columns: The columns of the example
+        clues: Dictionary with the clues of the example columns in 'columns',
+            as {example column: list of clues, or comma-separated clues}
+
+    Returns:
+        List of the columns pointed to, as dictionaries with the 'column', the 'example_column'
+        and whether it is 'pinned' to it
+    """
+    matches = []
+    names = pd.Series([normalize_name(str(column_name).lower()) for column_name in dataframe.columns], index=dataframe.columns)
+    for example_column, column_clues in clues.get('columns', {}).items():
+        if example_column not in example_columns:
+            continue
+        column_clues = clue_names(column_clues)
+        pinned = names.index[names.isin(column_clues)]
+        if len(pinned):
+            matches.append({'column': pinned[0], 'example_column': example_column, 'pinned': True})
+            continue
+        for column_name, name in names.items():
+            if any(re.search(rf'\b{re.escape(clue)}\b', name) for clue in column_clues):
+                matches.append({'column': column_name, 'example_column': example_column, 'pinned': False})
+    return matches
+
+
+def pinned_columns(profiles: pd.DataFrame, example_profiles: pd.DataFrame, clues: list) -> list:
+    # the columns pinned by the clues, as resolved by resolve_columns, each column pinned once
+    resolved = []
+    for clue in clues:
+        if clue['pinned'] and clue['column'] in profiles.index and clue['example_column'] in example_profiles.index and \
+                all(clue['column'] != match['column'] for match in resolved):
+            resolved.append({'column': clue['column'], 'example_column': clue['example_column'],
+                'similarity': 1.0, 'tier': 'clue'})
+    return resolved
+
+
+def unpinned_profiles(profiles: pd.DataFrame, example_profiles: pd.DataFrame, clues: list) -> tuple:
+    # the profiles of the columns not pinned by the clues
+    pinned = pinned_columns(profiles, example_profiles, clues)
+    return profiles.drop(index=[match['column'] for match in pinned]), \
+        example_profiles.drop(index=[match['example_column'] for match in pinned])
+
+
+def resolve_columns(profiles: pd.DataFrame, example_profiles: pd.DataFrame, params={}) -> list:
+    """
+    Matches the columns whose names need no model to be recognized: first the names that are the same
+    once normalized, then the names that are clearly the most similar to each other by their words
+    and characters (see similarity.lexical_similarity). Datetime columns are left to the full matching,
+    which also combines dates and times.
+
+    Args:
+        profiles: The profiles of the columns of the dataframe to search (see similarity.profile_columns)
+        example_profiles: The profiles of the columns of the example
+        params: 'min_similarity_lexical' (default 0.6), the minimum lexical similarity of a match,
+            and 'margin_similarity_lexical' (default 0.2), how much more similar than any other
+            name it must be
+
+    Returns:
+        List of the columns matched, as dictionaries with the 'column', the 'example_column',
+        the 'similarity' and the 'tier' ('exact' or 'lexical') that matched them
+    """
+    resolved = []
+    kinds, example_kinds = column_kinds(profiles, params), column_kinds(example_profiles, params)
+    names = pd.Series([normalize_name(name) for name in profiles['name']], index=profiles.index)
+    example_names = pd.Series([normalize_name(name) for name in example_profiles['name']], index=example_profiles.index)
+    # only columns of the same kind, and not datetimes
+    compatible = (kinds[:, None] == example_kinds[None, :]) & (kinds[:, None] != 'datetime')
+    # exact names, if they are unique
+    exact = (names.to_numpy()[:, None] == example_names.to_numpy()[None, :]) & compatible
+    exact &= (exact.sum(axis=1, keepdims=True) == 1) & (exact.sum(axis=0, keepdims=True) == 1)
+    for i, j in zip(*np.nonzero(exact)):
+        resolved.append({'column': profiles.index[i], 'example_column': example_profiles.index[j],
+            'similarity': 1.0, 'tier': 'exact'})
+    # names clearly more similar to each other than to any other name
+    rows, columns = ~exact.any(axis=1), ~exact.any(axis=0)
+    if rows.sum() > 0 and columns.sum() > 0:
+        lexical = np.where(compatible, lexical_similarity(names.tolist(), example_names.tolist()), 0)
+        lexical[~rows] = 0
+        lexical[:, ~columns] = 0
+        margin = params.get('margin_similarity_lexical', 0.2)
+        for i, j in zip(*np.nonzero(lexical >= params.get('min_similarity_lexical', 0.6))):
+            others = max(np.delete(lexical[i], j).max(initial=0), np.delete(lexical[:, j], i).max(initial=0))
+            if lexical[i, j] - others >= margin:
+                resolved.append({'column': profiles.index[i], 'example_column': example_profiles.index[j],
+                    'similarity': float(lexical[i, j]), 'tier': 'lexical'})
+    return resolved
+
+
+
+
+def example_time_columns(example_dataframe: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns the times of the datetime columns of the example, to look for separate time columns.
+    """
+    example_times = {}
+    for example_col_name in example_dataframe.columns:
+        example_col = parse_datetime_column(example_dataframe[example_col_name])
+        if is_datetime64_any_dtype(example_col):
+            example_times[example_col_name] = example_col.dt.time
+    return pd.DataFrame(example_times, columns=list(example_times))
+
+
+def compile_format(example_dataframe: pd.DataFrame, language=None) -> CompiledFormat:
+    """
+    Profiles the example of a format once, so that the transformations to this format
+    do not parse, profile and encode it again.
+
+    Args:
+        example_dataframe: An example of the format
+        language: The language of the example columns
+
+    Returns:
+        The compiled format
+    """
+    example_dataframe = example_dataframe.apply(parse_datetime_column, axis=0)
+    example_times = example_time_columns(example_dataframe)
+    profiles, time_profiles = column_profiles_many([example_dataframe, example_times])
+    # keep the embeddings of every name of the profiles
+    strings = ['id', 'serial number'] + profiles['name'].tolist() + time_profiles['name'].tolist()
+    strings = list(dict.fromkeys(strings))
+    embeddings = dict(zip(strings, encode(strings)))
+    return CompiledFormat(example_dataframe, language, profiles, time_profiles, embeddings)
+
+
+
+
 def find_dataframe(dataframe: pd.DataFrame, example_dataframe: pd.DataFrame, params={},
-    rename=True, print_similarities=False, drop_duplicates=True) -> pd.DataFrame:
+    rename=True, print_similarities=False, drop_duplicates=True, features=None, mapping=None,
+    deduplicator=None, clues=[]) -> pd.DataFrame:
     """
     Finds and returns the most similar columns to example_dataframe found in the dataframe.
 
@@ -95,27 +415,82 @@ def find_dataframe(dataframe: pd.DataFrame, example_dataframe: pd.DataFrame, par
         example_dataframe: An example of the data to search for
         min_similarity: The minimum similarity to consider
         rename: If true (default), rename the found columns to the name of the example columns
+        features: The result of find_features for these dataframes, if already calculated
+        mapping: The result of find_mapping for a dataframe with the same columns, to skip the search
+        deduplicator: The RowDeduplicator of the previous chunks, to drop the rows they already had
+        clues: The clues of the columns of the dataframe (see match_clues)
     
     Returns:
-        The dataframe found, using the same schema as example_dataframe
+        The dataframe found, using the same schema as example_dataframe,
+        with the mapping used in its attrs['mapping']
     """
     assert rename is True, 'rename not implemented'
-    # initialize the output_dataframe
-    output_dataframe = pd.DataFrame(columns=example_dataframe.columns)
-    # drop irrelevant columns filled with nans, 0s, or empty strings
-    dataframe = dataframe.dropna(axis=1, how='all')
-    dataframe = dataframe.loc[:, (dataframe != 0).any(axis=0)]
-    dataframe = dataframe.loc[:, (dataframe != '').any(axis=0)]
-    # calculate similarity between every could of dataframe and every column of example_dataframe
-    similarities = pd.DataFrame(index=dataframe.columns, columns=example_dataframe.columns, dtype=float)
-    for col_name in dataframe.columns:
-        for example_col_name in example_dataframe.columns:
-            col = dataframe[col_name]
-            example_col = example_dataframe[example_col_name]
-            similarities.loc[col_name, example_col_name] = similarity_columns(col, example_col, params=params)
+    tracer = current_tracer()
+    if mapping is None:
+        # drop irrelevant columns filled with nans, 0s, or empty strings
+        prepared_dataframe = prepare_dataframe(dataframe)
+        # calculate similarity between every could of dataframe and every column of example_dataframe
+        if features is None:
+            with tracer.stage('similarity'):
+                features = find_features(prepared_dataframe, example_dataframe, params=params, clues=clues)
+        with tracer.stage('assignment'):
+            mapping = find_mapping(prepared_dataframe, example_dataframe, params=params, features=features,
+                print_similarities=print_similarities)
+    output_dataframe = apply_mapping(dataframe, example_dataframe, mapping)
+    # return after removing the duplicates
+    if drop_duplicates:
+        with tracer.stage('deduplication'):
+            if deduplicator is None:
+                deduplicator = RowDeduplicator()
+            dropped = deduplicator.dropped
+            output_dataframe = deduplicator.update(output_dataframe)
+            tracer.count('duplicates_dropped', deduplicator.dropped - dropped)
+    output_dataframe.attrs['mapping'] = mapping
+    return output_dataframe
+
+
+def find_mapping(dataframe: pd.DataFrame, example_dataframe: pd.DataFrame, features: dict, params={},
+    print_similarities=False, similarities=None) -> list:
+    """
+    Finds which columns of the dataframe are the most similar to each column of example_dataframe.
+
+    Args:
+        dataframe: The dataframe to search (see prepare_dataframe)
+        example_dataframe: An example of the data to search for
+        features: The result of find_features for these dataframes
+        similarities: The similarities of the pairs of columns for params, if already calculated
+            (see similarity.combine_similarity_features)
+
+    Returns:
+        List of the columns found, in the order they were found, as dictionaries with the 'example_column',
+        the 'column' found, its 'similarity', whether it is a 'date', the 'time_column' to add to it (or None),
+        and the 'tier' that found it ('clue', 'exact', 'lexical' or 'semantic')
+    """
+    tracer = current_tracer()
+    mapping = []
+    profiles, example_profiles = features['profiles'], features['example_profiles']
+    resolved = features.get('resolved', [])
+    # the pairs blocked are never matched
+    if similarities is None:
+        similarities = combine_similarity_features(features['columns'], params)
+    similarities = np.where(features['candidates'], similarities, -np.inf)
+    similarities = pd.DataFrame(similarities, index=dataframe.columns, columns=example_dataframe.columns, dtype=float)
+    # which columns have dates
+    dates = pd.Series([is_date_profile(profile, params) for _, profile in profiles.iterrows()], index=profiles.index, dtype=bool)
+    default_dates = pd.Series([is_date_profile(profile) for _, profile in profiles.iterrows()], index=profiles.index, dtype=bool)
     # print similarities
     if print_similarities:
         print(similarities)
+    # the columns matched by their names
+    for match in resolved:
+        mapping.append({'example_column': match['example_column'], 'column': match['column'],
+            'similarity': match['similarity'], 'date': bool(dates[match['column']]), 'time_column': None,
+            'tier': match['tier']})
+        logger.info('%s --> %s (%s)', match['column'], match['example_column'], match['tier'])
+        tracer.match(match['column'], match['example_column'], match['similarity'])
+        tracer.count(f'resolved_{match["tier"]}')
+    similarities = similarities.drop(index=[match['column'] for match in resolved],
+        columns=[match['example_column'] for match in resolved])
     # iterate through the similarities matrix to find the most similar match-ups,
     # and then remove them from the similarities matrix, so they are aren't reused.
     while min(similarities.shape) > 0:
@@ -126,40 +501,61 @@ def find_dataframe(dataframe: pd.DataFrame, example_dataframe: pd.DataFrame, par
         # if the similarity is too low, ignore the column
         if similarity < params.get('min_similarity_column', 0.25): break
         # find the column that is most similar to the example column
-        similar_col = dataframe.loc[:, col_name]
-        example_col = example_dataframe.loc[:, example_col_name]
-        output_dataframe[example_col_name] = similar_col
+        example_profile = example_profiles.loc[example_col_name]
+        match = {'example_column': example_col_name, 'column': col_name, 'similarity': float(similarity),
+            'date': bool(dates[col_name]), 'time_column': None, 'tier': 'semantic'}
+        mapping.append(match)
+        tracer.count('resolved_semantic')
         # drop the matched similarities
         similarities = similarities.drop(columns=example_col_name)
-        print(col_name, '-->', example_col_name)
-        # if this is a date, normalize it
-        if is_date(similar_col, params=params):
-            output_dataframe[example_col_name] = pd.to_datetime(similar_col)
+        logger.info('%s --> %s', col_name, example_col_name)
+        tracer.match(col_name, example_col_name, similarity)
         # if this is the last column with dates in it, then keep it
-        if not is_date(similar_col, params=params) or count_columns_with_dates(dataframe[similarities.index]) > 1:
+        if not dates[col_name] or default_dates[similarities.index].sum() > 1:
             similarities = similarities.drop(index=col_name)
         # if the datatype is a time (datetime, timestamp, datetime.time or timedelta)
-        if is_date(example_col, params=params) and is_time(example_col, params=params) and is_date(similar_col, params=params) and not is_time(similar_col, params=params):
-            # make sure example_col is a datetime
-            example_col = parse_datetime_column(example_col)
+        if is_date_profile(example_profile, params) and is_time_profile(example_profile, params) and \
+                dates[col_name] and not is_time_profile(profiles.loc[col_name], params) and \
+                example_col_name in features['times']:
             # look for missing time column
-            time_col_missing = find_column(dataframe[similarities.index], example_col.dt.time, params=params, rename=False)
-            if time_col_missing is not None:
-                # normalize time column found to be pd.timedelta
-                try:
-                    time_col_missing = time_col_missing.apply(time.isoformat).apply(pd.to_timedelta)
-                except TypeError:
-                    # occurs when time_col_missing is made of strings instead of time
-                    time_col_missing = time_col_missing.apply(pd.to_timedelta)
-                # add missing times to dates
-                output_dataframe[example_col_name] = output_dataframe[example_col_name] + time_col_missing
-                print(col_name, '+', time_col_missing.name, '-->', example_col_name)                    
+            time_similarities = pd.Series(combine_similarity_features(features['times'][example_col_name], params),
+                index=dataframe.columns, dtype=float)[similarities.index]
+            if len(time_similarities) > 0 and time_similarities.max() >= params.get('min_similarity_column', 0.25):
+                match['time_column'] = time_similarities.idxmax()
+                logger.info('%s + %s --> %s', col_name, match['time_column'], example_col_name)
+                tracer.match(match['time_column'], example_col_name, time_similarities.max())
                 # drop time column from the original dataframe
-                similarities = similarities.drop(index=time_col_missing.name)
+                similarities = similarities.drop(index=match['time_column'])
+    return mapping
+
+
+def apply_mapping(dataframe: pd.DataFrame, example_dataframe: pd.DataFrame, mapping: list) -> pd.DataFrame:
+    """
+    Builds the dataframe with the schema of example_dataframe from the columns found by find_mapping.
+
+    Args:
+        dataframe: The dataframe the columns were found in
+        example_dataframe: An example of the data searched for
+        mapping: The result of find_mapping
+
+    Returns:
+        The dataframe found, using the same schema as example_dataframe
+    """
+    # initialize the output_dataframe
+    output_dataframe = pd.DataFrame(columns=example_dataframe.columns)
+    for match in mapping:
+        similar_col = dataframe.loc[:, match['column']]
+        output_dataframe[match['example_column']] = similar_col
+        # if this is a date, normalize it to UTC
+        if match['date']:
+            output_dataframe[match['example_column']] = to_utc_datetime_column(similar_col)
+        if match['time_column'] is not None:
+            # add missing times to dates
+            output_dataframe[match['example_column']] = output_dataframe[match['example_column']] + \
+                to_timedelta_column(dataframe[match['time_column']])
     # replace columns
     output_dataframe.columns = example_dataframe.columns
-    # return after removing the duplicates
-    return output_dataframe.drop_duplicates() if drop_duplicates else output_dataframe
+    return output_dataframe
     
 
 
@@ -0,0 +1,77 @@
+# compiled formats: examples of formats profiled once, and reused by every transformation
+
+import numpy as np
+import pandas as pd
+from . import similarity
+
+
+# version of the files written by CompiledFormat.save
+COMPILED_FORMAT_VERSION = 3
+
+
+class CompiledFormat:
+    """
+    Everything the transformations need from the example of a format, precomputed:
+    the parsed example, its language, the profiles of its columns and of the times of its datetimes,
+    and the embeddings of their names. It can be passed to TelematicZapTransformer.transform
+    instead of the example dataframe (see find.compile_format).
+
+    Args:
+        example (pd.DataFrame): the example of the format, with its datetimes parsed
+        language (str): the language of the example columns
+        profiles (pd.DataFrame): the profiles of the example columns (see similarity.column_profiles)
+        time_profiles (pd.DataFrame): the profiles of the times of the example datetime columns
+        embeddings (dict): the embeddings of the names of the profiles
+    """
+    def __init__(self, example: pd.DataFrame, language: str, profiles: pd.DataFrame,
+            time_profiles: pd.DataFrame, embeddings={}):
+        self.example = example
+        self.language = language
+        self.profiles = profiles
+        self.time_profiles = time_profiles
+        self.embeddings = dict(embeddings)
+
+    @property
+    def columns(self) -> pd.Index:
+        return self.example.columns
+
+    def save(self, path_or_buffer) -> None:
+        """
+        Save the compiled format to a file.
+
+        Args:
+            path_or_buffer: path or binary file object to write to
+        """
+        pd.to_pickle({
+            'version': COMPILED_FORMAT_VERSION,
+            'encoder': similarity.MODEL_NAME,
+            'example': self.example,
+            'language': self.language,
+            'profiles': self.profiles,
+            'time_profiles': self.time_profiles,
+            'vocabulary': list(self.embeddings),
+            'embeddings': np.array(list(self.embeddings.values()), dtype=np.float32),
+        }, path_or_buffer)
+
+    @classmethod
+    def load(cls, path_or_buffer):
+        """
+        Load a format compiled with CompiledFormat.save, and add its embeddings to the encoder cache,
+        so that its strings are never encoded again.
+
+        Args:
+            path_or_buffer: path or binary file object to read from
+
+        Returns:
+            CompiledFormat: the compiled format
+        """
+        compiled = pd.read_pickle(path_or_buffer)
+        if compiled['version'] != COMPILED_FORMAT_VERSION:
+            raise ValueError(f'Unsupported compiled format version: {compiled["version"]}')
+        if compiled['encoder'] != similarity.MODEL_NAME:
+            raise ValueError(f'Format compiled with another encoder: {compiled["encoder"]}')
+        embeddings = dict(zip(compiled['vocabulary'], compiled['embeddings']))
+        for s, embedding in embeddings.items():
+            similarity.embeddings.setdefault(s, embedding)
+        return cls(compiled['example'], compiled['language'], compiled['profiles'],
+            compiled['time_profiles'], embeddings)
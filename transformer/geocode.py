@@ -0,0 +1,329 @@
+# functions for geocoding addresses and coordinates
+
+import os
+import re
+import shelve
+import numpy as np
+import pandas as pd
+import geopy
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from .trace import current_tracer
+
+
+# mean radius of the earth in meters
+EARTH_RADIUS = 6371008.8
+
+
+# minimal location object, with the same attributes as geopy.Location
+Location = namedtuple('Location', ['address', 'latitude', 'longitude'])
+
+
+class LocalGeocoder:
+    """
+    Stand-in for a geopy geolocator that answers from a dictionary of known addresses.
+    Useful for tests and benchmarks, where network round trips are not wanted.
+
+    Args:
+        locations (dict): maps addresses to (latitude, longitude) tuples
+    """
+    def __init__(self, locations={}):
+        self.locations = dict(locations)
+        self.calls = 0
+
+    def geocode(self, query: str):
+        self.calls += 1
+        # forward geocoding of a known address
+        if query in self.locations:
+            return Location(query, *self.locations[query])
+        # reverse geocoding of "latitude, longitude" to the nearest known address
+        match = re.fullmatch(r'\s*(-?[\d\.]+)\s*,\s*(-?[\d\.]+)\s*', str(query))
+        if match is None or len(self.locations) == 0:
+            return None
+        latitude, longitude = float(match.group(1)), float(match.group(2))
+        address = min(self.locations, key=lambda a:
+            (self.locations[a][0] - latitude)**2 + (self.locations[a][1] - longitude)**2)
+        return Location(address, *self.locations[address])
+
+
+class Geocoder:
+    """
+    Geocodes whole columns of addresses or coordinates with a single client.
+    Inputs are deduplicated, results are cached (persistently if a cache_path is given),
+    and only the cache misses are sent to the geolocator, with bounded concurrency.
+
+    Args:
+        geolocator: a geopy geolocator (default: geopy.ArcGIS())
+        cache_path (str): path of a shelve file used as persistent cache (default: in memory)
+        precision (int): number of decimals coordinates are rounded to when reverse geocoding
+        max_workers (int): maximum number of concurrent requests to the geolocator
+    """
+    def __init__(self, geolocator=None, cache_path=None, precision=4, max_workers=8):
+        self.geolocator = geopy.ArcGIS() if geolocator is None else geolocator
+        self.cache = shelve.open(cache_path) if cache_path else {}
+        self.precision = precision
+        self.max_workers = max_workers
+
+    def _geocode(self, queries: list) -> list:
+        # geocode the queries concurrently, keeping their order
+        if len(queries) <= 1 or self.max_workers <= 1:
+            return [self.geolocator.geocode(query) for query in queries]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(self.geolocator.geocode, queries))
+
+    def _lookup(self, keys: list, queries: list, parse) -> list:
+        # answer from the cache, and geocode only the missing keys
+        missing = [i for i, key in enumerate(keys) if key not in self.cache]
+        tracer = current_tracer()
+        tracer.count('geocoder_cache_hits', len(keys) - len(missing))
+        tracer.count('geocoder_calls', len(missing))
+        locations = self._geocode([queries[i] for i in missing])
+        for i, location in zip(missing, locations):
+            self.cache[keys[i]] = parse(location)
+        if missing and hasattr(self.cache, 'sync'):
+            self.cache.sync()
+        return [self.cache[key] for key in keys]
+
+    def locations(self, addresses: pd.Series) -> pd.DataFrame:
+        """
+        Find the coordinates of a column of addresses.
+
+        Args:
+            addresses (pd.Series): the addresses to geocode
+
+        Returns:
+            pd.DataFrame: latitude and longitude columns, with the same index as addresses
+        """
+        def parse(location):
+            try:
+                return (location.latitude, location.longitude)
+            except AttributeError:
+                return (np.nan, np.nan)
+        # geocode each distinct address only once
+        codes, uniques = pd.factorize(pd.Series(addresses).astype(object))
+        uniques = [str(address) for address in uniques]
+        found = self._lookup(['location:' + address for address in uniques], uniques, parse)
+        found = np.array(found + [(np.nan, np.nan)], dtype=float).reshape(-1, 2)
+        return pd.DataFrame(found[codes], columns=['latitude', 'longitude'], index=addresses.index)
+
+    def addresses(self, latitudes: pd.Series, longitudes: pd.Series) -> pd.Series:
+        """
+        Find the addresses of columns of coordinates.
+        Coordinates are rounded to self.precision decimals before geocoding.
+
+        Args:
+            latitudes (pd.Series): the latitudes to geocode
+            longitudes (pd.Series): the longitudes to geocode
+
+        Returns:
+            pd.Series: the addresses found, with the same index as latitudes
+        """
+        def parse(location):
+            try:
+                return location.address
+            except AttributeError:
+                return ''
+        # round the coordinates, and geocode each distinct pair only once
+        coordinates = pd.DataFrame({
+            'latitude': np.round(pd.to_numeric(latitudes, errors='coerce').to_numpy(dtype=float), self.precision),
+            'longitude': np.round(pd.to_numeric(longitudes, errors='coerce').to_numpy(dtype=float), self.precision),
+        })
+        valid = coordinates.notnull().all(axis=1).to_numpy()
+        codes, uniques = pd.factorize(pd.MultiIndex.from_frame(coordinates[valid]))
+        queries = [f'{latitude:.{self.precision}f}, {longitude:.{self.precision}f}' for latitude, longitude in uniques]
+        found = np.array(self._lookup(['address:' + query for query in queries], queries, parse) + [''], dtype=object)
+        addresses = np.full(len(coordinates), '', dtype=object)
+        addresses[valid] = found[codes]
+        return pd.Series(addresses, index=latitudes.index, name='address')
+
+    def close(self):
+        if hasattr(self.cache, 'close'):
+            self.cache.close()
+
+
+def to_unit_vectors(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """
+    Convert coordinates in degrees to 3D points on the unit sphere,
+    so that euclidean nearest neighbours are also the nearest on the globe.
+    """
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+    return np.column_stack([
+        np.cos(latitudes) * np.cos(longitudes),
+        np.cos(latitudes) * np.sin(longitudes),
+        np.sin(latitudes),
+    ])
+
+
+def grid_cells(latitudes: np.ndarray, longitudes: np.ndarray, cell_degrees: float) -> tuple:
+    """
+    Return the row and column of the cells of a grid of cell_degrees degrees containing coordinates.
+    """
+    rows = np.floor((np.clip(latitudes, -90, 90) + 90) / cell_degrees).astype(np.int64)
+    columns = np.floor((np.mod(longitudes + 180, 360)) / cell_degrees).astype(np.int64)
+    return rows, columns
+
+
+def compile_gazetteer(input_file: str, output_dir: str, latitude_column='latitude',
+        longitude_column='longitude', address_column='address', cell_degrees=0.002, **kwargs):
+    """
+    Compile a gazetteer table into arrays that OfflineReverseGeocoder memory-maps.
+    The entries are sorted by the cell of a grid of coordinates that contains them, and the sorted cells
+    are the spatial index, so that it is shared by every process instead of rebuilt in each of them.
+    The distinct addresses are also saved sorted, with their first entry, to look them up by name.
+
+    Args:
+        input_file (str): path to a csv file with latitude, longitude and address columns
+        output_dir (str): directory where the compiled arrays are saved
+        cell_degrees (float): size of the cells of the grid in degrees (default 0.002, about 220 meters)
+        **kwargs: any other arguments to pass to pd.read_csv
+    """
+    gazetteer = pd.read_csv(input_file, usecols=[latitude_column, longitude_column, address_column], **kwargs)
+    gazetteer = gazetteer.dropna()
+    latitudes = gazetteer[latitude_column].to_numpy(dtype=float)
+    longitudes = gazetteer[longitude_column].to_numpy(dtype=float)
+    rows, columns = grid_cells(latitudes, longitudes, cell_degrees)
+    cells = rows * int(np.ceil(360 / cell_degrees)) + columns
+    order = np.argsort(cells, kind='stable')
+    os.makedirs(output_dir, exist_ok=True)
+    # fixed-width arrays, so all the files can be loaded with mmap_mode
+    addresses = gazetteer[address_column].astype(str).to_numpy(dtype=str)[order]
+    np.save(os.path.join(output_dir, 'points.npy'), to_unit_vectors(latitudes[order], longitudes[order]))
+    np.save(os.path.join(output_dir, 'addresses.npy'), addresses)
+    # the same address can have several entries, the first one is its location
+    unique_addresses, first_entries = np.unique(addresses, return_index=True)
+    np.save(os.path.join(output_dir, 'unique_addresses.npy'), unique_addresses)
+    np.save(os.path.join(output_dir, 'address_entries.npy'), first_entries)
+    np.save(os.path.join(output_dir, 'cells.npy'), cells[order])
+    np.save(os.path.join(output_dir, 'cell_degrees.npy'), np.array(cell_degrees))
+
+
+class OfflineReverseGeocoder:
+    """
+    Geocodes columns of coordinates offline, with a nearest neighbour search over a local gazetteer
+    compiled by compile_gazetteer. Coordinates without any gazetteer entry within max_distance
+    are sent to the fallback geocoder, if there is one.
+
+    Args:
+        path (str): directory of the compiled gazetteer
+        max_distance (float): maximum distance in meters to the nearest gazetteer entry
+        fallback (Geocoder): geocoder used for misses (default: None, misses are left empty)
+        batch_size (int): number of coordinates searched at once, to bound the memory used
+    """
+    def __init__(self, path: str, max_distance=250, fallback=None, batch_size=4096):
+        if not all(os.path.exists(os.path.join(path, name)) for name in ['cells.npy', 'unique_addresses.npy']):
+            raise ValueError(f'Gazetteer compiled without its index, compile it again: {path}')
+        self.points = np.load(os.path.join(path, 'points.npy'), mmap_mode='r')
+        self.names = np.load(os.path.join(path, 'addresses.npy'), mmap_mode='r')
+        self.cells = np.load(os.path.join(path, 'cells.npy'), mmap_mode='r')
+        self.unique_names = np.load(os.path.join(path, 'unique_addresses.npy'), mmap_mode='r')
+        self.name_entries = np.load(os.path.join(path, 'address_entries.npy'), mmap_mode='r')
+        self.cell_degrees = float(np.load(os.path.join(path, 'cell_degrees.npy')))
+        self.max_distance = max_distance
+        self.fallback = fallback
+        self.batch_size = batch_size
+
+    def locations(self, addresses: pd.Series) -> pd.DataFrame:
+        """
+        Find the coordinates of a column of addresses with an exact match in the gazetteer.
+        Addresses not in the gazetteer are sent to the fallback geocoder.
+        """
+        # binary search of each distinct address among the sorted addresses of the gazetteer
+        codes, uniques = pd.factorize(pd.Series(addresses).astype(str))
+        entries = np.full(len(uniques), -1, dtype=np.int64)
+        if len(self.unique_names):
+            queries = np.asarray(uniques, dtype=str)
+            positions = np.minimum(np.searchsorted(self.unique_names, queries), len(self.unique_names) - 1)
+            matched = np.asarray(self.unique_names[positions]) == queries
+            entries[matched] = self.name_entries[positions[matched]]
+        indexer = np.append(entries, -1)[codes]
+        found = indexer >= 0
+        points = np.asarray(self.points[indexer[found]])
+        locations = pd.DataFrame(np.nan, columns=['latitude', 'longitude'], index=addresses.index)
+        locations.loc[found, 'latitude'] = np.degrees(np.arcsin(np.clip(points[:, 2], -1, 1)))
+        locations.loc[found, 'longitude'] = np.degrees(np.arctan2(points[:, 1], points[:, 0]))
+        if self.fallback is not None and not found.all():
+            locations.loc[~found] = self.fallback.locations(addresses[~found]).to_numpy()
+        return locations
+
+    def nearest(self, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        """
+        Find the nearest gazetteer entries within max_distance of coordinates, searching only
+        the cells of the grid around them.
+
+        Returns:
+            np.ndarray: the indices of the entries found, -1 where there is none
+        """
+        n_columns = int(np.ceil(360 / self.cell_degrees))
+        n_rows = int(np.ceil(180 / self.cell_degrees)) + 1
+        max_chord = 2 * np.sin(self.max_distance / (2 * EARTH_RADIUS))
+        # cells to search around each coordinate, more of them in longitude near the poles,
+        # where the whole rows of the grid are searched instead
+        row_radius = int(np.ceil(np.degrees(self.max_distance / EARTH_RADIUS) / self.cell_degrees))
+        cosines = np.cos(np.radians(np.minimum(np.abs(latitudes) + row_radius * self.cell_degrees, 90)))
+        column_radii = np.ceil(row_radius / np.maximum(cosines, 1e-9))
+        whole_rows = column_radii > 16
+        column_radii = np.where(whole_rows, 0, column_radii).astype(np.int64)
+        rows, columns = grid_cells(latitudes, longitudes, self.cell_degrees)
+        vectors = to_unit_vectors(latitudes, longitudes)
+        nearest = np.full(len(latitudes), -1, dtype=np.int64)
+        distances = np.full(len(latitudes), np.inf)
+        def search(queries, first_cells, last_cells):
+            # compare the coordinates of queries with every entry of the cells first_cells..last_cells
+            starts = np.searchsorted(self.cells, first_cells, side='left')
+            counts = np.searchsorted(self.cells, last_cells, side='right') - starts
+            if not counts.any():
+                return
+            entries = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            queries = np.repeat(queries, counts)
+            chords = np.linalg.norm(np.asarray(self.points[entries]) - vectors[queries], axis=1)
+            closer = chords < distances[queries]
+            # keep the closest entry for each coordinate
+            order = np.lexsort((chords[closer], queries[closer]))
+            queries, entries, chords = queries[closer][order], entries[closer][order], chords[closer][order]
+            first = np.r_[True, queries[1:] != queries[:-1]] if len(queries) else np.zeros(0, dtype=bool)
+            distances[queries[first]] = chords[first]
+            nearest[queries[first]] = entries[first]
+        for row_offset in range(-row_radius, row_radius + 1):
+            neighbour_rows = rows + row_offset
+            in_grid = (neighbour_rows >= 0) & (neighbour_rows < n_rows)
+            queries = np.flatnonzero(in_grid & whole_rows)
+            search(queries, neighbour_rows[queries] * n_columns, neighbour_rows[queries] * n_columns + n_columns - 1)
+            for column_offset in range(-column_radii.max(initial=0), column_radii.max(initial=0) + 1):
+                queries = np.flatnonzero(in_grid & ~whole_rows & (column_radii >= abs(column_offset)))
+                cells = neighbour_rows[queries] * n_columns + np.mod(columns[queries] + column_offset, n_columns)
+                search(queries, cells, cells)
+        nearest[distances > max_chord] = -1
+        return nearest
+
+    def addresses(self, latitudes: pd.Series, longitudes: pd.Series) -> pd.Series:
+        """
+        Find the nearest gazetteer addresses of columns of coordinates, as vectorized queries.
+        """
+        latitudes_array = pd.to_numeric(latitudes, errors='coerce').to_numpy(dtype=float)
+        longitudes_array = pd.to_numeric(longitudes, errors='coerce').to_numpy(dtype=float)
+        valid = ~(np.isnan(latitudes_array) | np.isnan(longitudes_array))
+        nearest = np.full(len(valid), -1, dtype=np.int64)
+        valid_indices = np.flatnonzero(valid)
+        for start in range(0, len(valid_indices), self.batch_size):
+            batch = valid_indices[start:start + self.batch_size]
+            nearest[batch] = self.nearest(latitudes_array[batch], longitudes_array[batch])
+        hits = nearest >= 0
+        addresses = np.full(len(valid), '', dtype=object)
+        addresses[hits] = np.asarray(self.names[nearest[hits]], dtype=object)
+        # send the misses to the fallback geocoder
+        misses = valid & ~hits
+        if self.fallback is not None and misses.any():
+            addresses[misses] = self.fallback.addresses(latitudes[misses], longitudes[misses]).to_numpy()
+        return pd.Series(addresses, index=latitudes.index, name='address')
+
+
+# shared geocoder, so the same client and cache are reused across calls
+__default_geocoder = None
+def default_geocoder() -> Geocoder:
+    """
+    Return the geocoder shared by the find functions, creating it on first use.
+    """
+    global __default_geocoder
+    if __default_geocoder is None:
+        __default_geocoder = Geocoder()
+    return __default_geocoder
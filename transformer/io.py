@@ -8,6 +8,16 @@ from pandas.api.types import is_datetime64_any_dtype, is_timedelta64_dtype
 
 
 
+# explicit formats tried before parsing each datetime with datefinder, in order of priority
+DATETIME_FORMATS = [
+    '%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S%z', '%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d',
+    '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %H:%M', '%m/%d/%Y', '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y',
+    '%d.%m.%Y %H:%M:%S', '%d.%m.%Y %H:%M', '%d.%m.%Y', '%Y.%m.%d. %H:%M:%S', '%Y.%m.%d.', '%Y.%m.%d',
+]
+TIME_FORMATS = ['%H:%M:%S.%f', '%H:%M:%S', '%H:%M']
+
+
 __base_date = pd.to_datetime('1950-01-01')
 def parse_datetime(date_str: str) -> pd.Timestamp:
     """
@@ -30,9 +40,27 @@ def parse_datetime(date_str: str) -> pd.Timestamp:
 
 
 
+def infer_datetime_format(sample: pd.Series):
+    """
+    Find the explicit format of a sample of datetime strings, among DATETIME_FORMATS and TIME_FORMATS.
+
+    Args:
+        sample (pd.Series): strings of datetimes or times
+
+    Returns:
+        str: the first format that parses the whole sample, or None
+    """
+    for datetime_format in DATETIME_FORMATS + TIME_FORMATS:
+        if pd.to_datetime(sample, format=datetime_format, errors='coerce').notnull().all():
+            return datetime_format
+    return None
+
+
 def parse_datetime_column(column: pd.Series) -> pd.Series:
     """
     Parse a column of strings to a column of pd.Timestamp or datetime.time.
+    The whole column is parsed at once if its format can be inferred from a sample,
+    otherwise each string is parsed with datefinder.
 
     Args:
         column (pd.Series): a column of strings to parse
@@ -43,6 +71,17 @@ def parse_datetime_column(column: pd.Series) -> pd.Series:
     # if column is all nans, return column
     if column.isnull().all():
         return column
+    # only columns made of strings can be parsed
+    if column.dtype != 'object' or not column.map(type).eq(str).all():
+        return column
+    # parse the column with an explicit format
+    sample = column.sample(n=min(len(column), 100), random_state=0)
+    if sample.str.contains(r'\d').all():
+        datetime_format = infer_datetime_format(sample)
+        if datetime_format is not None:
+            parsed = pd.to_datetime(column, format=datetime_format, errors='coerce')
+            if parsed.notnull().all():
+                return parsed.dt.time if datetime_format in TIME_FORMATS else parsed
     # try to parse the column
     try:
         return column.apply(parse_datetime)
@@ -52,12 +91,13 @@ def parse_datetime_column(column: pd.Series) -> pd.Series:
 
 
 
-def read_dataframe(filepath_or_buffer: str, **kwargs) -> pd.DataFrame:
+def read_dataframe(filepath_or_buffer: str, parse_datetimes=True, **kwargs) -> pd.DataFrame:
     """
     Finds the appropriate pandas read function for the filetype.
 
     Args:
         filepath_or_buffer (str): path to the file to read
+        parse_datetimes (bool): if true (default), fix wrong date and time formats in every column
         **kwargs: any other arguments to pass to the pandas read function
     
     Returns:
@@ -80,19 +120,95 @@ def read_dataframe(filepath_or_buffer: str, **kwargs) -> pd.DataFrame:
         raise ValueError('File format not supported')
     
     # fix wrong date and time formats
-    df = df.apply(parse_datetime_column, axis=0)
+    if parse_datetimes:
+        df = df.apply(parse_datetime_column, axis=0)
     return df
 
 
+def to_utc_datetime_column(column: pd.Series) -> pd.Series:
+    """
+    Convert a column of datetimes to naive datetimes in UTC, assuming the naive datetimes are in UTC.
+    They are written with their time zone by save_dataframe.
+
+    Args:
+        column (pd.Series): a column of datetimes, or strings of datetimes
+
+    Returns:
+        pd.Series: a column of datetime64[ns], in UTC
+    """
+    if not is_datetime64_any_dtype(column):
+        strings = column.dropna()
+        datetime_format = None
+        if len(strings) and strings.map(type).eq(str).all():
+            datetime_format = infer_datetime_format(strings.sample(n=min(len(strings), 100), random_state=0))
+        column = pd.to_datetime(column, format=datetime_format, errors='coerce', utc=True)
+    if column.dt.tz is None:
+        return column
+    return column.dt.tz_convert('UTC').dt.tz_localize(None)
+
+
+def to_timedelta_column(column: pd.Series) -> pd.Series:
+    """
+    Convert a column of times (datetime.time, strings, or the times of datetimes) to a column of timedeltas.
+
+    Args:
+        column (pd.Series): a column of times
+
+    Returns:
+        pd.Series: a column of timedelta64[ns], NaT where there is no time
+    """
+    if is_timedelta64_dtype(column):
+        return column
+    if is_datetime64_any_dtype(column):
+        return column - column.dt.normalize()
+    # convert each distinct time once, as the time since midnight of the times parsed with one of TIME_FORMATS
+    # (datetime.time are formatted as HH:MM:SS[.ffffff]), or else as durations
+    codes, uniques = pd.factorize(column)
+    strings = pd.Index(uniques).astype(str)
+    deltas = pd.to_timedelta(strings, errors='coerce')
+    for time_format in TIME_FORMATS:
+        parsed = pd.to_datetime(strings, format=time_format, errors='coerce')
+        if parsed.notnull().all():
+            deltas = parsed - parsed.normalize()
+            break
+    deltas = deltas.to_numpy(dtype='timedelta64[ns]')
+    # the missing times (code -1) take the last value, NaT
+    deltas = np.append(deltas, np.timedelta64('NaT', 'ns'))
+    return pd.Series(deltas[codes], index=column.index, name=column.name)
+
+
+def format_datetime_columns(dataframe: pd.DataFrame) -> pd.DataFrame:
+    """
+    Format the datetime columns as ISO 8601 strings in UTC, e.g. 2020-05-27T17:30:34.529Z.
+
+    Args:
+        dataframe (pd.DataFrame): the dataframe to format
+
+    Returns:
+        pd.DataFrame: a copy of the dataframe with the datetime columns formatted
+    """
+    dataframe = dataframe.copy()
+    for column_name in dataframe.columns[dataframe.dtypes.map(is_datetime64_any_dtype).to_numpy(dtype=bool)]:
+        column = dataframe[column_name]
+        if column.dt.tz is not None:
+            column = column.dt.tz_convert('UTC').dt.tz_localize(None)
+        values = column.to_numpy(dtype='datetime64[ns]')
+        formatted = np.char.add(np.datetime_as_string(values, unit='ms'), 'Z').astype(object)
+        formatted[np.isnat(values)] = np.nan
+        dataframe[column_name] = formatted
+    return dataframe
+
+
 def save_dataframe(dataframe: pd.DataFrame, filepath: str, **kwargs):
     """
-    Save a dataframe to a file.
+    Save a dataframe to a file, with its datetimes as ISO 8601 strings in UTC.
 
     Args:
         dataframe (pandas.DataFrame): dataframe to save
         filepath (str): path to the output file
         **kwargs: any other arguments to pass to the pandas save function
     """
+    dataframe = format_datetime_columns(dataframe)
     # create the folders if they don't exist
     os.makedirs(os.path.dirname(filepath), exist_ok=True)
     # saves the dataframe to a file based on the filetype
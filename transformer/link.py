@@ -0,0 +1,71 @@
+# functions for linking transformed trips to transformed vehicles
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_float_dtype
+
+
+# vehicles columns that trips may refer to, in order of priority
+VEHICLE_KEYS = ('external_id', 'vin', 'license_plate_number')
+
+
+def normalize_keys(values: pd.Series) -> pd.Series:
+    """
+    Normalize vehicle references, so that "ab-123", "AB 123" and "AB123" are the same key,
+    and so are the numbers 2.0 and "2".
+
+    Args:
+        values (pd.Series): the references to normalize
+
+    Returns:
+        pd.Series: uppercase alphanumeric keys, NaN for empty references
+    """
+    values = pd.Series(values)
+    # integer ids read as floats
+    if is_float_dtype(values) and (values.dropna() % 1 == 0).all():
+        values = values.astype('Int64')
+    keys = values.astype(str).str.upper().str.replace(r'[^0-9A-Z]', '', regex=True)
+    return keys.where(values.notnull() & (keys != '') & (keys != 'NAN') & (keys != 'NA'))
+
+
+def link_trips_to_vehicles(trips: pd.DataFrame, vehicles: pd.DataFrame, reference_column='vehicle_external_id',
+        id_column='external_id', keys=VEHICLE_KEYS, keep_unresolved=True) -> pd.DataFrame:
+    """
+    Replace the vehicle references of the trips (ids, VINs or license plates) with the vehicles ids.
+    The references are resolved with a single join against a hash index of the vehicles keys.
+
+    Args:
+        trips (pd.DataFrame): the transformed trips
+        vehicles (pd.DataFrame): the transformed vehicles
+        reference_column (str): column of the trips referring to the vehicles
+        id_column (str): column with the vehicles ids
+        keys (tuple): columns of the vehicles the references are looked up in, in order of priority
+        keep_unresolved (bool): if true (default), keep the references not found, otherwise set them to NaN
+
+    Returns:
+        pd.DataFrame: the trips, with references to the vehicles ids
+    """
+    # build the index of keys -> vehicle ids, ignoring keys shared by several vehicles
+    index_keys, index_ids = [], []
+    for key in keys:
+        if key not in vehicles.columns:
+            continue
+        normalized = normalize_keys(vehicles[key])
+        unique = normalized.notnull() & ~normalized.duplicated(keep=False)
+        index_keys.append(normalized[unique].to_numpy())
+        index_ids.append(vehicles[id_column][unique].to_numpy())
+    linked = trips.copy()
+    if not index_keys:
+        return linked
+    index = pd.Series(np.concatenate(index_ids), index=np.concatenate(index_keys))
+    # keys of higher priority win
+    index = index[~index.index.duplicated(keep='first')]
+    # resolve every reference at once
+    positions = index.index.get_indexer(normalize_keys(trips[reference_column]))
+    resolved = positions >= 0
+    references = linked[reference_column].to_numpy(dtype=object, copy=True)
+    if not keep_unresolved:
+        references[:] = np.nan
+    references[resolved] = index.to_numpy()[positions[resolved]]
+    linked[reference_column] = references
+    return linked
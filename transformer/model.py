@@ -4,13 +4,58 @@ from itertools import dropwhile
 import pandas as pd
 from .io import read_dataframe, save_dataframe
 from .translate import detect_language, translate_dataframe
-from .find import find_dataframe
+from .find import find_dataframe, find_features, find_features_many, prepare_dataframe, compile_format, \
+    filter_columns, match_clues, find_mapping, apply_mapping, block_features
+from .formats import CompiledFormat
+from .derive import derive_dataframe
+from .segment import segment_trips
+from .link import link_trips_to_vehicles
+from .rows import RowDeduplicator
+from .trace import tracing, current_tracer
+from . import similarity
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import optuna
 import traceback
+import multiprocessing
+import json
+import logging
+import os
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+# version of the files written by TelematicZapTransformer.save
+# 2: the numeric similarity weights are *_distribution and *_range instead of *_std and *_mean
+ARTIFACT_VERSION = 2
+
+# the transformer, datasets and parameters of transform_many, inherited by its worker processes
+_batch = None
+
+def _init_batch_worker(batch):
+    global _batch
+    _batch = batch
+
+def _transform_batch_item(i: int) -> pd.DataFrame:
+    transformer, datasets, features_list, params = _batch
+    dataframe, example_dataframe = datasets[i]
+    return transformer.transform(dataframe, example_dataframe, translate=False, params=params, features=features_list[i])
+
+def to_naive_utc(column: pd.Series) -> pd.Series:
+    # the datetimes of a column with a time zone, converted to UTC without it
+    if isinstance(column.dtype, pd.DatetimeTZDtype):
+        return column.dt.tz_convert('UTC').dt.tz_localize(None)
+    return column
 
 class TelematicZapTransformer:
-    def __init__(self, drop_duplicates=True):
+    def __init__(self, drop_duplicates=True, derive=True, geocoder=None, tracer=None):
         self.drop_duplicates=drop_duplicates
+        self.derive = derive
+        self.geocoder = geocoder
+        # records the stages of the transformations (see trace.Tracer), disabled if None
+        self.tracer = tracer
         self.params = {
             'min_similarity_column': 0.25, # find_column
             'min_similarity_id': 0.5, # is_column_text
@@ -35,37 +80,244 @@ class TelematicZapTransformer:
             'weight_string_similarity_word_count': 0.1,
             'weight_numeric_similarity': 0.8,
             'weight_numeric_similarity_name': 0.7, 
-            'weight_numeric_similarity_std': 0.2, 
-            'weight_numeric_similarity_mean': 0.1,
-            'weight_diftypes_similarity': 0.5
+            'weight_numeric_similarity_distribution': 0.2, 
+            'weight_numeric_similarity_range': 0.1,
+            'weight_diftypes_similarity': 0.5,
+            'blocking_top_k': 10, # candidate_pairs
+            'min_similarity_lexical': 0.6, # resolve_columns
+            'margin_similarity_lexical': 0.2,
         }
 
+    def save(self, path: str, formats_examples=[]) -> None:
+        """
+        Save the fitted transformer as a directory, with its parameters and the embeddings
+        of the format columns, so that new workers can load it ready to transform.
+
+        Args:
+            path (str): directory to save the transformer to
+            formats_examples (list): examples of the formats whose embeddings are precomputed
+        """
+        # encode the anchors and the formats columns
+        for format_df in formats_examples:
+            similarity.column_profiles(format_df)
+        vocabulary = list(similarity.embeddings)
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'embeddings.npy'),
+            np.array([similarity.embeddings[s] for s in vocabulary], dtype=np.float32))
+        with open(os.path.join(path, 'transformer.json'), 'w') as f:
+            json.dump({
+                'version': ARTIFACT_VERSION,
+                'encoder': similarity.MODEL_NAME,
+                'params': self.params,
+                'vocabulary': vocabulary,
+            }, f)
+
+    @classmethod
+    def load(cls, path: str, **kwargs):
+        """
+        Load a transformer saved with TelematicZapTransformer.save.
+        The embeddings are memory-mapped, so loading takes milliseconds.
+
+        Args:
+            path (str): directory the transformer was saved to
+            **kwargs: any other arguments to pass to TelematicZapTransformer
+
+        Returns:
+            TelematicZapTransformer: the fitted transformer
+        """
+        with open(os.path.join(path, 'transformer.json')) as f:
+            artifact = json.load(f)
+        if artifact['version'] != ARTIFACT_VERSION:
+            raise ValueError(f'Unsupported transformer version: {artifact["version"]}')
+        if artifact['encoder'] != similarity.MODEL_NAME:
+            raise ValueError(f'Transformer saved with another encoder: {artifact["encoder"]}')
+        transformer = cls(**kwargs)
+        # the parameters added since it was saved keep their defaults
+        transformer.params = {**transformer.params, **artifact['params']}
+        # seed the embeddings cache, so these strings are never encoded again
+        embeddings = np.load(os.path.join(path, 'embeddings.npy'), mmap_mode='r')
+        for s, embedding in zip(artifact['vocabulary'], embeddings):
+            similarity.embeddings.setdefault(s, embedding)
+        return transformer
+
+    def compile_format(self, example_dataframe: pd.DataFrame) -> CompiledFormat:
+        """
+        Compile the example of a format, so that it is parsed, profiled and encoded only once.
+        The compiled format can be passed to transform instead of the example.
+
+        Args:
+            example_dataframe (pd.DataFrame): a dataframe with the format we want to have
+
+        Returns:
+            CompiledFormat: the compiled format
+        """
+        return compile_format(example_dataframe, language=detect_language(example_dataframe))
+
     def translate(self, dataframe: pd.DataFrame, example_dataframe=None, target_language='en'):
         # detect target language using column names
-        if example_dataframe is not None:
+        if isinstance(example_dataframe, CompiledFormat):
+            target_language = example_dataframe.language
+        elif example_dataframe is not None:
             target_language = detect_language(example_dataframe)
         # return translated dataframe
         return translate_dataframe(dataframe, lang_to=target_language)
             
-    def transform(self, dataframe: pd.DataFrame, example_dataframe=None, translate=True, params={}) -> pd.DataFrame:
+    def transform(self, dataframe: pd.DataFrame, example_dataframe=None, translate=True, params={}, features=None,
+            mapping=None, deduplicator=None, clues={}) -> pd.DataFrame:
         """
         Translate and transform a dataframe given an example for the new schema.    
         
         Args:
             dataframe (pd.DataFrame): the dataframe to transform to a new format
-            example_dataframe (pd.DataFrame): a dataframe with the format we want to have
+            example_dataframe (pd.DataFrame): a dataframe with the format we want to have, or its CompiledFormat
+            features (dict): the result of find_features, if already calculated (requires translate=False)
+            mapping (list): the mapping of a previous transform of data with the same columns, to reuse it
+                instead of matching the columns again
+            deduplicator (RowDeduplicator): the deduplicator of the previous chunks, to drop the rows they had
+            clues (dict): the columns to leave out of the matching ('ignore_columns' and 'use_columns'),
+                and the clues of the example columns ('columns', see find.match_clues)
         
         Returns:
-            Dataframe translated and transformed, according to example_dataframe.
+            Dataframe translated and transformed, according to example_dataframe,
+            with the mapping of its columns in attrs['mapping'].
         """
         if not params:
             params = self.params
-        if translate:
-            dataframe = self.translate(dataframe, example_dataframe)
-        transformed_dataframe = find_dataframe(dataframe, example_dataframe, drop_duplicates=self.drop_duplicates, params=params)
-        transformed_dataframe.columns = example_dataframe.columns
+        with tracing(self.tracer or current_tracer()) as tracer:
+            # the clues refer to the columns before their translation
+            column_clues = []
+            if clues:
+                dataframe = filter_columns(dataframe, clues)
+                if mapping is None:
+                    column_clues = match_clues(dataframe, example_dataframe.columns, clues)
+            if translate:
+                with tracer.stage('translation'):
+                    translated_dataframe = self.translate(dataframe, example_dataframe)
+                # the translation renames the columns, but keeps their order
+                renamed = dict(zip(dataframe.columns, translated_dataframe.columns))
+                column_clues = [{**clue, 'column': renamed[clue['column']]} for clue in column_clues]
+                dataframe = translated_dataframe
+            # only the input is profiled against a compiled format
+            if isinstance(example_dataframe, CompiledFormat):
+                if features is None and mapping is None:
+                    with tracer.stage('similarity'):
+                        features = find_features(prepare_dataframe(dataframe), example_dataframe, params=params,
+                            clues=column_clues)
+                example_dataframe = example_dataframe.example
+            transformed_dataframe = find_dataframe(dataframe, example_dataframe, drop_duplicates=self.drop_duplicates,
+                params=params, features=features, mapping=mapping, deduplicator=deduplicator, clues=column_clues)
+            mapping = transformed_dataframe.attrs['mapping']
+            transformed_dataframe.columns = example_dataframe.columns
+            # fill the fields missing in the input with values derived from the matched columns
+            if self.derive:
+                with tracer.stage('derive'):
+                    transformed_dataframe = derive_dataframe(transformed_dataframe, geocoder=self.geocoder)
+        transformed_dataframe.attrs['mapping'] = mapping
         return transformed_dataframe
 
+    def transform_many(self, datasets: list, translate=True, params={}, n_jobs=1) -> list:
+        """
+        Translate and transform several dataframes, each given an example for its new schema.
+        The strings of all the datasets are encoded together in a single batch,
+        so this is much faster than calling transform on each of them.
+
+        Args:
+            datasets (list): list of (dataframe, example_dataframe) tuples
+            translate (bool): if true (default), translate the dataframes first
+            n_jobs (int): number of worker processes matching the datasets (-1 for one per core)
+
+        Returns:
+            List of the dataframes transformed, in the order of datasets.
+        """
+        if not params:
+            params = self.params
+        with tracing(self.tracer or current_tracer()) as tracer:
+            if translate:
+                with tracer.stage('translation'):
+                    datasets = [
+                        (self.translate(dataframe, example_dataframe), example_dataframe)
+                        for dataframe, example_dataframe in datasets
+                    ]
+            datasets = [(prepare_dataframe(dataframe), example_dataframe) for dataframe, example_dataframe in datasets]
+            with tracer.stage('similarity'):
+                features_list = find_features_many(datasets, params=params)
+            n_jobs = os.cpu_count() if n_jobs == -1 else min(n_jobs, len(datasets))
+            if n_jobs <= 1:
+                return [
+                    self.transform(dataframe, example_dataframe, translate=False, params=params, features=features)
+                    for (dataframe, example_dataframe), features in zip(datasets, features_list)
+                ]
+            # forked workers inherit the datasets, features and embeddings already in memory,
+            # only the transformed dataframes are sent back (the tracer does not record their stages)
+            with ProcessPoolExecutor(n_jobs, mp_context=multiprocessing.get_context('fork'),
+                    initializer=_init_batch_worker, initargs=((self, datasets, features_list, params),)) as executor:
+                return list(executor.map(_transform_batch_item, range(len(datasets))))
+
+    def transform_chunked(self, chunks, example_dataframe, translate=True, params={}, clues={}):
+        """
+        Translate and transform a dataframe read in chunks, e.g. pd.read_csv(..., chunksize=n).
+        The columns are matched on the first chunk, and the rows duplicated across chunks are dropped.
+
+        Args:
+            chunks: iterable of dataframes with the same columns
+            example_dataframe (pd.DataFrame): a dataframe with the format we want to have, or its CompiledFormat
+            clues (dict): the clues of the columns (see transform)
+
+        Yields:
+            pd.DataFrame: each chunk transformed, according to example_dataframe
+        """
+        mapping = None
+        deduplicator = RowDeduplicator()
+        for chunk in chunks:
+            transformed_chunk = self.transform(chunk, example_dataframe, translate=translate, params=params,
+                mapping=mapping, deduplicator=deduplicator, clues=clues)
+            mapping = transformed_chunk.attrs['mapping']
+            yield transformed_chunk
+
+    def transform_linked(self, dataframe: pd.DataFrame, vehicles_example_dataframe: pd.DataFrame,
+            trips_example_dataframe: pd.DataFrame, translate=True, params={}) -> tuple:
+        """
+        Transform a dataframe into both the vehicles and the trips formats,
+        with the trips referring to the vehicles by their ids.
+
+        Args:
+            dataframe (pd.DataFrame): the dataframe to transform
+            vehicles_example_dataframe (pd.DataFrame): a dataframe with the vehicles format
+            trips_example_dataframe (pd.DataFrame): a dataframe with the trips format
+
+        Returns:
+            Tuple of the vehicles and trips dataframes.
+        """
+        if translate:
+            dataframe = self.translate(dataframe, vehicles_example_dataframe)
+        vehicles = self.transform(dataframe, vehicles_example_dataframe, translate=False, params=params)
+        trips = self.transform(dataframe, trips_example_dataframe, translate=False, params=params)
+        return vehicles, link_trips_to_vehicles(trips, vehicles)
+
+    def transform_points(self, dataframe: pd.DataFrame, example_dataframe: pd.DataFrame,
+            points_example_dataframe: pd.DataFrame, translate=True, params={}) -> pd.DataFrame:
+        """
+        Transform a stream of position points into trips, given an example for the trips schema.
+
+        Args:
+            dataframe (pd.DataFrame): the points to transform
+            example_dataframe (pd.DataFrame): a dataframe with the trips format we want to have
+            points_example_dataframe (pd.DataFrame): an example of points, with vehicle_external_id,
+                timestamp, latitude and longitude columns
+
+        Returns:
+            Dataframe of the trips found in the points, according to example_dataframe.
+        """
+        if not params:
+            params = self.params
+        # match the points columns, and split them into trips
+        points = self.transform(dataframe, points_example_dataframe, translate=translate, params=params)
+        trips = segment_trips(points, params=params)
+        trips = trips.reindex(columns=example_dataframe.columns)
+        if self.derive:
+            trips = derive_dataframe(trips, geocoder=self.geocoder)
+        return trips
+
     def transform_from_file(self, input_file: str, output_file: str, output_example_file: str, 
                 read_kwargs={}, write_kwargs={}, example_kwargs={}, clues=None,
                 limit_rows=None) -> None:
@@ -76,33 +328,61 @@ class TelematicZapTransformer:
             input_file (str): path to the input file
             output_file (str): path to the output file
             output_example_file (str): path to the output example file
+            clues (dict): the clues of the columns (see transform)
             **kwargs: any other arguments to pass to the pandas read function
         """
-        dataframe = read_dataframe(input_file, **read_kwargs)
-        if limit_rows:
-            dataframe = dataframe.iloc[:limit_rows]
-        example_dataframe = read_dataframe(output_example_file, **example_kwargs)
-        transformed_dataframe = self.transform(dataframe, example_dataframe)
-        save_dataframe(transformed_dataframe, output_file, **write_kwargs)
+        with tracing(self.tracer or current_tracer()) as tracer:
+            with tracer.stage('read'):
+                dataframe = read_dataframe(input_file, **read_kwargs)
+                if limit_rows:
+                    dataframe = dataframe.iloc[:limit_rows]
+                example_dataframe = read_dataframe(output_example_file, **example_kwargs)
+            transformed_dataframe = self.transform(dataframe, example_dataframe, clues=clues or {})
+            with tracer.stage('write'):
+                save_dataframe(transformed_dataframe, output_file, **write_kwargs)
 
     def score(self, transformed_dataset, after_dataset):
         assert transformed_dataset.columns.equals(after_dataset.columns)
         total_score = 0
         for column_name in after_dataset.columns:
-            transformed_column = transformed_dataset.loc[:, column_name]
-            after_column = after_dataset.loc[:, column_name]
+            # datetimes with a time zone are compared as naive datetimes in UTC
+            transformed_column = to_naive_utc(transformed_dataset.loc[:, column_name])
+            after_column = to_naive_utc(after_dataset.loc[:, column_name])
             total_score += int(transformed_column.equals(after_column))
         return total_score / after_dataset.shape[1]
 
-    def fit(self, before_datasets, formats_examples, after_datasets):
+    def fit(self, before_datasets, formats_examples, after_datasets, n_trials=500, n_jobs=1, timeout=None,
+            storage='sqlite:///optuna.db', study_name='telematiczap', batch_size=16):
+        """
+        Optimize the parameters of the transformer, to reproduce the after_datasets.
+        The trials are scored on the columns they match, without deriving the missing ones.
+
+        Args:
+            before_datasets (list): the dataframes to transform
+            formats_examples (list): the examples of the formats to transform them to
+            after_datasets (list): the expected transformed dataframes
+            n_trials (int): total number of parameter sets to try
+            n_jobs (int): number of worker processes (-1 for one per core)
+            timeout (float): stop each worker after this many seconds (default: None, no limit)
+            storage (str): url of the optuna storage shared by the workers
+            study_name (str): name of the optuna study
+            batch_size (int): number of parameter sets each worker evaluates together
+        """
         # translate before optimization
         translated_datasets = []
         for before_df, format_df in zip(before_datasets, formats_examples):
             translated_datasets += [self.translate(before_df, format_df)]
-        # define optimization objective
-        def objective(trial):
-            # set object parameters
-            params = {
+        prepared_datasets = [prepare_dataframe(translated_df) for translated_df in translated_datasets]
+        # calculate the features that do not depend on the parameters only once, for every pair of columns,
+        # so that the trials only block and recombine them with their parameters
+        datasets_features = [
+            find_features(prepared_df, format_df, params=self.params, resolve=False)
+            for prepared_df, format_df in zip(prepared_datasets, formats_examples)
+        ]
+        # scores of the mappings already tried on each dataset
+        scores = {}
+        def suggest_params(trial):
+            return {
                 'min_similarity_column': trial.suggest_float('min_similarity_column', 0.1, 0.6), # find_column
                 'min_similarity_id': trial.suggest_float('min_similarity_id', 0.0, 1.0),
                 'min_similarity_address': trial.suggest_float('min_similarity_address', 0.0, 1.0), # is_column_text
@@ -126,24 +406,74 @@ class TelematicZapTransformer:
                 'weight_string_similarity_word_count': trial.suggest_float('weight_string_similarity_word_count', 0.0, 0.6),
                 'weight_numeric_similarity': trial.suggest_float('weight_numeric_similarity', 0.2, 1.0),
                 'weight_numeric_similarity_name': trial.suggest_float('weight_numeric_similarity_name', 0.2, 1.0),
-                'weight_numeric_similarity_std': trial.suggest_float('weight_numeric_similarity_std', 0.0, 0.6),
-                'weight_numeric_similarity_mean': trial.suggest_float('weight_numeric_similarity_mean', 0.0, 0.6),
+                'weight_numeric_similarity_distribution': trial.suggest_float('weight_numeric_similarity_distribution', 0.0, 0.6),
+                'weight_numeric_similarity_range': trial.suggest_float('weight_numeric_similarity_range', 0.0, 0.6),
                 'weight_diftypes_similarity': trial.suggest_float('weight_diftypes_similarity', 0.0, 1.0)
             }
-            # iterate all datasets, transform them, calculate score, and add to total score
-            total_score = 0
-            for translated_df, format_df, after_df in zip(translated_datasets, formats_examples, after_datasets):
-                try:
-                    # transformation
-                    transformed_df = self.transform(translated_df, format_df, translate=False, params=params)
-                    # calculate and add to total score
-                    total_score += self.score(transformed_df, after_df)
-                except Exception:
-                    print(traceback.format_exc())
-            # return average score
-            return total_score / len(before_datasets)
+        def score_mapping(step, mapping):
+            # transform a dataset with a mapping, only the first time it is tried
+            key = (step, tuple((match['column'], match['example_column'], match['date'], match['time_column'])
+                for match in mapping))
+            if key not in scores:
+                transformed_df = apply_mapping(translated_datasets[step], formats_examples[step], mapping)
+                if self.drop_duplicates:
+                    transformed_df = RowDeduplicator().update(transformed_df)
+                scores[key] = self.score(transformed_df, after_datasets[step])
+            return scores[key]
+        def evaluate(study, trials):
+            # iterate all datasets, match them with every set of parameters, and add the scores to their total
+            params_list = [{**self.params, **suggest_params(trial)} for trial in trials]
+            total_scores = [0] * len(trials)
+            running = list(range(len(trials)))
+            for step, (prepared_df, format_df, features) in enumerate(zip(prepared_datasets, formats_examples, datasets_features)):
+                # similarities of the pairs of columns for all the sets of parameters at once
+                similarities = similarity.combine_similarity_features(features['columns'],
+                    similarity.stack_params([params_list[i] for i in running]))
+                for i, trial_similarities in zip(list(running), similarities):
+                    try:
+                        params = params_list[i]
+                        mapping = find_mapping(prepared_df, format_df, block_features(features, params), params=params,
+                            similarities=trial_similarities)
+                        total_scores[i] += score_mapping(step, mapping)
+                    except Exception:
+                        logger.exception('Trial %d failed on dataset %d', trials[i].number, step)
+                    # report the average score so far, so that hopeless trials are pruned early
+                    trials[i].report(total_scores[i] / (step + 1), step)
+                    if trials[i].should_prune():
+                        study.tell(trials[i], state=optuna.trial.TrialState.PRUNED)
+                        running.remove(i)
+            # return average scores
+            for i in running:
+                study.tell(trials[i], total_scores[i] / len(before_datasets))
+        def optimize(study, worker_trials):
+            started_at = time.monotonic()
+            while worker_trials > 0 and (timeout is None or time.monotonic() - started_at < timeout):
+                trials = [study.ask() for _ in range(min(batch_size, worker_trials))]
+                evaluate(study, trials)
+                worker_trials -= len(trials)
         # optimize hyperparameters
-        study = optuna.create_study(study_name='telematiczap', storage='sqlite:///optuna.db', load_if_exists=True, direction='maximize')
-        study.optimize(objective, n_trials=500)
-        # pick the parameters that achieved highest score
-        self.params = study.best_params
+        pruner = optuna.pruners.MedianPruner(n_startup_trials=10, n_warmup_steps=1)
+        study = optuna.create_study(study_name=study_name, storage=storage, load_if_exists=True, direction='maximize', pruner=pruner)
+        n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        if n_jobs <= 1:
+            optimize(study, n_trials)
+        else:
+            assert storage is not None, 'parallel fit needs a storage shared by the workers'
+            # forked workers share the encoder, translated datasets and features already in memory,
+            # and coordinate through the study storage
+            def optimize_worker(worker_trials):
+                optimize(optuna.load_study(study_name=study_name, storage=storage, pruner=pruner), worker_trials)
+            context = multiprocessing.get_context('fork')
+            workers = [
+                context.Process(target=optimize_worker, args=(n_trials // n_jobs + (worker < n_trials % n_jobs),))
+                for worker in range(n_jobs)
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            failed = [worker.exitcode for worker in workers if worker.exitcode != 0]
+            if failed:
+                raise RuntimeError(f'{len(failed)} of {n_jobs} fit workers failed, with exit codes {failed}')
+        # pick the parameters that achieved highest score, keeping those not optimized
+        self.params.update(study.best_params)
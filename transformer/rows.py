@@ -0,0 +1,86 @@
+# functions for identifying the rows of dataframes
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_float_dtype
+
+
+def hash_rows(dataframe: pd.DataFrame) -> np.ndarray:
+    """
+    Hash the content of each row, so that the same row has the same hash in every export,
+    whatever the order of the columns and the dtypes pandas inferred for them.
+
+    Args:
+        dataframe (pd.DataFrame): the rows to hash
+
+    Returns:
+        np.ndarray: one uint64 hash per row
+    """
+    columns = sorted(dataframe.columns, key=str)
+    normalized = pd.DataFrame({str(column): normalize_column(dataframe[column]) for column in columns},
+        index=dataframe.index)
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+
+
+def normalize_column(column: pd.Series) -> pd.Series:
+    # the values as strings, with integers read as floats (because of missing values) written as integers
+    if is_float_dtype(column):
+        values = column.dropna()
+        if ((values % 1 == 0) & (values.abs() < 2 ** 53)).all():
+            column = column.astype('Int64')
+    return column.astype(str).where(column.notnull(), '')
+
+
+def new_rows(hashes: np.ndarray, seen_hashes: np.ndarray) -> np.ndarray:
+    """
+    Find the rows whose hashes were never seen before.
+
+    Args:
+        hashes (np.ndarray): the hashes of the rows (see hash_rows)
+        seen_hashes (np.ndarray): sorted hashes of the rows already seen
+
+    Returns:
+        np.ndarray: boolean mask of the new rows
+    """
+    if len(seen_hashes) == 0:
+        return np.ones(len(hashes), dtype=bool)
+    positions = np.searchsorted(seen_hashes, hashes).clip(max=len(seen_hashes) - 1)
+    return seen_hashes[positions] != hashes
+
+
+class RowDeduplicator:
+    """
+    Drops the rows already seen, like pd.DataFrame.drop_duplicates, but also across the chunks of a stream.
+    Rows are hashed into 64-bit keys, and only the sorted array of the keys seen is kept in memory.
+
+    Args:
+        seen_hashes (np.ndarray): sorted hashes of the rows already seen, e.g. the seen_hashes of a previous
+            deduplicator (default: None, no rows)
+
+    Attributes:
+        dropped (int): number of rows dropped so far
+    """
+    def __init__(self, seen_hashes=None):
+        self.seen_hashes = np.zeros(0, dtype=np.uint64) if seen_hashes is None else np.asarray(seen_hashes, dtype=np.uint64)
+        self.dropped = 0
+
+    def update(self, dataframe: pd.DataFrame) -> pd.DataFrame:
+        """
+        Drop the duplicated rows of a chunk, and the rows seen in the previous chunks.
+
+        Args:
+            dataframe (pd.DataFrame): the chunk of rows
+
+        Returns:
+            pd.DataFrame: the rows never seen before, in their order
+        """
+        # hashed like hash_rows, so the dtypes inferred for each chunk do not change the hashes
+        hashes = hash_rows(dataframe)
+        # keep the first of the duplicates within the chunk, if it is new
+        unique_hashes, first = np.unique(hashes, return_index=True)
+        keep = np.zeros(len(hashes), dtype=bool)
+        keep[first] = True
+        keep &= new_rows(hashes, self.seen_hashes)
+        self.seen_hashes = np.union1d(self.seen_hashes, unique_hashes)
+        self.dropped += int((~keep).sum())
+        return dataframe[keep]
@@ -0,0 +1,154 @@
+# functions for segmenting streams of position points into trips
+
+import numpy as np
+import pandas as pd
+from .derive import haversine
+
+
+# columns of the trips produced by the segmentation
+TRIP_COLUMNS = [
+    'vehicle_external_id', 'started_at', 'ended_at',
+    'start_location_lon', 'start_location_lat', 'end_location_lon', 'end_location_lat', 'distance'
+]
+
+
+class TripSegmenter:
+    """
+    Splits a stream of position points into trips.
+    A new trip starts whenever a vehicle sends no point for longer than the idle gap,
+    and trips shorter than the minimum distance are discarded.
+    Points can be fed in chunks, as long as each vehicle's points arrive in chronological order
+    across chunks. The last trip of each vehicle stays open until more points or flush() close it.
+
+    Args:
+        vehicle_column (str): column with the vehicle ids
+        time_column (str): column with the timestamps of the points
+        latitude_column (str): column with the latitudes of the points
+        longitude_column (str): column with the longitudes of the points
+        params (dict): 'segment_idle_gap' in seconds (default 300),
+            and 'segment_min_distance' in kilometers (default 0.1)
+    """
+    def __init__(self, vehicle_column='vehicle_external_id', time_column='timestamp',
+            latitude_column='latitude', longitude_column='longitude', params={}):
+        self.vehicle_column = vehicle_column
+        self.time_column = time_column
+        self.latitude_column = latitude_column
+        self.longitude_column = longitude_column
+        self.idle_gap = pd.Timedelta(seconds=params.get('segment_idle_gap', 300)).value
+        self.min_distance = params.get('segment_min_distance', 0.1)
+        # the last (still open) trip of each vehicle
+        self.open_trips = pd.DataFrame(columns=TRIP_COLUMNS)
+
+    def update(self, points: pd.DataFrame) -> pd.DataFrame:
+        """
+        Add a chunk of points to the stream.
+
+        Args:
+            points (pd.DataFrame): chunk of points with vehicle, time, latitude and longitude columns
+
+        Returns:
+            pd.DataFrame: the trips closed by this chunk
+        """
+        points = pd.DataFrame({
+            'vehicle': points[self.vehicle_column].to_numpy(),
+            'time': pd.to_datetime(points[self.time_column], errors='coerce', utc=True).to_numpy(dtype='datetime64[ns]'),
+            'latitude': pd.to_numeric(points[self.latitude_column], errors='coerce').to_numpy(dtype=float),
+            'longitude': pd.to_numeric(points[self.longitude_column], errors='coerce').to_numpy(dtype=float),
+        }).dropna()
+        # the end of each open trip continues as the first point of its vehicle
+        carried = pd.DataFrame({
+            'vehicle': self.open_trips['vehicle_external_id'].to_numpy(),
+            'time': pd.to_datetime(self.open_trips['ended_at'], utc=True).to_numpy(dtype='datetime64[ns]'),
+            'latitude': self.open_trips['end_location_lat'].to_numpy(dtype=float),
+            'longitude': self.open_trips['end_location_lon'].to_numpy(dtype=float),
+            'started_at': pd.to_datetime(self.open_trips['started_at'], utc=True).to_numpy(dtype='datetime64[ns]'),
+            'start_latitude': self.open_trips['start_location_lat'].to_numpy(dtype=float),
+            'start_longitude': self.open_trips['start_location_lon'].to_numpy(dtype=float),
+            'distance': self.open_trips['distance'].to_numpy(dtype=float),
+        })
+        points['started_at'] = points['time']
+        points['start_latitude'] = points['latitude']
+        points['start_longitude'] = points['longitude']
+        points['distance'] = 0.0
+        points = pd.concat([carried, points], ignore_index=True)
+        points = points.sort_values(['vehicle', 'time'], kind='stable', ignore_index=True)
+        trips = self.__segment(points)
+        # the last trip of every vehicle stays open
+        last = ~trips['vehicle_external_id'].duplicated(keep='last').to_numpy()
+        self.open_trips = trips[last].reset_index(drop=True)
+        return self.__filter(trips[~last])
+
+    def flush(self) -> pd.DataFrame:
+        """
+        Close all the open trips.
+
+        Returns:
+            pd.DataFrame: the trips that were still open
+        """
+        trips, self.open_trips = self.open_trips, pd.DataFrame(columns=TRIP_COLUMNS)
+        return self.__filter(trips)
+
+    def __segment(self, points: pd.DataFrame) -> pd.DataFrame:
+        # find where trips start: a new vehicle, or a gap longer than the idle gap
+        vehicles = points['vehicle'].to_numpy()
+        times = points['time'].to_numpy().astype('datetime64[ns]').astype(np.int64)
+        latitudes = points['latitude'].to_numpy()
+        longitudes = points['longitude'].to_numpy()
+        new_trip = np.ones(len(points), dtype=bool)
+        new_trip[1:] = (vehicles[1:] != vehicles[:-1]) | (np.diff(times) > self.idle_gap)
+        # distance travelled since the previous point of the same trip
+        steps = np.zeros(len(points))
+        steps[1:] = haversine(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:])
+        steps[new_trip] = 0
+        # summarize each trip
+        starts = np.flatnonzero(new_trip)
+        ends = np.append(starts[1:] - 1, len(points) - 1)
+        distances = np.add.reduceat(steps, starts) if len(starts) else np.zeros(0)
+        return pd.DataFrame({
+            'vehicle_external_id': vehicles[starts],
+            'started_at': points['started_at'].to_numpy()[starts],
+            'ended_at': points['time'].to_numpy()[ends],
+            'start_location_lon': points['start_longitude'].to_numpy()[starts],
+            'start_location_lat': points['start_latitude'].to_numpy()[starts],
+            'end_location_lon': longitudes[ends],
+            'end_location_lat': latitudes[ends],
+            'distance': points['distance'].to_numpy()[starts] + distances,
+        }, columns=TRIP_COLUMNS)
+
+    def __filter(self, trips: pd.DataFrame) -> pd.DataFrame:
+        # drop the trips that are too short
+        return trips[trips['distance'].to_numpy(dtype=float) >= self.min_distance].reset_index(drop=True)
+
+
+def segment_trips(points: pd.DataFrame, params={}, **columns) -> pd.DataFrame:
+    """
+    Split a dataframe of position points into trips.
+
+    Args:
+        points (pd.DataFrame): points with vehicle, time, latitude and longitude columns
+        params (dict): segmentation thresholds (see TripSegmenter)
+        **columns: names of the points columns (see TripSegmenter)
+
+    Returns:
+        pd.DataFrame: one row per trip, with the trips format columns
+    """
+    segmenter = TripSegmenter(params=params, **columns)
+    return pd.concat([segmenter.update(points), segmenter.flush()], ignore_index=True)
+
+
+def segment_trips_chunked(chunks, params={}, **columns):
+    """
+    Split an iterable of chunks of position points into trips, e.g. pd.read_csv(..., chunksize=n).
+
+    Args:
+        chunks: iterable of dataframes of points, each vehicle's points in chronological order
+        params (dict): segmentation thresholds (see TripSegmenter)
+        **columns: names of the points columns (see TripSegmenter)
+
+    Yields:
+        pd.DataFrame: the trips closed by each chunk
+    """
+    segmenter = TripSegmenter(params=params, **columns)
+    for chunk in chunks:
+        yield segmenter.update(chunk)
+    yield segmenter.flush()
@@ -3,37 +3,75 @@
 import numpy as np
 import pandas as pd
 from sentence_transformers import SentenceTransformer
-from sentence_transformers.util import cos_sim
 from pandas.api.types import is_datetime64_any_dtype, is_timedelta64_dtype
+from .trace import current_tracer
+from .sketch import ValueSketch, NumericSketch, sketch_similarity, numeric_similarity
 import re
+import time
 
 
 # this is the pre-trained model with the best avg performance
 # more pre-trained models: https://www.sbert.net/docs/pretrained_models.html#sentence-embedding-models
-model = SentenceTransformer('paraphrase-mpnet-base-v2') # this may take some time to load
+MODEL_NAME = 'paraphrase-mpnet-base-v2'
+__model = None
+def get_model() -> SentenceTransformer:
+    """
+    Return the pre-trained model, loading it on first use (this may take some time).
+    """
+    global __model
+    if __model is None:
+        __model = SentenceTransformer(MODEL_NAME)
+    return __model
+
+# embeddings of the strings already encoded, so that each string is encoded only once
+embeddings = {}
+
+def encode(strings: list) -> np.ndarray:
+    """
+    Calculates the embeddings of a list of strings.
+    Only the strings never encoded before are sent to the model, in a single batch.
+
+    Args:
+        strings: list of strings to encode
+
+    Returns:
+        array with one embedding per string
+    """
+    tracer = current_tracer()
+    unique = dict.fromkeys(strings)
+    missing = [s for s in unique if s not in embeddings]
+    tracer.count('encoder_cache_hits', len(unique) - len(missing))
+    if missing:
+        tracer.count('encoder_calls')
+        tracer.count('encoder_strings', len(missing))
+        with tracer.stage('encoder'):
+            embeddings.update(zip(missing, get_model().encode(missing)))
+    return np.array([embeddings[s] for s in strings])
+
+
+def cosine_similarity(embeddings1: np.ndarray, embeddings2: np.ndarray) -> np.ndarray:
+    """
+    Calculates the cosine similarity between every pair of rows of embeddings1 and embeddings2.
+    """
+    embeddings1 = embeddings1 / np.linalg.norm(embeddings1, axis=-1, keepdims=True)
+    embeddings2 = embeddings2 / np.linalg.norm(embeddings2, axis=-1, keepdims=True)
+    return embeddings1 @ embeddings2.T
+
 
 def similarity_str(s1: str, s2: str, nsamples=5) -> float:
     """
     Calculates the similarity between two strings using a pre-trained model with semantic context.
-    Note that this is a stochastic method, so the similarity is not guaranteed to be always the same.
 
     Args:
         s1: first string
         s2: second string
-        nsamples: number of samples to use for the similarity calculation
+        nsamples: unused, kept for compatibility (embeddings are cached, so every sample is the same)
 
     Returns:
         similarity between s1 and s2
     """
-    def sim_str(s1, s2) -> float:
-        # calculate the string embeddings
-        embeddings1 = model.encode(s1)
-        embeddings2 = model.encode(s2)
-        # calculate cosine similarity
-        return cos_sim(embeddings1, embeddings2).item()
-    
-    # average similarity of 5 samples of (s1, s2)
-    return np.mean([sim_str(s1, s2) for _ in range(nsamples)])
+    embeddings1, embeddings2 = encode([s1, s2])
+    return cosine_similarity(embeddings1[None], embeddings2[None]).item()
 
 
 def is_column_text(column: pd.Series, params={}) -> bool:
@@ -115,6 +153,20 @@ def is_date(x, params={}) -> bool:
     return re.search(r'\d{2}[-/\\\.]\d{2}[-/\\\.]\d{2}', str(x)) is not None
 
 
+def is_date_profile(profile: pd.Series, params={}) -> bool:
+    """
+    Check if a column has date information, from its profile (see column_profiles).
+    """
+    return bool(profile['date_typed']) or profile['date_ratio'] > params.get('min_similarity_date', 0.5)
+
+
+def is_time_profile(profile: pd.Series, params={}) -> bool:
+    """
+    Check if a column has time information, from its profile (see column_profiles).
+    """
+    return bool(profile['time_typed']) or profile['time_ratio'] > params.get('min_similarity_time', 0.5)
+
+
 def count_columns_with_dates(dataframe: pd.DataFrame) -> int:
     """
     Count the number of columns in a dataframe that have dates
@@ -177,114 +229,345 @@ def replace_with_hints(s: str, context=['trip']):
     return s
 
 
-def similarity_columns(column1: pd.Series, column2: pd.Series, params={}) -> float:
+def normalize_name(name: str) -> str:
     """
-    Calculates the similarity between two columns samples using a pre-trained model with semantic context.
-    
+    Normalizes a column name (see replace_with_hints) to compare it exactly with other names.
+    """
+    return re.sub(r'[\W_]+', ' ', name).strip()
+
+
+def lexical_similarity(names1: list, names2: list) -> np.ndarray:
+    """
+    Calculates a cheap similarity of every pair of names, from their words and character trigrams,
+    without any model. It is the average of the overlaps (Jaccard index) of the words and of the trigrams.
+
     Args:
-        column1: first column
-        column2: second column
-    
+        names1: first names (see normalize_name)
+        names2: second names (see normalize_name)
+
     Returns:
-        similarity between column1 and column2
+        array of shape (len(names1), len(names2)) with similarities between 0 and 1
     """
-    #if (column1.name == 'Arrival address') and (column2.name == 'name'):
-    #    breakpoint()
+    def tokens(name):
+        words = set(name.split())
+        padded = f' {name} '
+        trigrams = {padded[i:i + 3] for i in range(len(padded) - 2)}
+        return words, trigrams
+    def overlap(set1, set2):
+        return len(set1 & set2) / len(set1 | set2) if set1 or set2 else 0.0
+    tokens1, tokens2 = [tokens(name) for name in names1], [tokens(name) for name in names2]
+    return np.array([
+        [(overlap(words1, words2) + overlap(trigrams1, trigrams2)) / 2 for words2, trigrams2 in tokens2]
+        for words1, trigrams1 in tokens1
+    ]).reshape(len(names1), len(names2))
+
+
+def id_similar_values(sample: pd.Series) -> bool:
+    """
+    Check if a sample of values looks like ids (numbers and uppercase letters).
+    """
+    sample = sample.astype(str)
+    contains_numbers = sample.str.contains(r'\d', regex=True).any()
+    contains_lowercase = sample.str.contains(r'[a-z]', regex=True).any()
+    contains_punctuation = sample.str.contains(r'[^.,:?! ]', regex=True).any()
+    return contains_numbers and not contains_lowercase and not contains_punctuation
 
-    # preprocess the column names
-    column1_name = column1.name.replace('_', ' ').lower()
-    column2_name = column2.name.replace('_', ' ').lower()
-    column1_name = replace_with_hints(column1_name)
-    column2_name = replace_with_hints(column2_name)
-    column1_sample = column1.sample(n=min(30, len(column1)))
-    column2_sample = column2.sample(n=min(30, len(column2)))
 
-    # calculate the similarity between the columns names
-    name_similarity = similarity_str(column1_name, column2_name)
+def column_profiles(dataframe: pd.DataFrame) -> pd.DataFrame:
+    """
+    Calculates the features of each column that do not depend on the other columns,
+    nor on the parameters. All the names are encoded in a single batch.
 
-    # if column is a date
-    if is_date(column1, params) or is_date(column2, params):
-        if is_date(column1, params) and is_date(column2, params):
-            if is_time(column1, params) == is_time(column2, params):
-                return params.get('weight_similarity_date', 0.5) * name_similarity + params.get('match_similarity_datetime', 0.5)
-            else:
-                return params.get('weight_similarity_date', 0.5) * name_similarity + params.get('unmatch_similarity_datetime', 0.3)
-        else:
-            return params.get('discount_weight_similarity_date', 0.3) * name_similarity
+    Args:
+        dataframe: the dataframe to profile
 
-    # if column is a time
-    if is_time(column1, params) or is_time(column2, params):
-        if is_time(column1, params) and is_time(column2, params):
-            return params.get('weight_similarity_time', 0.5) * name_similarity + params.get('match_similarity_time', 0.5)
-        else:
-            return params.get('discount_weight_similarity_time', 0.3) * name_similarity
+    Returns:
+        dataframe with one row (profile) per column of dataframe
+    """
+    return column_profiles_many([dataframe])[0]
 
-    # if column is an id
-    column1_id_similarity = max(similarity_str('id', column1_name), similarity_str('serial number', column1_name))
-    column2_id_similarity = max(similarity_str('id', column2_name), similarity_str('serial number', column2_name))
-    if column1_id_similarity > params.get('min_similarity_colname_id', 0.5) or \
-        column2_id_similarity > params.get('min_similarity_colname_id', 0.5):
-        # mean id similarity
-        id_name_similarity = column1_id_similarity * column2_id_similarity
-        # calculate uniqueness similarity
-        column1_id_uniqueness = column1.nunique() / len(column1)
-        column2_id_uniqueness = column1.nunique() / len(column2)
-        uniqueness_similarity = 1 - \
-            abs(column1_id_uniqueness - column2_id_uniqueness) / \
-            (column1_id_uniqueness + column2_id_uniqueness)
-        # id with strings and numbers
-        def id_similar_values(sample):
-            sample = sample.astype(str)
-            contains_numbers = sample.str.contains(r'\d', regex=True).any()
-            contains_lowercase = sample.str.contains(r'[a-z]', regex=True).any()
-            contains_punctuation = sample.str.contains(r'[^.,:?! ]', regex=True).any()
-            return contains_numbers and not contains_lowercase and not contains_punctuation
-        values_similarity = id_similar_values(column1_sample) * id_similar_values(column2_sample) 
-
-        # summarize similarity
-        return params.get('weight_id_similarity_name', 0.6) * name_similarity + \
-            params.get('weight_id_similarity_idname', 0.2) * id_name_similarity + \
-            params.get('weight_id_similarity_uniqueness', 0.1) * uniqueness_similarity + \
-            params.get('weight_id_similarity_values', 0.1) * values_similarity
 
+def column_profiles_many(dataframes: list) -> list:
+    """
+    Calculates the profiles of the columns of several dataframes (see column_profiles),
+    encoding the names of all of them in a single batch.
+
+    Args:
+        dataframes: the dataframes to profile
+
+    Returns:
+        list with the profiles of each dataframe
+    """
+    return embed_profiles([profile_columns(dataframe) for dataframe in dataframes])
+
+
+def embed_profiles(profiles_list: list) -> list:
+    """
+    Completes profiles calculated by profile_columns with the features that need embeddings,
+    encoding the names of all of them in a single batch.
+
+    Args:
+        profiles_list: the profiles to complete
+
+    Returns:
+        list with the completed profiles
+    """
+    # encode all the names at once
+    strings = ['id', 'serial number']
+    for profiles in profiles_list:
+        strings += profiles['name'].tolist()
+    encode(strings)
+    for profiles in profiles_list:
+        profiles['id_name'] = [max(similarity_str('id', name), similarity_str('serial number', name)) for name in profiles['name']]
+    return profiles_list
+
+
+def profile_columns(dataframe: pd.DataFrame) -> pd.DataFrame:
+    # the features of column_profiles that need no embeddings (see embed_profiles)
+    tracer = current_tracer()
+    profiles = []
+    for column_name in dataframe.columns:
+        start = time.perf_counter()
+        column = dataframe[column_name]
+        name = replace_with_hints(str(column_name).replace('_', ' ').lower())
+        sample = column.sample(n=min(30, len(column)))
+        date_sample = column.sample(n=min(len(column), 20))
+        is_object = column.dtype == 'object'
+        is_numeric = is_column_numeric(column)
+        profiles.append({
+            'name': name,
+            'length': len(column),
+            'dtype': str(column.dtype),
+            'date_typed': is_datetime64_any_dtype(column),
+            'date_ratio': date_sample.apply(is_date).astype(float).mean(),
+            'time_typed': is_timedelta64_dtype(column),
+            'time_ratio': date_sample.apply(is_time).astype(float).mean(),
+            'uniqueness': column.nunique() / len(column) if len(column) else np.nan,
+            'id_values': id_similar_values(sample),
+            'object': is_object,
+            'sketch': ValueSketch().update(column.sample(n=min(1000, len(column)))) if is_object else None,
+            'word_count': sample.astype(str).str.split(r'[ ,]').apply(len).mean() if is_object else np.nan,
+            'numeric': is_numeric,
+            'numeric_sketch': NumericSketch().update(column) if is_numeric else None,
+        })
+        # time spent on each column
+        tracer.timing(f'profile:{column_name}', time.perf_counter() - start)
+    profiles = pd.DataFrame(profiles, index=dataframe.columns, columns=[
+        'name', 'length', 'dtype', 'date_typed', 'date_ratio', 'time_typed', 'time_ratio', 'uniqueness',
+        'id_values', 'object', 'sketch', 'word_count', 'numeric', 'numeric_sketch'])
+    return profiles
+
+
+# features of a pair of columns, as computed by similarity_features
+FEATURES = [
+    'name_similarity',
+    'date_typed1', 'date_ratio1', 'date_typed2', 'date_ratio2',
+    'time_typed1', 'time_ratio1', 'time_typed2', 'time_ratio2',
+    'id_name1', 'id_name2', 'uniqueness_similarity', 'values_id_similarity',
+    'strings', 'values_similarity', 'word_count_similarity',
+    'numeric', 'numeric_small_sample', 'distribution_similarity', 'range_similarity',
+    'different_types',
+]
+
+
+def similarity_features(profiles1: pd.DataFrame, profiles2: pd.DataFrame) -> np.ndarray:
+    """
+    Calculates the features of every pair of columns that do not depend on the parameters.
+    The similarity of the columns is a weighted combination of these features (see combine_similarity_features).
+
+    Args:
+        profiles1: profiles of the first columns (see column_profiles)
+        profiles2: profiles of the second columns (see column_profiles)
+
+    Returns:
+        array of shape (len(profiles1), len(profiles2), len(FEATURES))
+    """
+    def pair(column):
+        # broadcast a profile column to every pair of columns
+        values1 = profiles1[column].to_numpy(dtype=float)[:, None]
+        values2 = profiles2[column].to_numpy(dtype=float)[None, :]
+        return np.broadcast_arrays(values1, values2)
+    def relative_similarity(column):
+        values1, values2 = pair(column)
+        return 1 - np.abs(values1 - values2) / (values1 + values2)
+    shape = (len(profiles1), len(profiles2))
+    features = np.zeros(shape + (len(FEATURES),))
+    if 0 in shape:
+        return features
+    with np.errstate(divide='ignore', invalid='ignore'):
+        features[..., FEATURES.index('name_similarity')] = cosine_similarity(
+            encode(profiles1['name'].tolist()), encode(profiles2['name'].tolist())).reshape(shape)
+        for column in ('date_typed', 'date_ratio', 'time_typed', 'time_ratio', 'id_name'):
+            values1, values2 = pair(column)
+            features[..., FEATURES.index(column + '1')] = values1
+            features[..., FEATURES.index(column + '2')] = values2
+        features[..., FEATURES.index('uniqueness_similarity')] = relative_similarity('uniqueness')
+        values1, values2 = pair('id_values')
+        features[..., FEATURES.index('values_id_similarity')] = values1 * values2
+        # string columns
+        values1, values2 = pair('object')
+        strings = (values1 * values2) > 0
+        features[..., FEATURES.index('strings')] = strings
+        if strings.any():
+            objects1, objects2 = profiles1['object'].to_numpy(dtype=bool), profiles2['object'].to_numpy(dtype=bool)
+            values_similarity = np.zeros(shape)
+            values_similarity[np.ix_(objects1, objects2)] = sketch_similarity(
+                profiles1.loc[objects1, 'sketch'].tolist(), profiles2.loc[objects2, 'sketch'].tolist())
+            features[..., FEATURES.index('values_similarity')] = values_similarity
+        features[..., FEATURES.index('word_count_similarity')] = relative_similarity('word_count')
+        # numeric columns
+        values1, values2 = pair('numeric')
+        numeric = (values1 * values2) > 0
+        features[..., FEATURES.index('numeric')] = numeric
+        values1, values2 = pair('length')
+        features[..., FEATURES.index('numeric_small_sample')] = np.minimum(np.minimum(values1, values2), 30) <= 15
+        if numeric.any():
+            numerics1, numerics2 = profiles1['numeric'].to_numpy(dtype=bool), profiles2['numeric'].to_numpy(dtype=bool)
+            distribution_similarity, range_similarity = np.zeros(shape), np.zeros(shape)
+            distribution_similarity[np.ix_(numerics1, numerics2)], range_similarity[np.ix_(numerics1, numerics2)] = \
+                numeric_similarity(profiles1.loc[numerics1, 'numeric_sketch'].tolist(),
+                    profiles2.loc[numerics2, 'numeric_sketch'].tolist())
+            features[..., FEATURES.index('distribution_similarity')] = distribution_similarity
+            features[..., FEATURES.index('range_similarity')] = range_similarity
+        # columns of different types
+        features[..., FEATURES.index('different_types')] = \
+            profiles1['dtype'].to_numpy()[:, None] != profiles2['dtype'].to_numpy()[None, :]
+    return features
+
+
+def column_kinds(profiles: pd.DataFrame, params={}) -> np.ndarray:
+    """
+    Classifies columns by kind, from their profiles: 'datetime' (dates and times), 'numeric',
+    'text' (free text of several words, like addresses) or 'other' (ids, codes, names...).
+
+    Args:
+        profiles: profiles of the columns (see column_profiles)
+
+    Returns:
+        array with the kind of each column
+    """
+    datetimes = profiles['date_typed'].astype(bool) | (profiles['date_ratio'] > params.get('min_similarity_date', 0.5)) | \
+        profiles['time_typed'].astype(bool) | (profiles['time_ratio'] > params.get('min_similarity_time', 0.5))
+    numeric = profiles['numeric'].astype(bool)
+    text = profiles['object'].astype(bool) & (profiles['word_count'] >= 3)
+    return np.select([datetimes, numeric, text], ['datetime', 'numeric', 'text'], 'other')
+
+
+def candidate_pairs(profiles1: pd.DataFrame, profiles2: pd.DataFrame, features: np.ndarray, params={}) -> np.ndarray:
+    """
+    Finds the pairs of columns worth scoring: the columns must be of compatible kinds (see column_kinds),
+    and among them, only the top-k columns of profiles1 with the most similar names to each column of profiles2
+    are kept. Datetimes are only compatible with datetimes, and numbers are not compatible with free text.
+
+    Args:
+        profiles1: profiles of the first columns (see column_profiles)
+        profiles2: profiles of the second columns (see column_profiles)
+        features: features of the pairs of columns (see similarity_features)
+        params: 'blocking_top_k', the number of candidates for each column of profiles2 (default 10, 0 for all)
+
+    Returns:
+        boolean array of shape (len(profiles1), len(profiles2))
+    """
+    kinds1 = column_kinds(profiles1, params)[:, None]
+    kinds2 = column_kinds(profiles2, params)[None, :]
+    candidates = ((kinds1 == 'datetime') == (kinds2 == 'datetime')) & \
+        ~((kinds1 == 'numeric') & (kinds2 == 'text')) & ~((kinds1 == 'text') & (kinds2 == 'numeric'))
+    top_k = params.get('blocking_top_k', 10)
+    if 0 < top_k < len(profiles1):
+        scores = np.where(candidates, features[..., FEATURES.index('name_similarity')], -np.inf)
+        top = np.argpartition(-scores, top_k - 1, axis=0)[:top_k]
+        in_top = np.zeros_like(candidates)
+        np.put_along_axis(in_top, top, True, axis=0)
+        candidates &= in_top
+    return candidates
+
+
+def stack_params(params_list: list) -> dict:
+    """
+    Stacks several sets of parameters, so that combine_similarity_features evaluates them all at once.
+    Only the numeric parameters that every set has are stacked.
+
+    Args:
+        params_list: list of parameters dictionaries
+
+    Returns:
+        dictionary of parameters, with arrays of shape (len(params_list), 1, 1) as values
+    """
+    keys = set().union(*params_list)
+    return {
+        key: np.array([params[key] for params in params_list], dtype=float)[:, None, None]
+        for key in keys
+        if all(isinstance(params.get(key), (int, float)) for params in params_list)
+    }
+
+
+def combine_similarity_features(features: np.ndarray, params={}) -> np.ndarray:
+    """
+    Calculates the similarity of pairs of columns from their features (see similarity_features).
+    This only does vectorized arithmetic, so it is cheap to evaluate for many sets of parameters.
+
+    Args:
+        features: array of features, with the features in the last axis
+        params: parameters dictionary, whose values can also be arrays (see stack_params)
+
+    Returns:
+        array of similarities, with the shape of features without the last axis
+        (broadcasted with the shape of the parameters)
+    """
+    def f(name):
+        return features[..., FEATURES.index(name)]
+    def p(name, default):
+        return np.asarray(params.get(name, default), dtype=float)
+    name_similarity = f('name_similarity')
+    # check which columns are dates, times or ids
+    date1 = (f('date_typed1') > 0) | (f('date_ratio1') > p('min_similarity_date', 0.5))
+    date2 = (f('date_typed2') > 0) | (f('date_ratio2') > p('min_similarity_date', 0.5))
+    time1 = (f('time_typed1') > 0) | (f('time_ratio1') > p('min_similarity_time', 0.5))
+    time2 = (f('time_typed2') > 0) | (f('time_ratio2') > p('min_similarity_time', 0.5))
+    is_id = (f('id_name1') > p('min_similarity_colname_id', 0.5)) | (f('id_name2') > p('min_similarity_colname_id', 0.5))
+    # if column is a date
+    date_similarity = np.where(date1 & date2,
+        p('weight_similarity_date', 0.5) * name_similarity + np.where(time1 == time2,
+            p('match_similarity_datetime', 0.5), p('unmatch_similarity_datetime', 0.3)),
+        p('discount_weight_similarity_date', 0.3) * name_similarity)
+    # if column is a time
+    time_similarity = np.where(time1 & time2,
+        p('weight_similarity_time', 0.5) * name_similarity + p('match_similarity_time', 0.5),
+        p('discount_weight_similarity_time', 0.3) * name_similarity)
+    # if column is an id
+    id_similarity = p('weight_id_similarity_name', 0.6) * name_similarity + \
+        p('weight_id_similarity_idname', 0.2) * f('id_name1') * f('id_name2') + \
+        p('weight_id_similarity_uniqueness', 0.1) * f('uniqueness_similarity') + \
+        p('weight_id_similarity_values', 0.1) * f('values_id_similarity')
     # if the data are strings
-    if (column1.dtype == 'object') and (column2.dtype == 'object'):
-        # if the data are strings, stringify a sample of values
-        sample_size = min(30, len(column1), len(column2))
-        column1_sample = column1.sample(n=sample_size).astype(str)
-        column2_sample = column2.sample(n=sample_size).astype(str)
-        column1_str = ', '.join([column1_name] + column1_sample.tolist())
-        column2_str = ', '.join([column2_name] + column2_sample.tolist())
-        # calculate the similarity between the strings
-        values_similarity = similarity_str(column1_str, column2_str)
-        # calculate similarity based on the number of words
-        words_count1 = column1_sample.str.split(r'[ ,]').apply(len).mean()
-        words_count2 = column2_sample.str.split(r'[ ,]').apply(len).mean()
-        word_count_similarity = 1 - abs(words_count1 - words_count2) / (words_count1 + words_count2)
-        # weighted average of similarity
-        return params.get('weight_string_similarity_name', 0.7) * name_similarity + \
-            params.get('weight_string_similarity_values', 0.2) * values_similarity + \
-            params.get('weight_string_similarity_word_count', 0.1) * word_count_similarity
-    
+    string_similarity = p('weight_string_similarity_name', 0.7) * name_similarity + \
+        p('weight_string_similarity_values', 0.2) * f('values_similarity') + \
+        p('weight_string_similarity_word_count', 0.1) * f('word_count_similarity')
     # if the column is numeric
-    if is_column_numeric(column1) and is_column_numeric(column2):
-        # guarantee a minimum sample size for these calculations
-        sample_size = min(30, len(column1), len(column2))
-        if sample_size <= 15:
-            return name_similarity * params.get('weight_numeric_similarity', 0.8)
-        # calculate the similarity between the columns means and stds
-        column1_std, column2_std = column1.std(), column2.std()
-        column1_mean, column2_mean = column1.mean(), column2.mean()
-        std_similarity = 1 - abs(column1_std - column2_std) / (column1_std + column2_std)
-        mean_similarity = 1 - abs(column1_mean - column2_mean) / (column1_mean + column2_mean)
-        return params.get('weight_numeric_similarity_name', 0.7) * name_similarity + \
-            params.get('weight_numeric_similarity_std', 0.2) * std_similarity + \
-            params.get('weight_numeric_similarity_mean', 0.1) * mean_similarity
-
-    # if columns are of different types
-    if str(column1.dtype) != str(column2.dtype):
-        return params.get('weight_diftypes_similarity', 0.5) * name_similarity
-
-    # otherwise, return 0
-    return 0
+    numeric_similarity = np.where(f('numeric_small_sample') > 0,
+        name_similarity * p('weight_numeric_similarity', 0.8),
+        p('weight_numeric_similarity_name', 0.7) * name_similarity + \
+        p('weight_numeric_similarity_distribution', 0.2) * f('distribution_similarity') + \
+        p('weight_numeric_similarity_range', 0.1) * f('range_similarity'))
+    # if columns are of different types, otherwise 0
+    other_similarity = np.where(f('different_types') > 0, p('weight_diftypes_similarity', 0.5) * name_similarity, 0)
+    # the first matching case decides the similarity
+    return np.select(
+        [date1 | date2, time1 | time2, is_id, f('strings') > 0, f('numeric') > 0],
+        [date_similarity, time_similarity, id_similarity, string_similarity, numeric_similarity],
+        other_similarity)
+
 
+def similarity_columns(column1: pd.Series, column2: pd.Series, params={}) -> float:
+    """
+    Calculates the similarity between two columns samples using a pre-trained model with semantic context.
+
+    Args:
+        column1: first column
+        column2: second column
+
+    Returns:
+        similarity between column1 and column2
+    """
+    features = similarity_features(column_profiles(column1.to_frame()), column_profiles(column2.to_frame()))
+    return combine_similarity_features(features[0, 0], params).item()
@@ -0,0 +1,276 @@
+# sketches of the values of columns, to compare columns without a model
+
+import numpy as np
+import pandas as pd
+from collections import Counter
+from functools import lru_cache
+
+
+# modulus of the hash functions of the MinHash signatures
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+
+
+@lru_cache(maxsize=None)
+def hash_functions(num_perm: int, seed: int) -> tuple:
+    """
+    Return the coefficients a and b of the hash functions (a * x + b) % MERSENNE_PRIME of the signatures.
+    """
+    rng = np.random.default_rng(seed)
+    return rng.integers(1, 2**32, num_perm, dtype=np.uint64), rng.integers(0, 2**32, num_perm, dtype=np.uint64)
+
+
+class ValueSketch:
+    """
+    Compact summary of the values of a column: a MinHash signature of the words of its values,
+    to estimate how much the words of two columns overlap, and its most frequent values.
+    It can be built chunk by chunk, and merged with the sketches of other chunks.
+
+    Args:
+        num_perm (int): number of hash functions of the signature (default 64)
+        top_values (int): number of most frequent values kept (default 10)
+        seed (int): seed of the hash functions, must be the same for the sketches compared
+    """
+    def __init__(self, num_perm=64, top_values=10, seed=1):
+        self.num_perm = num_perm
+        self.top_values = top_values
+        self.seed = seed
+        self.signature = np.full(num_perm, MERSENNE_PRIME, dtype=np.uint64)
+        self.counts = Counter()
+
+    def update(self, values: pd.Series, block_size=10000):
+        """
+        Add a chunk of values to the sketch.
+
+        Args:
+            values (pd.Series): the values to add
+            block_size (int): number of words hashed at once, to bound the memory used
+
+        Returns:
+            ValueSketch: the sketch itself
+        """
+        counts = values.dropna().astype(str).str.strip().str.lower().value_counts()
+        self.counts.update(counts.to_dict())
+        # keep a few more values than needed, so the most frequent stay approximately right across chunks
+        if len(self.counts) > 4 * self.top_values:
+            self.counts = Counter(dict(self.counts.most_common(4 * self.top_values)))
+        # hash the distinct words of the values with every hash function
+        words = pd.Series(counts.index, dtype=object).str.findall(r'\w+').explode().dropna().unique()
+        a, b = hash_functions(self.num_perm, self.seed)
+        for start in range(0, len(words), block_size):
+            hashes = pd.util.hash_array(np.asarray(words[start:start + block_size], dtype=object)) & np.uint64(0xffffffff)
+            permuted = (a[:, None] * hashes[None, :] + b[:, None]) % MERSENNE_PRIME
+            self.signature = np.minimum(self.signature, permuted.min(axis=1))
+        return self
+
+    def merge(self, other):
+        """
+        Merge the sketch of another chunk of the same column into this sketch.
+
+        Args:
+            other (ValueSketch): a sketch with the same num_perm and seed
+
+        Returns:
+            ValueSketch: the sketch itself
+        """
+        assert (self.num_perm, self.seed) == (other.num_perm, other.seed), 'sketches with different hash functions'
+        self.signature = np.minimum(self.signature, other.signature)
+        self.counts.update(other.counts)
+        if len(self.counts) > 4 * self.top_values:
+            self.counts = Counter(dict(self.counts.most_common(4 * self.top_values)))
+        return self
+
+    @property
+    def empty(self) -> bool:
+        return bool((self.signature == MERSENNE_PRIME).all())
+
+    def top(self) -> list:
+        """
+        Return the most frequent values (lowercase), from the most frequent.
+        """
+        return [value for value, _ in self.counts.most_common(self.top_values)]
+
+
+def sketch_similarity(sketches1: list, sketches2: list) -> np.ndarray:
+    """
+    Estimate the similarity of the values of every pair of columns from their sketches:
+    the largest of the overlap (Jaccard index) of their words, estimated from the MinHash signatures,
+    and of the overlap of their most frequent values.
+
+    Args:
+        sketches1 (list): the sketches of the first columns
+        sketches2 (list): the sketches of the second columns
+
+    Returns:
+        np.ndarray: array of shape (len(sketches1), len(sketches2)) with similarities between 0 and 1
+    """
+    shape = (len(sketches1), len(sketches2))
+    if 0 in shape:
+        return np.zeros(shape)
+    # the share of equal minimums estimates the Jaccard index of the words
+    signatures1 = np.stack([sketch.signature for sketch in sketches1])
+    signatures2 = np.stack([sketch.signature for sketch in sketches2])
+    words = (signatures1[:, None, :] == signatures2[None, :, :]).mean(axis=2)
+    # sketches without words are not similar to anything
+    empty1 = np.array([sketch.empty for sketch in sketches1])
+    empty2 = np.array([sketch.empty for sketch in sketches2])
+    words[empty1[:, None] | empty2[None, :]] = 0
+    # overlap of the most frequent values
+    tops1, tops2 = [set(sketch.top()) for sketch in sketches1], [set(sketch.top()) for sketch in sketches2]
+    top_values = np.array([
+        [len(top1 & top2) / len(top1 | top2) if top1 or top2 else 0.0 for top2 in tops2]
+        for top1 in tops1
+    ])
+    return np.maximum(words, top_values)
+
+
+# quantiles of the numeric sketches compared by numeric_similarity
+QUANTILES = np.linspace(0.05, 0.95, 19)
+
+# classes of ranges of values, from the most specific: (name, minimum, maximum, integers only)
+RANGE_CLASSES = [
+    ('ratio', 0, 1, False),
+    ('latitude', -90, 90, False),
+    ('longitude', -180, 180, False),
+    ('count', 0, np.inf, True),
+    ('integer', -np.inf, np.inf, True),
+    ('positive', 0, np.inf, False),
+    ('signed', -np.inf, np.inf, False),
+]
+
+
+class NumericSketch:
+    """
+    Compact summary of the distribution of a numeric column: its count, minimum and maximum,
+    whether all its values are integers, and a mergeable quantile sketch (weighted centroids,
+    compressed to at most `size` of them). It is built in one pass, chunk by chunk,
+    and merged with the sketches of other chunks.
+
+    Args:
+        size (int): maximum number of centroids kept (default 200)
+    """
+    def __init__(self, size=200):
+        self.size = size
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.integers = True
+        self.centroids = np.empty(0)
+        self.weights = np.empty(0)
+
+    def update(self, values: pd.Series):
+        """
+        Add a chunk of values to the sketch (missing and infinite values are ignored).
+
+        Args:
+            values (pd.Series): the values to add
+
+        Returns:
+            NumericSketch: the sketch itself
+        """
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if len(values):
+            self.count += len(values)
+            self.min = min(self.min, values.min())
+            self.max = max(self.max, values.max())
+            self.integers = self.integers and bool((values == np.round(values)).all())
+            self.__add(values, np.ones(len(values)))
+        return self
+
+    def merge(self, other):
+        """
+        Merge the sketch of another chunk of the same column into this sketch.
+
+        Args:
+            other (NumericSketch): the sketch to merge
+
+        Returns:
+            NumericSketch: the sketch itself
+        """
+        if other.count:
+            self.count += other.count
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self.integers = self.integers and other.integers
+            self.__add(other.centroids, other.weights)
+        return self
+
+    def __add(self, centroids, weights):
+        centroids = np.concatenate([self.centroids, centroids])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(centroids, kind='stable')
+        centroids, weights = centroids[order], weights[order]
+        if len(centroids) > self.size:
+            # replace the centroids by `size` centroids of equal weight, at evenly spaced ranks
+            ranks = np.cumsum(weights) - weights / 2
+            targets = (np.arange(self.size) + 0.5) * weights.sum() / self.size
+            centroids = np.interp(targets, ranks, centroids)
+            weights = np.full(self.size, weights.sum() / self.size)
+        self.centroids, self.weights = centroids, weights
+
+    @property
+    def empty(self) -> bool:
+        return self.count == 0
+
+    def quantiles(self, q=QUANTILES) -> np.ndarray:
+        """
+        Estimate quantiles of the values.
+
+        Args:
+            q (np.ndarray): the probabilities of the quantiles, between 0 and 1
+
+        Returns:
+            np.ndarray: the estimated quantiles (nan if the sketch is empty)
+        """
+        if self.empty:
+            return np.full(len(q), np.nan)
+        ranks = (np.cumsum(self.weights) - self.weights / 2) / self.weights.sum()
+        return np.interp(q, ranks, self.centroids)
+
+    def range_class(self) -> str:
+        """
+        Return the most specific class of RANGE_CLASSES of the values, e.g. 'latitude' for decimals within [-90, 90].
+        """
+        if self.empty:
+            return None
+        for name, minimum, maximum, integers in RANGE_CLASSES:
+            if minimum <= self.min and self.max <= maximum and (self.integers or not integers):
+                return name
+
+
+def numeric_similarity(sketches1: list, sketches2: list) -> tuple:
+    """
+    Estimate the similarity of the distributions of every pair of numeric columns from their sketches.
+    The distribution similarity is 1 minus the mean distance between their quantiles, relative to the range
+    of both columns, so it works with signed values. The range similarity is 1 for columns of the same range
+    class, 0.5 if the range of one contains the other, and 0 otherwise.
+
+    Args:
+        sketches1 (list): the sketches of the first columns
+        sketches2 (list): the sketches of the second columns
+
+    Returns:
+        tuple: arrays of shape (len(sketches1), len(sketches2)) with the distribution and range similarities
+    """
+    shape = (len(sketches1), len(sketches2))
+    if 0 in shape:
+        return np.zeros(shape), np.zeros(shape)
+    quantiles1 = np.stack([sketch.quantiles() for sketch in sketches1])[:, None, :]
+    quantiles2 = np.stack([sketch.quantiles() for sketch in sketches2])[None, :, :]
+    min1, max1 = np.array([sketch.min for sketch in sketches1])[:, None], np.array([sketch.max for sketch in sketches1])[:, None]
+    min2, max2 = np.array([sketch.min for sketch in sketches2])[None, :], np.array([sketch.max for sketch in sketches2])[None, :]
+    span = np.maximum(max1, max2) - np.minimum(min1, min2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distance = np.abs(quantiles1 - quantiles2).mean(axis=2) / span
+    # constant columns are only similar to the same constant
+    distance = np.where(span == 0, 0.0, distance)
+    distribution = np.nan_to_num(1 - distance, nan=0.0)
+    # compare the range classes, and whether the range of one column contains the other
+    classes1 = np.array([sketch.range_class() for sketch in sketches1], dtype=object)[:, None]
+    classes2 = np.array([sketch.range_class() for sketch in sketches2], dtype=object)[None, :]
+    same = (classes1 == classes2) & (classes1 != None)
+    nested = ((min1 <= min2) & (max2 <= max1)) | ((min2 <= min1) & (max1 <= max2))
+    empty = np.array([sketch.empty for sketch in sketches1])[:, None] | np.array([sketch.empty for sketch in sketches2])[None, :]
+    nested &= ~empty
+    range_similarity = np.where(same, 1.0, np.where(nested, 0.5, 0.0))
+    return distribution, range_similarity
@@ -0,0 +1,44 @@
+from transformer.derive import derive_dataframe, haversine
+from transformer.geocode import LocalGeocoder, Geocoder
+import numpy as np
+import pandas as pd
+import unittest
+
+
+class DeriveTests(unittest.TestCase):
+    def test_haversine(self):
+        # a degree of latitude is about 111.2 km
+        self.assertAlmostEqual(float(haversine([47.0], [19.0], [48.0], [19.0])[0]), 111.19, places=1)
+        self.assertEqual(float(haversine([47.0], [19.0], [47.0], [19.0])[0]), 0)
+
+    def test_distance_and_duration_from_the_other_columns(self):
+        trips = pd.DataFrame({
+            'started_at': pd.to_datetime(['2020-01-01 08:00', '2020-01-01 09:00']),
+            'ended_at': pd.to_datetime(['2020-01-01 08:30', None]),
+            'duration': [np.nan, 600],
+            'start_location_lat': [47.0, 47.0], 'start_location_lon': [19.0, 19.0],
+            'end_location_lat': [48.0, 47.0], 'end_location_lon': [19.0, 19.0],
+            'distance': [np.nan, 5.0],
+        })
+        derived = derive_dataframe(trips)
+        self.assertAlmostEqual(derived.loc[0, 'distance'], 111.19, places=1)
+        # the values present are kept
+        self.assertEqual(derived.loc[1, 'distance'], 5.0)
+        self.assertEqual(derived.loc[0, 'duration'], 1800)
+        self.assertEqual(pd.Timestamp(derived.loc[1, 'ended_at']), pd.Timestamp('2020-01-01 09:10'))
+        # the input is not changed
+        self.assertTrue(np.isnan(trips.loc[0, 'distance']))
+
+    def test_coordinates_and_addresses_are_geocoded(self):
+        geocoder = Geocoder(LocalGeocoder({'Oktogon': (47.5054, 19.0637), 'Deák tér': (47.4977, 19.0543)}), max_workers=1)
+        trips = pd.DataFrame({
+            'start_location_address': ['Oktogon', None],
+            'start_location_lat': [np.nan, 47.4977], 'start_location_lon': [np.nan, 19.0543],
+        })
+        derived = derive_dataframe(trips, geocoder=geocoder)
+        self.assertEqual(derived[['start_location_lat', 'start_location_lon']].loc[0].tolist(), [47.5054, 19.0637])
+        self.assertEqual(derived.loc[1, 'start_location_address'], 'Deák tér')
+
+    def test_columns_outside_the_schema_are_not_added(self):
+        vehicles = pd.DataFrame({'external_id': [1], 'name': ['van']})
+        self.assertEqual(derive_dataframe(vehicles).columns.tolist(), ['external_id', 'name'])
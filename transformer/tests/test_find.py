@@ -0,0 +1,137 @@
+from transformer.find import find_features, block_columns, block_features, prepare_dataframe, resolve_columns, \
+    filter_columns, match_clues
+from transformer.similarity import FEATURES, profile_columns, normalize_name, lexical_similarity
+import numpy as np
+import pandas as pd
+import unittest
+
+
+class BlockColumnsTests(unittest.TestCase):
+    def setUp(self):
+        self.dataframe = pd.DataFrame({
+            'license_plate_number': ['AB-123', 'CD-456', 'EF-789'],
+            'Mileage': [1200.5, 3400.0, 560.25],
+            'Car make': ['Ford', 'Opel', 'Fiat'],
+        })
+        self.example = pd.DataFrame({
+            'license_plate_number': ['XY-987', 'ZW-654'],
+            'distance': [10.5, 22.0],
+            'make_name': ['Volkswagen', 'Skoda'],
+        })
+
+    def test_resolved_columns_are_not_candidates(self):
+        profiles, example_profiles = profile_columns(self.dataframe), profile_columns(self.example)
+        resolved = [{'column': 'license_plate_number', 'example_column': 'license_plate_number', 'similarity': 1.0,
+            'tier': 'exact'}]
+        candidates = block_columns(profiles, example_profiles, np.zeros((3, 3, len(FEATURES))), resolved,
+            {'blocking_top_k': 0})
+        self.assertFalse(candidates[0].any())
+        self.assertFalse(candidates[:, 0].any())
+        # the other columns are all compatible
+        self.assertTrue(candidates[1:, 1:].all())
+
+    def test_block_features_again(self):
+        prepared = prepare_dataframe(self.dataframe)
+        features = find_features(prepared, self.example, params={'blocking_top_k': 0}, resolve=False)
+        # nothing is resolved, and every pair is scored
+        self.assertEqual(features['resolved'], [])
+        self.assertTrue(features['candidates'][1:, 1:].any())
+        blocked = block_features(features, {'blocking_top_k': 0})
+        resolved = find_features(prepared, self.example, params={'blocking_top_k': 0})
+        self.assertEqual(blocked['resolved'], resolved['resolved'])
+        np.testing.assert_array_equal(blocked['candidates'], resolved['candidates'])
+        self.assertIn('license_plate_number', [match['column'] for match in blocked['resolved']])
+
+
+class ResolveColumnsTests(unittest.TestCase):
+    def test_lexical_similarity(self):
+        self.assertEqual(normalize_name('license_plate-number '), 'license plate number')
+        similarities = lexical_similarity(['license plate number', 'make'], ['license plate number', 'plate', 'model'])
+        self.assertEqual(similarities.shape, (2, 3))
+        self.assertEqual(similarities[0, 0], 1.0)
+        self.assertTrue(0 < similarities[0, 1] < 1)
+        self.assertEqual(similarities[1, 2], 0.0)
+        self.assertEqual(lexical_similarity([], ['make']).shape, (0, 1))
+
+    def test_names_are_resolved_exactly_then_lexically(self):
+        profiles = profile_columns(pd.DataFrame({
+            'License Plate Number': ['AB-123', 'CD-456', 'EF-789'],
+            'car make name': ['Ford', 'Opel', 'Fiat'],
+            'odometer': [1200.5, 3400.0, 560.25],
+        }))
+        example_profiles = profile_columns(pd.DataFrame({
+            'license_plate_number': ['XY-987', 'ZW-654'],
+            'make_name': ['Volkswagen', 'Skoda'],
+            'distance': [10.5, 22.0],
+        }))
+        resolved = {match['column']: match for match in resolve_columns(profiles, example_profiles)}
+        self.assertEqual(resolved['License Plate Number']['example_column'], 'license_plate_number')
+        self.assertEqual(resolved['License Plate Number']['tier'], 'exact')
+        self.assertEqual(resolved['car make name']['example_column'], 'make_name')
+        self.assertEqual(resolved['car make name']['tier'], 'lexical')
+        # names that are not alike are left to the model
+        self.assertNotIn('odometer', resolved)
+        # unless the lexical matches must be closer
+        resolved = resolve_columns(profiles, example_profiles, {'min_similarity_lexical': 0.9})
+        self.assertEqual([match['tier'] for match in resolved], ['exact'])
+
+    def test_ambiguous_and_datetime_names_are_not_resolved(self):
+        profiles = profile_columns(pd.DataFrame({
+            'start time': pd.to_datetime(['2020-01-01 08:00', '2020-01-02 09:30']),
+            'plate': ['AB-123', 'CD-456'],
+        }))
+        example_profiles = profile_columns(pd.DataFrame({
+            'start_time': pd.to_datetime(['2021-05-01 07:00', '2021-05-02 08:00']),
+            'plate_front': ['XY-987', 'ZW-654'],
+            'plate_back': ['XY-987', 'ZW-654'],
+        }))
+        self.assertEqual(resolve_columns(profiles, example_profiles), [])
+
+
+class CluesTests(unittest.TestCase):
+    def setUp(self):
+        self.dataframe = pd.DataFrame({
+            'Car ID': ['1', '2'],
+            'Rendszám': ['AB-123', 'CD-456'],
+            'Driver name': ['Con Loddon', 'Nilson Doornbos'],
+            'Owner name': ['Acme', 'Globex'],
+            'Amount of trips': [401, 109],
+        })
+
+    def test_filter_columns(self):
+        filtered = filter_columns(self.dataframe, {'ignore_columns': 'amount_of_trips, Owner Name'})
+        self.assertEqual(list(filtered.columns), ['Car ID', 'Rendszám', 'Driver name'])
+        filtered = filter_columns(self.dataframe, {'ignore_columns': ['car id'], 'use_columns': 'Car ID,rendszám'})
+        self.assertEqual(list(filtered.columns), ['Rendszám'])
+        self.assertEqual(list(filter_columns(self.dataframe, {'use_columns': ''}).columns), list(self.dataframe.columns))
+
+    def test_clues_pin_or_narrow_the_columns(self):
+        clues = {'columns': {
+            # the name of a column, before its translation
+            'license_plate_number': 'rendszám',
+            # a word of the names of the candidates
+            'name': ['name'],
+            # clues of columns that are not in the example, or that point to no column, are ignored
+            'vin': 'chassis',
+            'unknown': 'car id',
+        }}
+        matches = match_clues(self.dataframe, ['external_id', 'license_plate_number', 'name', 'vin'], clues)
+        self.assertEqual(matches, [
+            {'column': 'Rendszám', 'example_column': 'license_plate_number', 'pinned': True},
+            {'column': 'Driver name', 'example_column': 'name', 'pinned': False},
+            {'column': 'Owner name', 'example_column': 'name', 'pinned': False},
+        ])
+
+    def test_pinned_columns_are_resolved_and_the_others_narrowed(self):
+        example = pd.DataFrame({'license_plate_number': ['XY-987', 'ZW-654'], 'name': ['László', 'Anna'],
+            'make_name': ['Volkswagen', 'Skoda']})
+        clues = match_clues(self.dataframe, example.columns,
+            {'columns': {'license_plate_number': 'Rendszám', 'name': 'driver'}})
+        features = find_features(prepare_dataframe(self.dataframe), example, params={'blocking_top_k': 0},
+            clues=clues)
+        self.assertIn({'column': 'Rendszám', 'example_column': 'license_plate_number', 'similarity': 1.0,
+            'tier': 'clue'}, features['resolved'])
+        # the name is only a candidate of the driver name
+        name = features['example_profiles'].index.get_loc('name')
+        candidates = features['profiles'].index[features['candidates'][:, name]]
+        self.assertEqual(list(candidates), ['Driver name'])
@@ -0,0 +1,72 @@
+from transformer.geocode import LocalGeocoder, Geocoder, OfflineReverseGeocoder, compile_gazetteer
+import numpy as np
+import os
+import pandas as pd
+import tempfile
+import unittest
+
+
+LOCATIONS = {
+    'Andrássy út 1, Budapest': (47.4990, 19.0560),
+    'Váci utca 10, Budapest': (47.4950, 19.0520),
+}
+
+
+class GeocoderTests(unittest.TestCase):
+    def setUp(self):
+        self.geolocator = LocalGeocoder(LOCATIONS)
+        self.geocoder = Geocoder(self.geolocator, max_workers=1)
+
+    def test_locations_geocode_each_address_once(self):
+        addresses = pd.Series(['Andrássy út 1, Budapest', 'Váci utca 10, Budapest', 'Andrássy út 1, Budapest', 'nowhere'],
+            index=[10, 11, 12, 13])
+        locations = self.geocoder.locations(addresses)
+        self.assertEqual(self.geolocator.calls, 3)
+        self.assertEqual(locations.index.tolist(), [10, 11, 12, 13])
+        self.assertEqual(tuple(locations.loc[12]), LOCATIONS['Andrássy út 1, Budapest'])
+        self.assertTrue(locations.loc[13].isnull().all())
+        # the next calls are answered from the cache
+        self.geocoder.locations(addresses)
+        self.assertEqual(self.geolocator.calls, 3)
+
+    def test_addresses_round_the_coordinates(self):
+        latitudes = pd.Series([47.49901, 47.49899, 47.4950, np.nan])
+        longitudes = pd.Series([19.05601, 19.05599, 19.0520, 19.0])
+        addresses = self.geocoder.addresses(latitudes, longitudes)
+        self.assertEqual(addresses.tolist(),
+            ['Andrássy út 1, Budapest', 'Andrássy út 1, Budapest', 'Váci utca 10, Budapest', ''])
+        # the first two coordinates are the same once rounded
+        self.assertEqual(self.geolocator.calls, 2)
+
+
+class OfflineReverseGeocoderTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        # the same address at both ends of a street, and an address across the antimeridian
+        pd.DataFrame({
+            'latitude': [47.4990, 47.5010, 47.4950, -16.0000],
+            'longitude': [19.0560, 19.0580, 19.0520, 179.9999],
+            'address': ['Andrássy út', 'Andrássy út', 'Váci utca 10', 'Rabi Island'],
+        }).to_csv(os.path.join(self.directory.name, 'gazetteer.csv'), index=False)
+        compile_gazetteer(os.path.join(self.directory.name, 'gazetteer.csv'), os.path.join(self.directory.name, 'compiled'))
+        self.fallback = Geocoder(LocalGeocoder({'Oktogon': (47.5054, 19.0637)}), max_workers=1)
+        self.geocoder = OfflineReverseGeocoder(os.path.join(self.directory.name, 'compiled'), max_distance=250,
+            fallback=self.fallback)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_addresses_are_the_nearest_entries(self):
+        latitudes = pd.Series([47.5009, 47.4951, -16.0000, 48.0, np.nan])
+        longitudes = pd.Series([19.0579, 19.0521, -179.9999, 19.0, 19.0])
+        addresses = self.geocoder.addresses(latitudes, longitudes)
+        # the coordinates far from every entry are sent to the fallback
+        self.assertEqual(addresses.tolist(), ['Andrássy út', 'Váci utca 10', 'Rabi Island', 'Oktogon', ''])
+
+    def test_locations_of_repeated_addresses(self):
+        locations = self.geocoder.locations(pd.Series(['Váci utca 10', 'Andrássy út', 'Oktogon', 'Andrássy út']))
+        self.assertAlmostEqual(locations.loc[0, 'latitude'], 47.4950)
+        self.assertAlmostEqual(locations.loc[0, 'longitude'], 19.0520)
+        self.assertIn(round(locations.loc[1, 'latitude'], 4), [47.4990, 47.5010])
+        self.assertAlmostEqual(locations.loc[2, 'latitude'], 47.5054)
+        self.assertEqual(locations.loc[3].tolist(), locations.loc[1].tolist())
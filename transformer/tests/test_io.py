@@ -0,0 +1,71 @@
+from transformer.io import infer_datetime_format, parse_datetime_column, to_utc_datetime_column, \
+    to_timedelta_column, format_datetime_columns
+from transformer.find import apply_mapping
+import datetime
+import numpy as np
+import pandas as pd
+import unittest
+
+
+class DatetimeParsingTests(unittest.TestCase):
+    def test_infer_datetime_format(self):
+        # pandas parses every ISO 8601 string with any of the ISO formats
+        sample = pd.Series(['2020-01-31 08:00:00', '2020-02-01 09:30:00'])
+        self.assertEqual(pd.to_datetime(sample, format=infer_datetime_format(sample)).tolist(),
+            [pd.Timestamp('2020-01-31 08:00'), pd.Timestamp('2020-02-01 09:30')])
+        self.assertEqual(infer_datetime_format(pd.Series(['31.01.2020', '01.02.2020'])), '%d.%m.%Y')
+        self.assertEqual(infer_datetime_format(pd.Series(['08:00', '17:45'])), '%H:%M')
+        self.assertIsNone(infer_datetime_format(pd.Series(['first', 'second'])))
+
+    def test_parse_datetime_column(self):
+        parsed = parse_datetime_column(pd.Series(['31/01/2020 08:00', '01/02/2020 09:30']))
+        self.assertEqual(parsed.tolist(), [pd.Timestamp('2020-01-31 08:00'), pd.Timestamp('2020-02-01 09:30')])
+        times = parse_datetime_column(pd.Series(['08:00:00', '17:45:30']))
+        self.assertEqual(times.tolist(), [datetime.time(8), datetime.time(17, 45, 30)])
+        # columns that are not strings of datetimes are left as they are
+        names = pd.Series(['first', 'second'])
+        self.assertTrue(parse_datetime_column(names).equals(names))
+
+
+class DatetimeNormalizationTests(unittest.TestCase):
+    def test_datetimes_are_converted_to_naive_utc(self):
+        column = pd.Series(['2020-01-01T10:00:00+02:00', '2020-01-01T10:00:00+00:00', None])
+        converted = to_utc_datetime_column(column)
+        self.assertIsNone(converted.dt.tz)
+        self.assertEqual(converted[:2].tolist(), [pd.Timestamp('2020-01-01 08:00'), pd.Timestamp('2020-01-01 10:00')])
+        self.assertTrue(pd.isnull(converted[2]))
+        # naive datetimes are already in UTC
+        naive = pd.Series(pd.to_datetime(['2020-01-01 10:00']))
+        self.assertEqual(to_utc_datetime_column(naive)[0], pd.Timestamp('2020-01-01 10:00'))
+        aware = naive.dt.tz_localize('Europe/Budapest')
+        self.assertEqual(to_utc_datetime_column(aware)[0], pd.Timestamp('2020-01-01 09:00'))
+
+    def test_times_are_converted_to_timedeltas(self):
+        expected = [pd.Timedelta(hours=8), pd.Timedelta(hours=17, minutes=45), pd.NaT]
+        for column in (pd.Series(['08:00', '17:45', None]), pd.Series([datetime.time(8), datetime.time(17, 45), None]),
+                pd.Series(pd.to_datetime(['2020-01-01 08:00', '2020-01-02 17:45', None]))):
+            deltas = to_timedelta_column(column)
+            self.assertEqual(deltas.dtype, np.dtype('timedelta64[ns]'))
+            self.assertEqual(deltas[:2].tolist(), expected[:2])
+            self.assertTrue(pd.isnull(deltas[2]))
+
+    def test_dates_and_times_are_combined(self):
+        dataframe = pd.DataFrame({'Date': ['2020-01-31', '2020-02-01'], 'Time': ['08:00', '17:45']})
+        example = pd.DataFrame({'started_at': ['2020-05-27T17:30:34.529Z']})
+        mapping = [{'column': 'Date', 'example_column': 'started_at', 'similarity': 1.0, 'date': True,
+            'time_column': 'Time', 'dtype': 'datetime'}]
+        output = apply_mapping(dataframe, example, mapping)
+        self.assertEqual(output['started_at'].tolist(),
+            [pd.Timestamp('2020-01-31 08:00'), pd.Timestamp('2020-02-01 17:45')])
+
+    def test_datetimes_are_formatted_like_the_trips_format(self):
+        dataframe = pd.DataFrame({
+            'started_at': pd.to_datetime(['2020-05-27 19:30:34.529', None]).tz_localize('Europe/Budapest'),
+            'distance': [1.5, 2.0],
+        })
+        formatted = format_datetime_columns(dataframe)
+        self.assertEqual(formatted['started_at'][0], '2020-05-27T17:30:34.529Z')
+        self.assertTrue(pd.isnull(formatted['started_at'][1]))
+        self.assertEqual(formatted['distance'].tolist(), [1.5, 2.0])
+        # the dataframe is not changed
+        self.assertIsNotNone(dataframe['started_at'].dt.tz)
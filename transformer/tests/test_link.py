@@ -0,0 +1,44 @@
+from transformer.link import link_trips_to_vehicles, normalize_keys
+import numpy as np
+import pandas as pd
+import unittest
+
+
+class LinkTests(unittest.TestCase):
+    def setUp(self):
+        self.vehicles = pd.DataFrame({
+            'external_id': ['1', '2', '3'],
+            'vin': ['WVWZZZ1JZXW000001', 'WVWZZZ1JZXW000002', None],
+            # a license plate shared by two vehicles is not a key
+            'license_plate_number': ['AB-123', 'CD-456', 'cd 456'],
+        })
+
+    def test_normalize_keys(self):
+        keys = normalize_keys(pd.Series(['ab-123', 'AB 123', None, '', 'nan']))
+        self.assertEqual(keys[:2].tolist(), ['AB123', 'AB123'])
+        self.assertTrue(keys[2:].isnull().all())
+        # integer ids read as floats
+        self.assertEqual(normalize_keys(pd.Series([2.0, np.nan])).tolist()[0], '2')
+
+    def test_references_are_resolved(self):
+        trips = pd.DataFrame({'vehicle_external_id': ['wvwzzz1jzxw000001', 'ab 123', 'CD456', 'unknown']})
+        linked = link_trips_to_vehicles(trips, self.vehicles)
+        self.assertEqual(linked['vehicle_external_id'].tolist(), ['1', '1', 'CD456', 'unknown'])
+        # the trips are not changed
+        self.assertEqual(trips['vehicle_external_id'][0], 'wvwzzz1jzxw000001')
+        # integer ids read as floats
+        linked = link_trips_to_vehicles(pd.DataFrame({'vehicle_external_id': [2.0, np.nan]}), self.vehicles)
+        self.assertEqual(linked['vehicle_external_id'][0], '2')
+        self.assertTrue(pd.isnull(linked['vehicle_external_id'][1]))
+
+    def test_unresolved_references_are_dropped(self):
+        trips = pd.DataFrame({'vehicle_external_id': ['AB-123', 'unknown']})
+        linked = link_trips_to_vehicles(trips, self.vehicles, keep_unresolved=False)
+        self.assertEqual(linked['vehicle_external_id'][0], '1')
+        self.assertTrue(pd.isnull(linked['vehicle_external_id'][1]))
+
+    def test_keys_of_higher_priority_win(self):
+        # the id of a vehicle is the license plate of another one
+        vehicles = pd.DataFrame({'external_id': ['AB123', 'X'], 'license_plate_number': ['Y', 'AB-123']})
+        linked = link_trips_to_vehicles(pd.DataFrame({'vehicle_external_id': ['ab123']}), vehicles)
+        self.assertEqual(linked['vehicle_external_id'].tolist(), ['AB123'])
@@ -0,0 +1,147 @@
+from transformer.io import read_dataframe
+from transformer.model import TelematicZapTransformer
+from transformer.translate import set_translator_backend
+from transformer.trace import Tracer
+from transformer import similarity
+import json
+import numpy as np
+import optuna
+import pandas as pd
+import os
+import shutil
+import tempfile
+import unittest
+
+
+# the example files of the repository
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data')
+
+
+class StandInTranslator:
+    # translator that returns the text unchanged, so that the tests do not depend on the network
+    def __init__(self, source='auto', target='en'):
+        pass
+
+    def translate(self, text: str) -> str:
+        return text
+
+
+class ModelTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        set_translator_backend(StandInTranslator)
+        cls.before = read_dataframe(os.path.join(DATA_DIR, 'before', 'example-dataset1.csv'))
+        cls.format = read_dataframe(os.path.join(DATA_DIR, 'format', 'format-example-vehicles.csv'))
+        cls.after = read_dataframe(os.path.join(DATA_DIR, 'after', 'transformed-dataset1.csv'))
+        cls.trips_before = read_dataframe(os.path.join(DATA_DIR, 'before', 'example-dataset2.xls'))
+        cls.trips_format = read_dataframe(os.path.join(DATA_DIR, 'format', 'format-example-trips.csv'))
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+
+class FitTests(ModelTestCase):
+    def test_fit_keeps_the_params_not_optimized(self):
+        transformer = TelematicZapTransformer(derive=False)
+        defaults = dict(transformer.params)
+        transformer.fit([self.before], [self.format], [self.after], n_trials=5, storage=None, batch_size=2)
+        self.assertEqual(set(transformer.params), set(defaults))
+        self.assertEqual(transformer.params['blocking_top_k'], defaults['blocking_top_k'])
+        self.assertNotEqual(transformer.params, defaults)
+
+    def test_parallel_fit_shares_the_study(self):
+        storage = f'sqlite:///{os.path.join(self.tmp, "optuna.db")}'
+        transformer = TelematicZapTransformer(derive=False)
+        transformer.fit([self.before], [self.format], [self.after], n_trials=6, n_jobs=2, storage=storage,
+            study_name='test', batch_size=2)
+        study = optuna.load_study(study_name='test', storage=storage)
+        self.assertEqual(len(study.trials), 6)
+        self.assertTrue(all(trial.state.is_finished() for trial in study.trials))
+
+    def test_parallel_fit_needs_a_storage(self):
+        with self.assertRaises(AssertionError):
+            TelematicZapTransformer().fit([self.before], [self.format], [self.after], n_trials=2, n_jobs=2,
+                storage=None)
+
+
+class ArtifactTests(ModelTestCase):
+    def test_saved_transformer_is_loaded(self):
+        transformer = TelematicZapTransformer()
+        transformer.params['min_similarity_column'] = 0.3
+        transformer.save(self.tmp, formats_examples=[self.format])
+        with open(os.path.join(self.tmp, 'transformer.json')) as f:
+            # the names of the columns are encoded as words
+            self.assertIn('external id', json.load(f)['vocabulary'])
+        # a new worker encodes none of the strings saved
+        embeddings = dict(similarity.embeddings)
+        similarity.embeddings.clear()
+        try:
+            loaded = TelematicZapTransformer.load(self.tmp, derive=False)
+            self.assertEqual(loaded.params, transformer.params)
+            self.assertFalse(loaded.derive)
+            self.assertEqual(set(similarity.embeddings), set(embeddings))
+            np.testing.assert_allclose(similarity.embeddings['external id'], embeddings['external id'], rtol=1e-6)
+        finally:
+            similarity.embeddings.update(embeddings)
+
+    def test_parameters_missing_from_the_artifact_keep_their_defaults(self):
+        transformer = TelematicZapTransformer()
+        transformer.params['min_similarity_column'] = 0.3
+        transformer.save(self.tmp)
+        path = os.path.join(self.tmp, 'transformer.json')
+        with open(path) as f:
+            artifact = json.load(f)
+        del artifact['params']['blocking_top_k']
+        with open(path, 'w') as f:
+            json.dump(artifact, f)
+        loaded = TelematicZapTransformer.load(self.tmp)
+        self.assertEqual(loaded.params['min_similarity_column'], 0.3)
+        self.assertEqual(loaded.params['blocking_top_k'], TelematicZapTransformer().params['blocking_top_k'])
+
+    def test_transformer_of_another_version_is_rejected(self):
+        TelematicZapTransformer().save(self.tmp)
+        path = os.path.join(self.tmp, 'transformer.json')
+        with open(path) as f:
+            artifact = json.load(f)
+        with open(path, 'w') as f:
+            json.dump({**artifact, 'version': 1}, f)
+        with self.assertRaises(ValueError):
+            TelematicZapTransformer.load(self.tmp)
+
+    def test_transformer_of_another_encoder_is_rejected(self):
+        TelematicZapTransformer().save(self.tmp)
+        path = os.path.join(self.tmp, 'transformer.json')
+        with open(path) as f:
+            artifact = json.load(f)
+        with open(path, 'w') as f:
+            json.dump({**artifact, 'encoder': 'another-model'}, f)
+        with self.assertRaises(ValueError):
+            TelematicZapTransformer.load(self.tmp)
+
+
+class TransformManyTests(ModelTestCase):
+    def setUp(self):
+        super().setUp()
+        self.datasets = [(self.before, self.format), (self.trips_before, self.trips_format),
+            (self.before.iloc[:10], self.format)]
+
+    def assertSameTransformed(self, transformed_list):
+        transformer = TelematicZapTransformer()
+        for (dataframe, example_dataframe), transformed in zip(self.datasets, transformed_list):
+            expected = transformer.transform(dataframe, example_dataframe)
+            # the similarities vary with the samples of values, the columns matched do not
+            self.assertEqual([(match['column'], match['example_column']) for match in transformed.attrs['mapping']],
+                [(match['column'], match['example_column']) for match in expected.attrs['mapping']])
+            pd.testing.assert_frame_equal(transformed, expected)
+
+    def test_transform_many_transforms_each_dataset(self):
+        tracer = Tracer()
+        transformed_list = TelematicZapTransformer(tracer=tracer).transform_many(self.datasets)
+        self.assertEqual(len(transformed_list), len(self.datasets))
+        self.assertSameTransformed(transformed_list)
+        # the strings of all the datasets are encoded in a single batch
+        self.assertLessEqual(tracer.counts['encoder_calls'], 1)
+
+    def test_transform_many_in_worker_processes(self):
+        self.assertSameTransformed(TelematicZapTransformer().transform_many(self.datasets, n_jobs=2))
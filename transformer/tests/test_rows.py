@@ -0,0 +1,41 @@
+from transformer.rows import hash_rows, new_rows, RowDeduplicator
+import numpy as np
+import pandas as pd
+import unittest
+
+
+class HashRowsTests(unittest.TestCase):
+    def test_same_rows_have_the_same_hashes(self):
+        dataframe = pd.DataFrame({'id': [1, 2], 'name': ['first', 'second']})
+        # whatever the order of the columns
+        np.testing.assert_array_equal(hash_rows(dataframe), hash_rows(dataframe[['name', 'id']]))
+        self.assertNotEqual(hash_rows(dataframe)[0], hash_rows(dataframe)[1])
+
+    def test_new_rows(self):
+        hashes = hash_rows(pd.DataFrame({'id': [1, 2, 3]}))
+        np.testing.assert_array_equal(new_rows(hashes, np.sort(hashes[:2])), [False, False, True])
+        np.testing.assert_array_equal(new_rows(hashes, np.zeros(0, dtype=np.uint64)), [True, True, True])
+
+
+class RowDeduplicatorTests(unittest.TestCase):
+    def test_duplicates_within_and_across_chunks_are_dropped(self):
+        deduplicator = RowDeduplicator()
+        first = deduplicator.update(pd.DataFrame({'id': ['a', 'b', 'a'], 'value': [1, 2, 1]}))
+        self.assertEqual(first['id'].tolist(), ['a', 'b'])
+        second = deduplicator.update(pd.DataFrame({'id': ['b', 'c'], 'value': [2, 3]}))
+        self.assertEqual(second['id'].tolist(), ['c'])
+        self.assertEqual(deduplicator.dropped, 2)
+
+    def test_dtypes_of_the_chunks_do_not_matter(self):
+        deduplicator = RowDeduplicator()
+        deduplicator.update(pd.DataFrame({'id': [1, 2], 'code': [10, 20]}))
+        # a missing value makes the ids floats, and a code makes the codes strings
+        chunk = pd.DataFrame({'id': [1, 2, np.nan], 'code': [10, 20, 'x']})
+        self.assertEqual(chunk['id'].dtype, np.float64)
+        self.assertEqual(len(deduplicator.update(chunk)), 1)
+
+    def test_rows_seen_by_a_previous_deduplicator_are_dropped(self):
+        previous = RowDeduplicator()
+        previous.update(pd.DataFrame({'id': ['a', 'b']}))
+        deduplicator = RowDeduplicator(previous.seen_hashes)
+        self.assertEqual(deduplicator.update(pd.DataFrame({'id': ['b', 'c']}))['id'].tolist(), ['c'])
@@ -0,0 +1,47 @@
+from transformer.segment import segment_trips, segment_trips_chunked
+import numpy as np
+import pandas as pd
+import unittest
+
+
+def points(vehicle, start, minutes, latitudes):
+    return pd.DataFrame({
+        'vehicle_external_id': vehicle,
+        'timestamp': pd.to_datetime(start) + pd.to_timedelta(minutes, unit='min'),
+        'latitude': latitudes,
+        'longitude': 19.0,
+    })
+
+
+class SegmentTests(unittest.TestCase):
+    def setUp(self):
+        self.points = pd.concat([
+            # two trips of 10 km, with a stop of an hour between them
+            points('a', '2020-01-01 08:00', [0, 5, 10], [47.0, 47.045, 47.09]),
+            points('a', '2020-01-01 09:10', [0, 5, 10], [47.09, 47.045, 47.0]),
+            # a vehicle that does not move
+            points('b', '2020-01-01 08:00', [0, 5, 10], [47.5, 47.5, 47.5]),
+        ], ignore_index=True)
+
+    def test_trips_split_at_idle_gaps(self):
+        trips = segment_trips(self.points)
+        self.assertEqual(trips['vehicle_external_id'].tolist(), ['a', 'a'])
+        self.assertEqual(pd.to_datetime(trips['started_at']).tolist(),
+            [pd.Timestamp('2020-01-01 08:00'), pd.Timestamp('2020-01-01 09:10')])
+        self.assertEqual(pd.to_datetime(trips['ended_at']).tolist(),
+            [pd.Timestamp('2020-01-01 08:10'), pd.Timestamp('2020-01-01 09:20')])
+        self.assertTrue(((trips['distance'] > 9) & (trips['distance'] < 11)).all())
+
+    def test_chunks_give_the_same_trips(self):
+        # a trip continues across the chunks
+        chunks = [self.points.iloc[:2], self.points.iloc[2:5], self.points.iloc[5:]]
+        trips = pd.concat(segment_trips_chunked(chunks), ignore_index=True)
+        expected = segment_trips(self.points)
+        self.assertEqual(trips['vehicle_external_id'].tolist(), expected['vehicle_external_id'].tolist())
+        self.assertEqual(pd.to_datetime(trips['started_at']).tolist(), pd.to_datetime(expected['started_at']).tolist())
+        np.testing.assert_allclose(trips['distance'].to_numpy(dtype=float), expected['distance'].to_numpy(dtype=float))
+
+    def test_thresholds(self):
+        trips = segment_trips(self.points, params={'segment_idle_gap': 7200, 'segment_min_distance': 0})
+        # the stop is shorter than the idle gap, and the vehicle that does not move makes a trip
+        self.assertEqual(trips['vehicle_external_id'].tolist(), ['a', 'b'])
@@ -0,0 +1,79 @@
+from transformer.similarity import FEATURES, column_profiles, similarity_features, combine_similarity_features, \
+    stack_params, similarity_columns, profile_columns, column_kinds, candidate_pairs
+import numpy as np
+import pandas as pd
+import unittest
+
+
+class SimilarityFeaturesTests(unittest.TestCase):
+    def setUp(self):
+        self.dataframe = pd.DataFrame({
+            'Vehicle ID': ['V1', 'V2', 'V3', 'V4'],
+            'Mileage': [1200.5, 3400.0, 560.25, 9800.0],
+            'Start time': pd.to_datetime(['2020-01-01 08:00', '2020-01-02 09:30', '2020-01-03 10:00', '2020-01-04 11:15']),
+        })
+        self.example = pd.DataFrame({
+            'external_id': ['A', 'B', 'C'],
+            'distance': [10.5, 22.0, 7.25],
+            'started_at': pd.to_datetime(['2021-05-01 07:00', '2021-05-02 08:00', '2021-05-03 09:00']),
+        })
+        self.features = similarity_features(column_profiles(self.dataframe), column_profiles(self.example))
+
+    def test_features_of_every_pair(self):
+        self.assertEqual(self.features.shape, (3, 3, len(FEATURES)))
+        # the datetimes are typed as dates, and the mileage and distance are both numeric
+        self.assertTrue(self.features[2, 2, FEATURES.index('date_typed1')] > 0)
+        self.assertTrue(self.features[1, 1, FEATURES.index('numeric')] > 0)
+        self.assertFalse(self.features[0, 1, FEATURES.index('numeric')] > 0)
+
+    def test_stacked_params_give_the_similarities_of_each_set(self):
+        params_list = [{'weight_id_similarity_name': 0.6, 'min_similarity_date': 0.5},
+            {'weight_id_similarity_name': 0.1, 'min_similarity_date': 0.9, 'weight_numeric_similarity_name': 0.3}]
+        # missing parameters take their defaults, so only the shared ones are stacked
+        self.assertEqual(set(stack_params(params_list)), {'weight_id_similarity_name', 'min_similarity_date'})
+        params_list[0]['weight_numeric_similarity_name'] = 0.7
+        similarities = combine_similarity_features(self.features, stack_params(params_list))
+        self.assertEqual(similarities.shape, (2, 3, 3))
+        for params, stacked_similarities in zip(params_list, similarities):
+            np.testing.assert_allclose(stacked_similarities, combine_similarity_features(self.features, params))
+
+    def test_similarity_of_two_columns(self):
+        params = {'weight_numeric_similarity_name': 0.5}
+        self.assertAlmostEqual(similarity_columns(self.dataframe['Mileage'], self.example['distance'], params),
+            combine_similarity_features(self.features[1, 1], params).item())
+
+
+class BlockingTests(unittest.TestCase):
+    def setUp(self):
+        self.profiles = profile_columns(pd.DataFrame({
+            'started': pd.to_datetime(['2020-01-01 08:00', '2020-01-02 09:30', '2020-01-03 10:00']),
+            'mileage': [1200.5, 3400.0, 560.25],
+            'address': ['1 Main Street, Springfield', '22 Oak Avenue, Shelbyville', '3 Elm Road, Ogdenville'],
+            'plate': ['AB-123', 'CD-456', 'EF-789'],
+        }))
+
+    def test_column_kinds(self):
+        self.assertEqual(column_kinds(self.profiles).tolist(), ['datetime', 'numeric', 'text', 'other'])
+
+    def test_incompatible_kinds_are_not_candidates(self):
+        features = np.zeros((4, 4, len(FEATURES)))
+        candidates = candidate_pairs(self.profiles, self.profiles, features, {'blocking_top_k': 0})
+        np.testing.assert_array_equal(candidates, [
+            [True, False, False, False],
+            [False, True, False, True],
+            [False, False, True, True],
+            [False, True, True, True],
+        ])
+
+    def test_only_the_most_similar_names_are_candidates(self):
+        features = np.zeros((4, 4, len(FEATURES)))
+        # the plate is the most similar to every column, then the address
+        features[..., FEATURES.index('name_similarity')] = np.array([0.1, 0.2, 0.5, 0.9])[:, None]
+        candidates = candidate_pairs(self.profiles, self.profiles, features, {'blocking_top_k': 1})
+        np.testing.assert_array_equal(candidates, [
+            [True, False, False, False],
+            [False, False, False, False],
+            [False, False, False, False],
+            [False, True, True, True],
+        ])
+        self.assertEqual(candidate_pairs(self.profiles, self.profiles, features, {'blocking_top_k': 2}).sum(), 7)
@@ -0,0 +1,85 @@
+from transformer.sketch import ValueSketch, sketch_similarity, NumericSketch, numeric_similarity
+import numpy as np
+import pandas as pd
+import unittest
+
+
+class ValueSketchTests(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.makes = pd.Series(rng.choice(['Ford', 'Opel', 'Fiat', 'Skoda', 'Volkswagen', 'Toyota'], 500))
+        self.cities = pd.Series(rng.choice(['Budapest', 'Vienna', 'Prague', 'Warsaw', 'Berlin'], 500))
+
+    def test_chunks_give_the_sketch_of_the_whole_column(self):
+        whole = ValueSketch().update(self.makes)
+        chunked = ValueSketch()
+        for start in range(0, len(self.makes), 100):
+            chunked.update(self.makes[start:start + 100])
+        np.testing.assert_array_equal(chunked.signature, whole.signature)
+        merged = ValueSketch().update(self.makes[:250]).merge(ValueSketch().update(self.makes[250:]))
+        np.testing.assert_array_equal(merged.signature, whole.signature)
+        self.assertEqual(set(merged.top()), set(whole.top()))
+        self.assertEqual(set(whole.top()), {'ford', 'opel', 'fiat', 'skoda', 'volkswagen', 'toyota'})
+
+    def test_similarity_of_the_values(self):
+        makes, cities = ValueSketch().update(self.makes), ValueSketch().update(self.cities)
+        # the same values, in other case and order
+        other_makes = ValueSketch().update(self.makes.str.upper().sample(frac=1, random_state=0))
+        similarities = sketch_similarity([makes, cities], [other_makes, cities, ValueSketch()])
+        self.assertEqual(similarities.shape, (2, 3))
+        np.testing.assert_allclose(similarities[:, :2], [[1, 0], [0, 1]])
+        # an empty sketch is not similar to anything
+        np.testing.assert_array_equal(similarities[:, 2], [0, 0])
+        self.assertTrue(ValueSketch().update(pd.Series([None, np.nan], dtype=object)).empty)
+        self.assertEqual(sketch_similarity([], [makes]).shape, (0, 1))
+
+    def test_partial_overlap_is_estimated(self):
+        # 5 of the 15 distinct words are shared, a Jaccard index of 1/3
+        first = ValueSketch(num_perm=256).update(pd.Series([f'word{i}' for i in range(10)]))
+        second = ValueSketch(num_perm=256).update(pd.Series([f'word{i}' for i in range(5, 15)]))
+        self.assertAlmostEqual(sketch_similarity([first], [second])[0, 0], 1 / 3, delta=0.1)
+
+
+class NumericSketchTests(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.values = pd.Series(rng.normal(50, 10, 10000))
+
+    def test_quantiles_are_estimated_in_one_pass(self):
+        chunked = NumericSketch()
+        for start in range(0, len(self.values), 1000):
+            chunked.update(self.values[start:start + 1000])
+        merged = NumericSketch().update(self.values[:5000]).merge(NumericSketch().update(self.values[5000:]))
+        expected = self.values.quantile([0.05, 0.5, 0.95]).to_numpy()
+        for sketch in (chunked, merged):
+            self.assertEqual(sketch.count, len(self.values))
+            self.assertLessEqual(len(sketch.centroids), sketch.size)
+            self.assertEqual((sketch.min, sketch.max), (self.values.min(), self.values.max()))
+            np.testing.assert_allclose(sketch.quantiles(np.array([0.05, 0.5, 0.95])), expected, atol=0.5)
+        # missing and infinite values are ignored
+        self.assertEqual(NumericSketch().update(pd.Series([1.0, np.nan, np.inf])).count, 1)
+        self.assertTrue(np.isnan(NumericSketch().quantiles()).all())
+
+    def test_range_classes(self):
+        self.assertEqual(NumericSketch().update(pd.Series([0.1, 0.9])).range_class(), 'ratio')
+        self.assertEqual(NumericSketch().update(pd.Series([47.5, -33.9])).range_class(), 'latitude')
+        self.assertEqual(NumericSketch().update(pd.Series([19.04, -151.2])).range_class(), 'longitude')
+        self.assertEqual(NumericSketch().update(pd.Series([3, 401])).range_class(), 'count')
+        self.assertEqual(NumericSketch().update(pd.Series([-3, 401])).range_class(), 'integer')
+        self.assertEqual(NumericSketch().update(pd.Series([1200.5, 3400.0])).range_class(), 'positive')
+        self.assertEqual(NumericSketch().update(pd.Series([-1200.5, 3400.0])).range_class(), 'signed')
+        self.assertIsNone(NumericSketch().range_class())
+
+    def test_similarity_of_signed_distributions(self):
+        rng = np.random.default_rng(1)
+        longitudes = NumericSketch().update(pd.Series(rng.uniform(-20, 20, 1000)))
+        other_longitudes = NumericSketch().update(pd.Series(rng.uniform(-20, 20, 1000)))
+        distances = NumericSketch().update(pd.Series(rng.uniform(100, 5000, 1000)))
+        distribution, range_similarity = numeric_similarity([longitudes], [other_longitudes, distances, NumericSketch()])
+        self.assertGreater(distribution[0, 0], 0.9)
+        self.assertLess(distribution[0, 1], 0.6)
+        np.testing.assert_array_equal(range_similarity, [[1.0, 0.0, 0.0]])
+        self.assertEqual(distribution[0, 2], 0)
+        # a constant is only similar to the same constant
+        constant = NumericSketch().update(pd.Series([5.0, 5.0]))
+        self.assertEqual(numeric_similarity([constant], [constant])[0][0, 0], 1)
@@ -0,0 +1,48 @@
+from transformer.model import TelematicZapTransformer
+from transformer.trace import Tracer, NullTracer, tracing, current_tracer
+from .test_model import ModelTestCase
+import json
+import unittest
+
+
+class TracerTests(unittest.TestCase):
+    def test_records_are_passed_to_the_callbacks(self):
+        events = []
+        tracer = Tracer(callbacks=[lambda *event: events.append(event)])
+        with tracer.stage('read'):
+            tracer.count('encoder_calls')
+        tracer.count('encoder_calls', 2)
+        tracer.match('Vehicle ID', 'external_id', 0.9)
+        self.assertEqual([event[:2] for event in events],
+            [('count', 'encoder_calls'), ('stage', 'read'), ('count', 'encoder_calls'),
+            ('match', ('Vehicle ID', 'external_id'))])
+        summary = tracer.summary()
+        self.assertEqual(summary['counts'], {'encoder_calls': 3})
+        self.assertEqual(summary['mapping'], [{'column': 'Vehicle ID', 'example_column': 'external_id', 'similarity': 0.9}])
+        self.assertGreaterEqual(summary['durations']['read'], 0)
+        json.dumps(summary)
+
+    def test_tracing_sets_the_current_tracer(self):
+        self.assertIsInstance(current_tracer(), NullTracer)
+        tracer = Tracer()
+        with tracing(tracer):
+            self.assertIs(current_tracer(), tracer)
+            current_tracer().count('geocoder_calls')
+        self.assertIsInstance(current_tracer(), NullTracer)
+        self.assertEqual(tracer.counts['geocoder_calls'], 1)
+
+    def test_null_tracer_records_nothing(self):
+        tracer = NullTracer()
+        with tracer.stage('read'):
+            tracer.count('encoder_calls')
+        tracer.match('Vehicle ID', 'external_id', 0.9)
+        self.assertEqual(tracer.summary(), {'durations': {}, 'counts': {}, 'mapping': []})
+
+
+class TransformTracingTests(ModelTestCase):
+    def test_transform_records_its_stages_and_mapping(self):
+        tracer = Tracer()
+        transformed = TelematicZapTransformer(tracer=tracer).transform(self.before, self.format)
+        self.assertTrue({'translation', 'similarity', 'derive'} <= set(tracer.durations))
+        self.assertEqual(len(tracer.mapping), len(transformed.attrs['mapping']))
+        self.assertIsInstance(current_tracer(), NullTracer)
@@ -0,0 +1,109 @@
+# functions for instrumenting the transformation stages
+
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+
+logger = logging.getLogger(__name__)
+
+
+class Tracer:
+    """
+    Records what happens during a transformation: the duration of each stage,
+    counters (encoder, translator and geocoder calls, cache hits, ...) and the columns matched.
+    Every record is also passed to the callbacks, as callback(event, name, value).
+
+    Args:
+        callbacks (list): functions called with (event, name, value) for every record,
+            where event is 'stage', 'count' or 'match'
+    """
+    enabled = True
+
+    def __init__(self, callbacks=[]):
+        self.callbacks = list(callbacks)
+        self.durations = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.mapping = []
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.timing(name, time.perf_counter() - start)
+
+    def timing(self, name: str, duration: float):
+        self.durations[name] += duration
+        logger.debug('stage %s took %.3fs', name, duration, extra={'stage': name, 'duration': duration})
+        for callback in self.callbacks:
+            callback('stage', name, duration)
+
+    def count(self, name: str, n=1):
+        self.counts[name] += n
+        for callback in self.callbacks:
+            callback('count', name, n)
+
+    def match(self, column_name, example_column_name, similarity: float):
+        self.mapping.append((column_name, example_column_name, similarity))
+        for callback in self.callbacks:
+            callback('match', (column_name, example_column_name), similarity)
+
+    def summary(self) -> dict:
+        """
+        Return everything recorded, as a json-serializable dictionary.
+        """
+        return {
+            'durations': dict(self.durations),
+            'counts': dict(self.counts),
+            'mapping': [
+                {'column': str(column_name), 'example_column': str(example_column_name), 'similarity': float(similarity)}
+                for column_name, example_column_name, similarity in self.mapping
+            ],
+        }
+
+
+class NullTracer(Tracer):
+    """
+    Tracer that records nothing, used when tracing is disabled.
+    """
+    enabled = False
+
+    def __init__(self):
+        super().__init__()
+
+    def stage(self, name: str):
+        return nullcontext(self)
+
+    def timing(self, name: str, duration: float):
+        pass
+
+    def count(self, name: str, n=1):
+        pass
+
+    def match(self, column_name, example_column_name, similarity: float):
+        pass
+
+
+# the tracer of the transformation running in this context
+__current_tracer = ContextVar('tracer', default=NullTracer())
+
+def current_tracer() -> Tracer:
+    """
+    Return the tracer of the running transformation (a NullTracer if there is none).
+    """
+    return __current_tracer.get()
+
+@contextmanager
+def tracing(tracer: Tracer):
+    """
+    Make tracer the current tracer within the context.
+    """
+    token = __current_tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        __current_tracer.reset(token)
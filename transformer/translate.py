@@ -8,9 +8,14 @@ from deep_translator import GoogleTranslator
 from .find import find_text_columns
 from functools import lru_cache
 from collections import defaultdict
+from .trace import current_tracer
+import logging
 import swifter
 
 
+logger = logging.getLogger(__name__)
+
+
 def detect_language(dataframe, where='columns') -> str:
     """
     Detect the language of a dataframe.
@@ -37,6 +42,21 @@ def detect_language(dataframe, where='columns') -> str:
         return max(languages_found, key=languages_found.get)
 
 
+# class of the translators used by translate_str, created with source and target languages
+translator_backend = GoogleTranslator
+def set_translator_backend(backend) -> None:
+    """
+    Replace the translation service, e.g. with a stand-in for tests and benchmarks.
+
+    Args:
+        backend: class (or function) creating a translator with a translate(str) method,
+            from source and target keyword arguments
+    """
+    global translator_backend
+    translator_backend = backend
+    translate_str.cache_clear()
+
+
 @lru_cache(maxsize=128)
 def translate_str(x: str, lang_from='auto', lang_to='en') -> str:
     """
@@ -65,7 +85,8 @@ def translate_str(x: str, lang_from='auto', lang_to='en') -> str:
         latter = translate_str(x[5000:], lang_from, lang_to)
         return first15000 + latter
     # translate 
-    translator = GoogleTranslator(source=lang_from, target=lang_to)
+    current_tracer().count('translator_calls')
+    translator = translator_backend(source=lang_from, target=lang_to)
     return translator.translate(x)
 
 
@@ -138,7 +159,7 @@ def translate_dataframe(dataframe, lang_from='auto', lang_to='en', params={}) ->
             # translate batches using all cores
             def translate_batch(batch):
                 return translate_str(batch, lang_values, lang_to)
-            print('Translating column',column.name)
+            logger.info('Translating column %s', column.name)
             translated_batches = pd.Series(string_batches).swifter.apply(translate_batch)
             # flatten the batches into a list of strings
             translated_strings = [
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin, GroupAdmin
 from django.contrib.auth.models import Group
-from .models import User, Message, DataAfter, DataBefore, DataFormat, DataFormatClues
+from .models import User, Message, DataAfter, DataBefore, DataFormat, DataFormatClues, TransformJob
 
 admin.site.register(User, UserAdmin)
 admin.site.register(DataBefore)
@@ -9,6 +9,11 @@ admin.site.register(DataFormat)
 admin.site.register(DataFormatClues)
 admin.site.register(DataAfter)
 
+@admin.register(TransformJob)
+class TransformJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'user', 'status', 'progress', 'created_at', 'finished_at')
+    list_filter = ('status',)
+
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
     list_display = ('id', 'email', 'message')
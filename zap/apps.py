@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ZapConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'zap'
+
+    def ready(self):
+        from . import signals
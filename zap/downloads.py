@@ -0,0 +1,117 @@
+# functions for serving the stored files: streamed, by ranges, or handed off to the front proxy
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+from urllib.parse import quote
+import mimetypes
+import os
+import re
+
+
+class FileRange:
+    """
+    File-like object reading only the bytes of a file from start, up to length bytes.
+    It has no fileno, so that servers do not send the whole file instead.
+    """
+    def __init__(self, file, start: int, length: int):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header: str, size: int):
+    """
+    Parse a Range header with a single range of bytes.
+
+    Args:
+        header (str): the Range header, like 'bytes=0-499', 'bytes=500-' or 'bytes=-500'
+        size (int): the size of the file
+
+    Returns:
+        tuple: the (start, end) of the range, end included, None to send the whole file
+            (no range, several ranges or not bytes), or () if the range is not satisfiable
+    """
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', header.strip())
+    if match is None or match.group(1) == match.group(2) == '':
+        return None
+    if match.group(1) == '':
+        # the last bytes of the file
+        start, end = max(size - int(match.group(2)), 0), size - 1
+    else:
+        start = int(match.group(1))
+        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    if start > end or start >= size:
+        return ()
+    return start, end
+
+
+def file_response(request, field_file, filename: str, sha256=None):
+    """
+    Return a response with a stored file, for GET and HEAD requests. The file is streamed by blocks,
+    or only a range of it (Range and If-Range headers), or nothing if the client already has it
+    (If-None-Match and If-Modified-Since headers). With settings.DOWNLOAD_SENDFILE_HEADER,
+    the file is sent by the front proxy instead.
+
+    Args:
+        request (HttpRequest): the request of the file
+        field_file (FieldFile): the stored file
+        filename (str): the name of the file downloaded
+        sha256 (str): the sha256 of the file, if known, used as its ETag
+
+    Returns:
+        HttpResponse: the response
+    """
+    path = field_file.path
+    stat = os.stat(path)
+    etag = f'"{sha256}"' if sha256 else f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    sendfile_header = getattr(settings, 'DOWNLOAD_SENDFILE_HEADER', None)
+    if sendfile_header:
+        # the proxy sends the file, and handles the ranges
+        response = HttpResponse(content_type=content_type)
+        # the path is percent-encoded, as headers cannot have every character of a file name
+        if sendfile_header == 'X-Accel-Redirect':
+            response[sendfile_header] = quote(settings.DOWNLOAD_ACCEL_REDIRECT_LOCATION.rstrip('/') + '/' + field_file.name)
+        else:
+            response[sendfile_header] = quote(path)
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+    else:
+        byte_range = None
+        if 'Range' in request.headers:
+            # a range of another version of the file is not sent
+            if_range = request.headers.get('If-Range')
+            if if_range is None or if_range == etag or parse_http_date_safe(if_range) == last_modified:
+                byte_range = parse_range(request.headers['Range'], stat.st_size)
+        if byte_range == ():
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+        file = open(path, 'rb')
+        if byte_range is None:
+            response = FileResponse(file, as_attachment=True, filename=filename, content_type=content_type)
+            response['Content-Length'] = stat.st_size
+        else:
+            start, end = byte_range
+            response = FileResponse(FileRange(file, start, end - start + 1), status=206, as_attachment=True,
+                filename=filename, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = end - start + 1
+        response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,208 @@
+# functions for running the transformations in background workers (see TransformJob)
+
+from django.db import close_old_connections, connections
+from django.utils import timezone
+from transformer import similarity
+from transformer.trace import Tracer, tracing
+from .models import TransformJob
+from .transforms import get_transformer, transform_data, find_transformed
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+# progress of a job when each stage of the transformation ends
+STAGE_PROGRESS = {
+    'translation': 0.4,
+    'similarity': 0.7,
+    'assignment': 0.8,
+    'deduplication': 0.85,
+    'derive': 0.95,
+}
+
+
+def submit_job(data_before, data_format, user, name=None) -> TransformJob:
+    """
+    Queue the transformation of a dataset to a format, to be run by a worker (see run_worker).
+    If the same content was already transformed to the format, the job is done at once.
+
+    Args:
+        data_before (DataBefore): the dataset to transform
+        data_format (DataFormat): the format to transform it to
+        user (User): the owner of the job and of the transformed dataset
+        name (str): the name of the transformed dataset (default: the name of data_before)
+
+    Returns:
+        TransformJob: the job queued
+    """
+    data_after = find_transformed(data_before, data_format, user)
+    if data_after is not None:
+        now = timezone.now()
+        return TransformJob.objects.create(name=name or data_before.name, user=user, data_before=data_before,
+            data_format=data_format, status=TransformJob.DONE, progress=1, data_after=data_after,
+            started_at=now, finished_at=now)
+    return TransformJob.objects.create(name=name or data_before.name, user=user, data_before=data_before,
+        data_format=data_format)
+
+
+def claim_job(worker: str):
+    """
+    Take the oldest queued job, so that no other worker runs it.
+
+    Args:
+        worker (str): the name of the worker
+
+    Returns:
+        TransformJob: the job claimed, or None if the queue is empty
+    """
+    for job_id in TransformJob.objects.filter(status=TransformJob.QUEUED).order_by('created_at') \
+            .values_list('id', flat=True)[:10]:
+        # only one worker can change the status of a queued job
+        now = timezone.now()
+        if TransformJob.objects.filter(id=job_id, status=TransformJob.QUEUED) \
+                .update(status=TransformJob.RUNNING, worker=worker, started_at=now, progress=0, updated_at=now):
+            return TransformJob.objects.get(id=job_id)
+    return None
+
+
+def run_job(job: TransformJob) -> TransformJob:
+    """
+    Run a claimed job, recording its progress, and its transformed dataset or its error.
+
+    Args:
+        job (TransformJob): the job to run
+
+    Returns:
+        TransformJob: the job, done or failed
+    """
+    def record_progress(event, name, value):
+        if event == 'stage' and name in STAGE_PROGRESS:
+            TransformJob.objects.filter(id=job.id).update(progress=STAGE_PROGRESS[name], updated_at=timezone.now())
+    try:
+        with tracing(Tracer(callbacks=[record_progress])):
+            job.data_after = transform_data(job.data_before, job.data_format, user=job.user, name=job.name)
+        job.status = TransformJob.DONE
+        job.progress = 1
+    except Exception as e:
+        logger.exception('Transform job %d failed', job.id)
+        job.status = TransformJob.FAILED
+        job.error = f'{type(e).__name__}: {e}'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['data_after', 'status', 'progress', 'error', 'finished_at', 'updated_at'])
+    return job
+
+
+def worker_name() -> str:
+    # the name of the worker running in this process, as host:pid
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def is_worker_alive(worker: str) -> bool:
+    """
+    Check whether the process of a worker of this host is still running.
+    The workers of other hosts cannot be checked, so they are considered alive.
+
+    Args:
+        worker (str): the name of the worker (see worker_name)
+
+    Returns:
+        bool: false if the worker is known to be dead
+    """
+    host, _, pid = worker.partition(':')
+    pid = pid.split(':')[0]
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # the process exists, but belongs to another user
+        pass
+    return True
+
+
+def requeue_jobs() -> int:
+    """
+    Queue again the jobs left running by the workers of this host that are dead, e.g. after they were killed.
+    The jobs of the workers still running are left to them.
+
+    Returns:
+        int: the number of jobs queued again
+    """
+    n_requeued = 0
+    running = TransformJob.objects.filter(status=TransformJob.RUNNING, worker__startswith=f'{socket.gethostname()}:') \
+        .values_list('id', 'worker')
+    for job_id, worker in running:
+        if not is_worker_alive(worker):
+            # unless the job changed since
+            n_requeued += TransformJob.objects.filter(id=job_id, status=TransformJob.RUNNING, worker=worker) \
+                .update(status=TransformJob.QUEUED, worker='', progress=0, updated_at=timezone.now())
+    return n_requeued
+
+
+def work(worker=None, poll_interval=1.0, max_jobs=None) -> None:
+    """
+    Run the queued jobs one after another, waiting for new ones when the queue is empty.
+
+    Args:
+        worker (str): the name of the worker (default: the name of this process, see worker_name)
+        poll_interval (float): seconds between checks of an empty queue
+        max_jobs (int): stop after running this many jobs (default: None, never stop)
+    """
+    worker = worker or worker_name()
+    # load the transformer and its encoder before the first job
+    get_transformer()
+    similarity.get_model()
+    n_jobs = 0
+    while max_jobs is None or n_jobs < max_jobs:
+        close_old_connections()
+        job = claim_job(worker)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        logger.info('Worker %s running transform job %d', worker, job.id)
+        run_job(job)
+        n_jobs += 1
+
+
+def run_worker(processes=1, poll_interval=1.0) -> None:
+    """
+    Run a pool of worker processes (see work), with the transformer and its encoder loaded,
+    until they are stopped.
+
+    Args:
+        processes (int): number of worker processes
+        poll_interval (float): seconds between checks of an empty queue
+    """
+    if processes <= 1:
+        return work(poll_interval=poll_interval)
+    # the forked workers share the memory of the encoder loaded once,
+    # but must open their own database connections
+    get_transformer()
+    similarity.get_model()
+    connections.close_all()
+    # the workers are named after their own processes, so that requeue_jobs can tell whether they are alive,
+    # and are not daemonic, so that they can start processes of their own (e.g. transform_many)
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=work, kwargs={'poll_interval': poll_interval}) for _ in range(processes)]
+    for process in workers:
+        process.start()
+    # stop the workers when the pool is stopped
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        for process in workers:
+            process.join()
+    finally:
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+        for process in workers:
+            process.join()
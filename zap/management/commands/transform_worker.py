@@ -0,0 +1,20 @@
+# command running the queued transformations (see zap.jobs)
+
+from django.core.management.base import BaseCommand
+from zap.jobs import requeue_jobs, run_worker
+
+
+class Command(BaseCommand):
+    help = 'Run the queued transform jobs in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='number of worker processes')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='seconds between checks of an empty queue')
+        parser.add_argument('--requeue', action='store_true',
+            help='queue again the jobs left running by the dead workers of this host')
+
+    def handle(self, *args, **options):
+        if options['requeue']:
+            n_requeued = requeue_jobs()
+            self.stdout.write(f'Queued again {n_requeued} interrupted jobs')
+        run_worker(processes=options['processes'], poll_interval=options['poll_interval'])
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import BaseUserManager, AbstractUser
 from typing import List
+from .storage import content_storage
+import uuid
 
 
 class User(AbstractUser):
@@ -23,18 +25,34 @@ class Message(models.Model):
 class DataBefore(models.Model):
     name = models.CharField(max_length=150)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='data_before')
-    file = models.FileField(upload_to='before/')
+    # files with the same content are stored once, named by their sha256
+    file = models.FileField(upload_to='before/', storage=content_storage)
+    sha256 = models.CharField(max_length=64, blank=True, editable=False, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # the previous export of the same data, whose transformed rows are not transformed again
+    previous = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='next_exports')
+
+    class Meta:
+        # the lists of the datasets of a user, from the newest (see zap.pagination)
+        indexes = [models.Index(fields=['user', '-created_at'])]
 
 class DataFormat(models.Model):
     name = models.CharField(max_length=150)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='data_formats')
-    file = models.FileField(upload_to='format/')
+    file = models.FileField(upload_to='format/', storage=content_storage)
+    sha256 = models.CharField(max_length=64, blank=True, editable=False, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     ignore_columns = models.CharField(max_length=150) #ArrayField(models.CharField(max_length=30, blank=True), size=50, blank=True)
     use_columns = models.CharField(max_length=150) #ArrayField(models.CharField(max_length=30, blank=True), size=50, blank=True)
+    # the example file compiled once (see transformer.formats.CompiledFormat), and the file it was compiled from
+    compiled = models.FileField(upload_to='format/compiled/', blank=True, editable=False)
+    compiled_from = models.CharField(max_length=255, blank=True, editable=False)
+
+    class Meta:
+        # the lists of the datasets of a user, from the newest (see zap.pagination)
+        indexes = [models.Index(fields=['user', '-created_at'])]
 
 
 class DataFormatClues(models.Model):
@@ -51,3 +69,59 @@ class DataAfter(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     data_before = models.ForeignKey(DataBefore, on_delete=models.DO_NOTHING)
     data_format = models.ForeignKey(DataFormat, on_delete=models.DO_NOTHING)
+    # the mapping of the columns (see transformer.find.find_mapping), the hashes of the rows transformed,
+    # and the hashes of the rows of the output (see transformer.rows.RowDeduplicator)
+    mapping = models.JSONField(default=list, blank=True, editable=False)
+    row_hashes = models.FileField(upload_to='after/hashes/', blank=True, editable=False)
+    output_hashes = models.FileField(upload_to='after/hashes/', blank=True, editable=False)
+    # the contents and parameters it was transformed from, to return it again for the same ones
+    source_sha256 = models.CharField(max_length=64, blank=True, editable=False)
+    format_sha256 = models.CharField(max_length=64, blank=True, editable=False)
+    params_version = models.CharField(max_length=64, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+            models.Index(fields=['user', 'source_sha256', 'format_sha256', 'params_version']),
+        ]
+
+
+class TransformJob(models.Model):
+    # a transformation of data_before to data_format, run by the transform_worker command
+    QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+    STATUSES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+    name = models.CharField(max_length=150)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='transform_jobs')
+    data_before = models.ForeignKey(DataBefore, on_delete=models.CASCADE)
+    data_format = models.ForeignKey(DataFormat, on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED, db_index=True)
+    progress = models.FloatField(default=0)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=150, blank=True)
+    # the transformed dataset, once the job is done
+    data_after = models.ForeignKey(DataAfter, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', '-created_at'])]
+
+
+class UploadSession(models.Model):
+    # a file uploaded in chunks, resumable from its offset, which becomes a DataBefore once complete (see zap.uploads)
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=150)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    # the size of the file, if known in advance, and the number of bytes received
+    size = models.BigIntegerField(null=True, blank=True)
+    offset = models.BigIntegerField(default=0)
+    previous = models.ForeignKey(DataBefore, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    data_before = models.ForeignKey(DataBefore, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_sessions')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', '-created_at'])]
@@ -1,11 +1,23 @@
 from oauth2_provider.contrib.rest_framework import TokenHasReadWriteScope, TokenHasScope
 from rest_framework import serializers
-from .models import User, DataBefore, DataAfter, DataFormat, DataFormatClues
+from .models import User, DataBefore, DataAfter, DataFormat, DataFormatClues, TransformJob, UploadSession
 from django.contrib.auth.models import Group
 
 
 # first we define the serializers
 
+class OwnRelatedFieldsMixin:
+    # the related fields in own_related_fields only accept the records of the requesting user
+    own_related_fields = ()
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        for name in self.own_related_fields:
+            queryset = fields[name].queryset
+            fields[name].queryset = queryset.none() if request is None else queryset.filter(user=request.user)
+        return fields
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -18,10 +30,12 @@ class GroupSerializer(serializers.ModelSerializer):
         fields = ("name", )
 
 
-class DataBeforeSerializer(serializers.HyperlinkedModelSerializer):
+class DataBeforeSerializer(OwnRelatedFieldsMixin, serializers.HyperlinkedModelSerializer):
+    own_related_fields = ("previous", )
+    previous = serializers.PrimaryKeyRelatedField(queryset=DataBefore.objects.all(), required=False, allow_null=True)
     class Meta:
         model = DataBefore
-        fields = ("id", "name", "file")
+        fields = ("id", "name", "file", "previous")
 
 
 class DataFormatCluesSerializer(serializers.HyperlinkedModelSerializer):
@@ -38,8 +52,34 @@ class DataFormatSerializer(serializers.HyperlinkedModelSerializer):
         fields = ("id", "name", "file", "ignore_columns", "use_columns")
 
 
-class DataAfterSerializer(serializers.HyperlinkedModelSerializer):
+class DataAfterSerializer(OwnRelatedFieldsMixin, serializers.HyperlinkedModelSerializer):
+    own_related_fields = ("data_before", "data_format")
+    # without a file, the transformation of data_before to data_format is queued (see DataAfterList)
+    file = serializers.FileField(required=False)
     class Meta:
         model = DataAfter
         fields = ("id", "name", "file", "data_before", "data_format")
 
+
+
+class TransformJobSerializer(OwnRelatedFieldsMixin, serializers.ModelSerializer):
+    own_related_fields = ("data_before", "data_format")
+    # data_before is transformed to data_format by a worker, poll the job until data_after is set
+    data_before = serializers.PrimaryKeyRelatedField(queryset=DataBefore.objects.all())
+    data_format = serializers.PrimaryKeyRelatedField(queryset=DataFormat.objects.all())
+    name = serializers.CharField(max_length=150, required=False)
+    class Meta:
+        model = TransformJob
+        fields = ("id", "name", "data_before", "data_format", "status", "progress", "error", "data_after",
+            "created_at", "started_at", "finished_at")
+        read_only_fields = ("status", "progress", "error", "data_after", "created_at", "started_at", "finished_at")
+
+
+class UploadSessionSerializer(OwnRelatedFieldsMixin, serializers.ModelSerializer):
+    own_related_fields = ("previous", )
+    # the file is sent in chunks to the session, see UploadSessionDetail
+    previous = serializers.PrimaryKeyRelatedField(queryset=DataBefore.objects.all(), required=False, allow_null=True)
+    class Meta:
+        model = UploadSession
+        fields = ("id", "name", "filename", "size", "offset", "previous", "data_before", "created_at", "updated_at")
+        read_only_fields = ("offset", "data_before", "created_at", "updated_at")
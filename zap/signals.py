@@ -0,0 +1,62 @@
+# signals of the zap models
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .models import DataBefore, DataFormat
+from .storage import file_sha256
+from .transforms import delete_compiled_file
+
+
+@receiver(pre_save, sender=DataBefore)
+@receiver(pre_save, sender=DataFormat)
+def hash_uploaded_file(sender, instance, **kwargs):
+    # hash the content of a new file, before it is stored by its hash
+    if instance.file and not instance.file._committed:
+        instance.sha256 = file_sha256(instance.file.file)
+
+
+@receiver(pre_save, sender=DataBefore)
+@receiver(pre_save, sender=DataFormat)
+def find_replaced_file(sender, instance, **kwargs):
+    # the previous file of a record when a new one is uploaded, deleted once saved (see delete_replaced_file)
+    instance._replaced_file = None
+    if instance.pk and instance.file and not instance.file._committed:
+        instance._replaced_file = sender.objects.filter(pk=instance.pk).values_list('file', flat=True).first()
+
+
+@receiver(post_save, sender=DataBefore)
+@receiver(post_save, sender=DataFormat)
+def delete_replaced_file(sender, instance, **kwargs):
+    # unless other records have it (see storage.ContentAddressedStorage)
+    name = getattr(instance, '_replaced_file', None)
+    if name and name != instance.file.name:
+        transaction.on_commit(lambda: instance.file.storage.delete(name))
+
+
+@receiver(post_delete, sender=DataBefore)
+@receiver(post_delete, sender=DataFormat)
+def delete_stored_file(sender, instance, **kwargs):
+    # delete the file of a deleted record, unless other records have it (see storage.ContentAddressedStorage)
+    if instance.file:
+        name = instance.file.name
+        transaction.on_commit(lambda: instance.file.storage.delete(name))
+
+
+@receiver(post_save, sender=DataFormat)
+def delete_replaced_compiled_file(sender, instance, **kwargs):
+    # the format compiled from a replaced file, compiled again when it is used (see transforms.load_compiled_format)
+    name = getattr(instance, '_replaced_file', None)
+    if name and name != instance.file.name and instance.compiled:
+        compiled = instance.compiled.name
+        instance.compiled, instance.compiled_from = '', ''
+        sender.objects.filter(pk=instance.pk).update(compiled='', compiled_from='')
+        transaction.on_commit(lambda: delete_compiled_file(compiled))
+
+
+@receiver(post_delete, sender=DataFormat)
+def delete_compiled_format(sender, instance, **kwargs):
+    # unless other formats with the same file have it (see transforms.compile_data_format)
+    if instance.compiled:
+        name = instance.compiled.name
+        transaction.on_commit(lambda: delete_compiled_file(name))
@@ -0,0 +1,89 @@
+# storage of the uploaded files by their content, so that identical files are stored once
+
+from django.apps import apps
+from contextlib import contextmanager
+from django.core.files import locks
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+import hashlib
+import os
+
+
+def file_sha256(file) -> str:
+    """
+    Return the sha256 of the content of a file, hashed while it was uploaded (see HashingUploadHandler),
+    or else read in chunks. The hash is kept in the file object, so it is only calculated once.
+
+    Args:
+        file (File): the file to hash
+
+    Returns:
+        str: the hexadecimal sha256 of the file
+    """
+    sha256 = getattr(file, 'sha256', None)
+    if sha256 is None:
+        hasher = hashlib.sha256()
+        for chunk in file.chunks():
+            hasher.update(chunk)
+        file.seek(0)
+        sha256 = file.sha256 = hasher.hexdigest()
+    return sha256
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """
+    Upload handler that hashes the uploaded files while they are streamed to temporary files,
+    and sets their sha256.
+    """
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.hasher.hexdigest()
+        return file
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File storage that names the files by the sha256 of their content, in the directory of their field,
+    so that a file uploaded again is not stored again. As files are shared, a file is only deleted
+    once no record refers to it anymore. Saving and deleting take the same lock, so that a file
+    is not deleted while it is uploaded again.
+    """
+    def save(self, name, content, max_length=None):
+        sha256 = file_sha256(content)
+        name = os.path.join(os.path.dirname(name), sha256[:2], sha256 + os.path.splitext(name)[1].lower())
+        with self.locked():
+            if self.exists(name):
+                return name
+            return super().save(name, content, max_length)
+
+    def delete(self, name):
+        with self.locked():
+            if not self.is_referenced(name):
+                super().delete(name)
+
+    @contextmanager
+    def locked(self):
+        # an exclusive lock on a file of the storage, shared by the processes using it
+        os.makedirs(self.location, exist_ok=True)
+        with open(os.path.join(self.location, '.lock'), 'a') as f:
+            locks.lock(f, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(f)
+
+    def is_referenced(self, name) -> bool:
+        # whether a dataset or a format still has the file
+        return any(apps.get_model('zap', model_name).objects.filter(file=name).exists()
+            for model_name in ('DataBefore', 'DataFormat', 'DataAfter'))
+
+
+content_storage = ContentAddressedStorage()
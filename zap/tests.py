@@ -1,3 +1,402 @@
-from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from transformer.translate import set_translator_backend
+from .jobs import submit_job, claim_job, run_job, requeue_jobs
+from .models import User, DataBefore, DataAfter, DataFormat, TransformJob, UploadSession
+from .transforms import load_compiled_format, transform_data
+import hashlib
+import os
+import pandas as pd
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+
+
+# the example files of the repository, and the storage of the files uploaded by the tests
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+class StandInTranslator:
+    # translator that returns the text unchanged, so that the tests do not depend on the network
+    def __init__(self, source='auto', target='en'):
+        pass
+
+    def translate(self, text: str) -> str:
+        return text
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, DOWNLOAD_SENDFILE_HEADER=None)
+class ZapTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        set_translator_backend(StandInTranslator)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='password')
+        self.other_user = User.objects.create_user(username='other', password='password')
+        self.client.force_login(self.user)
+
+    def create_data_before(self, user, name='dataset', content=None, previous=None):
+        if content is None:
+            with open(os.path.join(DATA_DIR, 'before', 'example-dataset1.csv'), 'rb') as f:
+                content = f.read()
+        return DataBefore.objects.create(name=name, user=user, file=ContentFile(content, name=f'{name}.csv'),
+            previous=previous)
+
+    def create_data_format(self, user, name='vehicles'):
+        with open(os.path.join(DATA_DIR, 'format', 'format-example-vehicles.csv'), 'rb') as f:
+            return DataFormat.objects.create(name=name, user=user, file=ContentFile(f.read(), name=f'{name}.csv'),
+                ignore_columns='', use_columns='')
+
+
+class UploadTests(ZapTestCase):
+    content = b'id,name\n1,first\n2,second\n3,third\n'
+
+    def create_session(self, **data):
+        response = self.client.post('/uploads', {'name': 'upload', 'filename': 'upload.csv',
+            'size': len(self.content), **data})
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['id']
+
+    def put_chunk(self, session_id, start, chunk, end=None):
+        end = start + len(chunk) - 1 if end is None else end
+        return self.client.put(f'/uploads/{session_id}', chunk, content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{len(self.content)}')
+
+    def test_chunks_move_the_offset(self):
+        session_id = self.create_session()
+        response = self.put_chunk(session_id, 0, self.content[:10])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['offset'], 10)
+        response = self.put_chunk(session_id, 10, self.content[10:])
+        self.assertEqual(response.json()['offset'], len(self.content))
+        response = self.client.post(f'/uploads/{session_id}/complete')
+        self.assertEqual(response.status_code, 201)
+        data_before = DataBefore.objects.get(id=response.json()['id'])
+        self.assertEqual(data_before.sha256, hashlib.sha256(self.content).hexdigest())
+        with data_before.file.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_list_changes_with_the_chunks(self):
+        session_id = self.create_session()
+        etag = self.client.get('/uploads')['ETag']
+        self.put_chunk(session_id, 0, self.content[:10])
+        response = self.client.get('/uploads', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_chunk_at_another_offset_conflicts(self):
+        session_id = self.create_session()
+        self.put_chunk(session_id, 0, self.content[:10])
+        # the same chunk sent again, and a chunk after a missing one
+        for start, chunk in [(0, self.content[:10]), (20, self.content[20:])]:
+            response = self.put_chunk(session_id, start, chunk)
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.json()['offset'], 10)
+        # an incomplete session is not completed
+        self.assertEqual(self.client.post(f'/uploads/{session_id}/complete').status_code, 409)
+
+    def test_chunk_of_another_length_is_rejected(self):
+        session_id = self.create_session()
+        response = self.put_chunk(session_id, 0, self.content[:5], end=9)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UploadSession.objects.get(id=session_id).offset, 0)
+
+    def test_previous_of_another_user_is_rejected(self):
+        previous = self.create_data_before(self.other_user)
+        response = self.client.post('/uploads', {'name': 'upload', 'filename': 'upload.csv', 'previous': previous.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('previous', response.json())
+        self.create_session(previous=self.create_data_before(self.user).id)
+
+    def test_session_without_data_is_not_completed(self):
+        response = self.client.post('/uploads', {'name': 'upload', 'filename': 'upload.csv'})
+        session_id = response.json()['id']
+        self.assertEqual(self.client.post(f'/uploads/{session_id}/complete').status_code, 409)
+        self.assertFalse(DataBefore.objects.exists())
+
+    def test_completed_session_is_completed_once(self):
+        session_id = self.create_session()
+        self.put_chunk(session_id, 0, self.content)
+        first = self.client.post(f'/uploads/{session_id}/complete')
+        second = self.client.post(f'/uploads/{session_id}/complete')
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(first.json()['id'], second.json()['id'])
+        self.assertEqual(DataBefore.objects.count(), 1)
+
+
+class DownloadTests(ZapTestCase):
+    content = b'0123456789abcdefghij'
+
+    def setUp(self):
+        super().setUp()
+        self.data_before = self.create_data_before(self.user, content=self.content)
+        self.url = f'/data-before/{self.data_before.id}/download'
+
+    def test_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['ETag'], f'"{self.data_before.sha256}"')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[5:10])
+        self.assertEqual(response['Content-Range'], f'bytes 5-9/{len(self.content)}')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-3:])
+
+    def test_range_not_satisfiable(self):
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_if_range(self):
+        # a range of the same version of the file, or the whole file if it changed
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5-9', HTTP_IF_RANGE=f'"{self.data_before.sha256}"')
+        self.assertEqual(response.status_code, 206)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5-9', HTTP_IF_RANGE='"another version"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_download_of_another_user(self):
+        self.client.force_login(self.other_user)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    @override_settings(DOWNLOAD_SENDFILE_HEADER='X-Accel-Redirect', DOWNLOAD_ACCEL_REDIRECT_LOCATION='/protected/')
+    def test_sendfile(self):
+        self.data_before.name = 'Járművek 2020; "export"'
+        self.data_before.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{self.data_before.file.name}')
+        # the name is encoded for the header
+        self.assertEqual(response['Content-Disposition'],
+            "attachment; filename*=utf-8''J%C3%A1rm%C5%B1vek%202020%3B%20%22export%22.csv")
+
+
+class CompiledFormatTests(ZapTestCase):
+    def test_format_is_compiled_when_it_is_used(self):
+        data_format = self.create_data_format(self.user)
+        self.assertFalse(data_format.compiled)
+        compiled_format = load_compiled_format(data_format)
+        self.assertEqual(list(compiled_format.columns), list(pd.read_csv(data_format.file.path).columns))
+        data_format.refresh_from_db()
+        self.assertEqual(data_format.compiled_from, data_format.file.name)
+        # a format with the same file shares the compiled format
+        same_format = self.create_data_format(self.other_user)
+        load_compiled_format(same_format)
+        self.assertEqual(same_format.compiled.name, data_format.compiled.name)
+
+    def test_format_compiled_by_another_version_is_compiled_again(self):
+        # an example that no other test compiles, and loads from the same path
+        data_format = DataFormat.objects.create(name='stale', user=self.user, ignore_columns='', use_columns='',
+            file=ContentFile(b'external_id,license_plate_number\n1,AB-123\n2,CD-456\n', name='stale.csv'))
+        load_compiled_format(data_format)
+        stale = data_format.compiled.path
+        compiled = pd.read_pickle(stale)
+        pd.to_pickle({**compiled, 'version': compiled['version'] - 1}, stale)
+        with self.captureOnCommitCallbacks(execute=True):
+            compiled_format = load_compiled_format(data_format)
+        self.assertEqual(list(compiled_format.columns), list(compiled['example'].columns))
+        self.assertNotEqual(data_format.compiled.path, stale)
+        self.assertFalse(os.path.exists(stale))
+
+    def test_compiled_file_is_deleted_with_its_format(self):
+        data_format = self.create_data_format(self.user)
+        same_format = self.create_data_format(self.other_user)
+        load_compiled_format(data_format)
+        load_compiled_format(same_format)
+        path = data_format.compiled.path
+        with self.captureOnCommitCallbacks(execute=True):
+            data_format.delete()
+        self.assertTrue(os.path.exists(path))
+        # replacing the file of the other format deletes the compiled file it shared
+        with self.captureOnCommitCallbacks(execute=True):
+            same_format.file = ContentFile(b'id,name\n1,first\n', name='other.csv')
+            same_format.save()
+        self.assertFalse(os.path.exists(path))
+        same_format.refresh_from_db()
+        self.assertFalse(same_format.compiled)
+        self.assertEqual(list(load_compiled_format(same_format).columns), ['id', 'name'])
+
+
+class TransformJobTests(ZapTestCase):
+    def setUp(self):
+        super().setUp()
+        self.data_before = self.create_data_before(self.user)
+        self.data_format = self.create_data_format(self.user)
+
+    def test_job_queue(self):
+        job = submit_job(self.data_before, self.data_format, self.user)
+        self.assertEqual(job.status, TransformJob.QUEUED)
+        claimed = claim_job('worker')
+        self.assertEqual(claimed.id, job.id)
+        self.assertEqual(claimed.status, TransformJob.RUNNING)
+        # a claimed job is not claimed again
+        self.assertIsNone(claim_job('another worker'))
+        job = run_job(claimed)
+        job.refresh_from_db()
+        self.assertEqual(job.status, TransformJob.DONE)
+        self.assertEqual(job.progress, 1)
+        self.assertEqual(job.data_after.data_before_id, self.data_before.id)
+
+    def test_same_content_is_not_transformed_again(self):
+        submit_job(self.data_before, self.data_format, self.user)
+        run_job(claim_job('worker'))
+        data_after = DataAfter.objects.get()
+        # another upload of the same file
+        job = submit_job(self.create_data_before(self.user, name='again'), self.data_format, self.user)
+        self.assertEqual(job.status, TransformJob.DONE)
+        self.assertEqual(job.data_after_id, data_after.id)
+        self.assertIsNone(claim_job('worker'))
+
+    def test_post_queues_a_job(self):
+        response = self.client.post('/transform-jobs', {'data_before': self.data_before.id,
+            'data_format': self.data_format.id})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['status'], TransformJob.QUEUED)
+        response = self.client.post('/data-after', {'name': 'transformed',
+            'data_before': f'http://testserver/data-before/{self.data_before.id}',
+            'data_format': f'http://testserver/data-format/{self.data_format.id}'})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Location'], f'/transform-jobs/{response.json()["id"]}')
+        self.assertEqual(TransformJob.objects.filter(status=TransformJob.QUEUED).count(), 2)
+        self.assertFalse(DataAfter.objects.exists())
+
+    def test_datasets_of_another_user_are_rejected(self):
+        self.client.force_login(self.other_user)
+        response = self.client.post('/transform-jobs', {'data_before': self.data_before.id,
+            'data_format': self.data_format.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'data_before', 'data_format'})
+        response = self.client.post('/data-after', {'name': 'transformed',
+            'data_before': f'http://testserver/data-before/{self.data_before.id}',
+            'data_format': f'http://testserver/data-format/{self.data_format.id}'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/data-before', {'name': 'next', 'previous': self.data_before.id,
+            'file': ContentFile(b'id\n1\n', name='next.csv')})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(TransformJob.objects.exists())
+
+    def test_list_changes_with_the_jobs(self):
+        submit_job(self.data_before, self.data_format, self.user)
+        etag = self.client.get('/transform-jobs')['ETag']
+        self.assertEqual(self.client.get('/transform-jobs', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # the workers update the jobs they claim directly
+        claim_job('worker')
+        response = self.client.get('/transform-jobs', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_jobs_of_dead_workers_are_queued_again(self):
+        # a process that exited, this process, and a process of another host
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        host = socket.gethostname()
+        workers = [f'{host}:{process.pid}', f'{host}:{os.getpid()}', f'another-{host}:{process.pid}']
+        for worker in workers:
+            submit_job(self.data_before, self.data_format, self.user)
+            claim_job(worker)
+        self.assertEqual(requeue_jobs(), 1)
+        self.assertEqual(list(TransformJob.objects.filter(status=TransformJob.RUNNING).order_by('worker')
+            .values_list('worker', flat=True)), sorted(workers[1:]))
+        job = claim_job('worker')
+        self.assertEqual(job.status, TransformJob.RUNNING)
+        self.assertEqual(requeue_jobs(), 0)
+
+
+
+class RowDeduplicationTests(ZapTestCase):
+    def test_new_export_only_transforms_new_rows(self):
+        dataframe = pd.read_csv(os.path.join(DATA_DIR, 'before', 'example-dataset1.csv'))
+        half = len(dataframe) // 2
+        data_format = self.create_data_format(self.user)
+        first_export = self.create_data_before(self.user, 'first', dataframe.iloc[:half].to_csv(index=False).encode())
+        first_after = transform_data(first_export, data_format, self.user)
+        # the new export repeats the rows of the first one
+        second_export = self.create_data_before(self.user, 'second', dataframe.to_csv(index=False).encode(),
+            previous=first_export)
+        second_after = transform_data(second_export, data_format, self.user)
+        self.assertNotEqual(second_after.id, first_after.id)
+        self.assertEqual(second_after.mapping, first_after.mapping)
+        self.assertEqual(len(pd.read_csv(first_after.file.path)), half)
+        self.assertEqual(len(pd.read_csv(second_after.file.path)), len(dataframe))
+        # the first export is still transformed to its own dataset
+        first_after.refresh_from_db()
+        self.assertEqual(first_after.data_before_id, first_export.id)
+        self.assertEqual(transform_data(first_export, data_format, self.user).id, first_after.id)
+
+    def test_export_of_another_user_is_transformed_again(self):
+        data_format = self.create_data_format(self.other_user)
+        first_export = self.create_data_before(self.other_user, 'first')
+        first_after = transform_data(first_export, data_format, self.other_user)
+        # a mapping that the new export would reuse if it continued the dataset of the other user
+        first_after.mapping = first_after.mapping[:1]
+        first_after.save()
+        export = self.create_data_before(self.user, 'second', previous=first_export)
+        data_after = transform_data(export, data_format, self.user, memoize=False)
+        self.assertEqual(data_after.user, self.user)
+        self.assertGreater(len(data_after.mapping), 1)
+
+    def test_new_rows_already_in_the_output_are_dropped(self):
+        dataframe = pd.read_csv(os.path.join(DATA_DIR, 'before', 'example-dataset1.csv'))
+        data_format = self.create_data_format(self.user)
+        first_export = self.create_data_before(self.user, 'first', dataframe.to_csv(index=False).encode())
+        first_after = transform_data(first_export, data_format, self.user)
+        # the new export changes a column that is not in the output, so its rows are new but not their output
+        unmapped = [column for column in dataframe.columns
+            if column not in {match['column'] for match in first_after.mapping}]
+        self.assertTrue(unmapped)
+        changed = dataframe.copy()
+        changed[unmapped[0]] = changed[unmapped[0]].astype(str) + ' changed'
+        second_export = self.create_data_before(self.user, 'second', changed.to_csv(index=False).encode(),
+            previous=first_export)
+        second_after = transform_data(second_export, data_format, self.user)
+        self.assertEqual(len(pd.read_csv(second_after.file.path)), len(pd.read_csv(first_after.file.path)))
+
+    def test_appended_dataset_is_not_returned_for_the_same_content(self):
+        dataframe = pd.read_csv(os.path.join(DATA_DIR, 'before', 'example-dataset1.csv'))
+        half = len(dataframe) // 2
+        data_format = self.create_data_format(self.user)
+        first_export = self.create_data_before(self.user, 'first', dataframe.iloc[:half].to_csv(index=False).encode())
+        transform_data(first_export, data_format, self.user)
+        # an export of the new rows only, appended to the first one
+        content = dataframe.iloc[half:].to_csv(index=False).encode()
+        second_export = self.create_data_before(self.user, 'second', content, previous=first_export)
+        second_after = transform_data(second_export, data_format, self.user)
+        self.assertEqual(len(pd.read_csv(second_after.file.path)), len(dataframe))
+        # the same content uploaded alone is transformed alone
+        data_after = transform_data(self.create_data_before(self.user, 'alone', content), data_format, self.user)
+        self.assertNotEqual(data_after.id, second_after.id)
+        self.assertEqual(len(pd.read_csv(data_after.file.path)), len(dataframe) - half)
+
+
+class StorageTests(ZapTestCase):
+    def test_file_is_deleted_with_its_last_record(self):
+        first = self.create_data_before(self.user, 'first', b'id\n1\n')
+        second = self.create_data_before(self.other_user, 'second', b'id\n1\n')
+        self.assertEqual(first.file.name, second.file.name)
+        path = first.file.path
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        # the same content uploaded again is stored again
+        again = self.create_data_before(self.user, 'again', b'id\n1\n')
+        self.assertEqual(again.file.path, path)
+        self.assertTrue(os.path.exists(path))
 
-# Create your tests here.
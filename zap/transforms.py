@@ -0,0 +1,273 @@
+# functions for transforming the uploaded data with the transformer
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import transaction
+from functools import lru_cache
+from transformer import TelematicZapTransformer
+from transformer import similarity
+from transformer.formats import CompiledFormat, COMPILED_FORMAT_VERSION
+from transformer.io import read_dataframe, save_dataframe
+from transformer.rows import hash_rows, new_rows, RowDeduplicator
+from .models import DataAfter, DataFormat
+import numpy as np
+import pandas as pd
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+
+logger = logging.getLogger(__name__)
+
+
+# transformer shared by the requests of this worker
+__transformer = None
+def get_transformer() -> TelematicZapTransformer:
+    """
+    Return the transformer, loaded from settings.TRANSFORMER_ARTIFACT if it is set.
+    """
+    global __transformer
+    if __transformer is None:
+        if settings.TRANSFORMER_ARTIFACT:
+            __transformer = TelematicZapTransformer.load(settings.TRANSFORMER_ARTIFACT)
+        else:
+            __transformer = TelematicZapTransformer()
+    return __transformer
+
+
+def compile_data_format(data_format) -> CompiledFormat:
+    """
+    Compile the example file of a DataFormat, and store the compiled format next to it.
+    Formats with the same file (see storage.ContentAddressedStorage) share the compiled format.
+    The compiled file it replaces is deleted, unless other formats share it.
+
+    Args:
+        data_format (DataFormat): the format to compile
+
+    Returns:
+        CompiledFormat: the compiled format
+    """
+    replaced = data_format.compiled.name
+    compiled_format = None
+    same_format = DataFormat.objects.filter(compiled_from=data_format.file.name).exclude(compiled='') \
+        .exclude(compiled=replaced).exclude(pk=data_format.pk).first()
+    if same_format is not None:
+        try:
+            compiled_format = __load_compiled_format(same_format.compiled.path)
+            data_format.compiled = same_format.compiled.name
+        except ValueError:
+            # compiled by another version, it is compiled again below (see load_compiled_format)
+            pass
+    if compiled_format is None:
+        compiled_format = get_transformer().compile_format(read_dataframe(data_format.file.path))
+        buffer = io.BytesIO()
+        compiled_format.save(buffer)
+        data_format.compiled.save(os.path.basename(data_format.file.name) + '.pkl', ContentFile(buffer.getvalue()),
+            save=False)
+    data_format.compiled_from = data_format.file.name
+    data_format.save(update_fields=['compiled', 'compiled_from'])
+    if replaced and replaced != data_format.compiled.name:
+        transaction.on_commit(lambda: delete_compiled_file(replaced))
+    return compiled_format
+
+
+def delete_compiled_file(name: str) -> None:
+    """
+    Delete a compiled format file, unless a DataFormat still has it.
+
+    Args:
+        name (str): the name of the compiled file in its storage
+    """
+    if name and not DataFormat.objects.filter(compiled=name).exists():
+        DataFormat._meta.get_field('compiled').storage.delete(name)
+
+
+@lru_cache(maxsize=64)
+def __load_compiled_format(path: str) -> CompiledFormat:
+    # compiled files are never overwritten, a new compilation gets a new name
+    return CompiledFormat.load(path)
+
+def load_compiled_format(data_format) -> CompiledFormat:
+    """
+    Return the compiled format of a DataFormat, compiling it first if its file changed,
+    or if it was compiled by another version of the compiled formats or with another encoder.
+
+    Args:
+        data_format (DataFormat): the format to load
+
+    Returns:
+        CompiledFormat: the compiled format
+    """
+    if not data_format.compiled or data_format.compiled_from != data_format.file.name:
+        return compile_data_format(data_format)
+    try:
+        return __load_compiled_format(data_format.compiled.path)
+    except ValueError as e:
+        logger.info('Compiling format %s again: %s', data_format.pk, e)
+        return compile_data_format(data_format)
+
+
+def format_clues(data_format) -> dict:
+    """
+    Return the clues of a DataFormat for the transformer (see TelematicZapTransformer.transform):
+    its comma-separated ignore_columns and use_columns, and the clues of its columns (DataFormatClues).
+
+    Args:
+        data_format (DataFormat): the format of the clues
+
+    Returns:
+        dict: the clues
+    """
+    return {
+        'ignore_columns': data_format.ignore_columns,
+        'use_columns': data_format.use_columns,
+        'columns': {clue.column_name: clue.clues for clue in data_format.clues.all()},
+    }
+
+
+def params_version() -> str:
+    """
+    Return a hash of everything the transformations depend on besides their inputs:
+    the parameters of the transformer, its encoder and the version of the compiled formats.
+    """
+    model = get_transformer()
+    return hashlib.sha256(json.dumps({
+        'params': model.params,
+        'drop_duplicates': model.drop_duplicates,
+        'derive': model.derive,
+        'encoder': similarity.MODEL_NAME,
+        'compiled_format_version': COMPILED_FORMAT_VERSION,
+    }, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def format_sha256(data_format) -> str:
+    # hash of the file of a format and of its clues, which both change the transformations
+    return hashlib.sha256(json.dumps([data_format.sha256, format_clues(data_format)], sort_keys=True).encode()).hexdigest()
+
+
+def find_transformed(data_before, data_format, user):
+    """
+    Return the dataset of a user already transformed from the same content as data_before
+    to the same format, with the same parameters, if there is one.
+
+    Args:
+        data_before (DataBefore): the dataset to transform
+        data_format (DataFormat): the format to transform it to
+        user (User): the owner of the transformed dataset
+
+    Returns:
+        DataAfter: the transformed dataset, or None
+    """
+    if not data_before.sha256 or not data_format.sha256:
+        return None
+    return DataAfter.objects.filter(user=user, source_sha256=data_before.sha256, format_sha256=format_sha256(data_format),
+        params_version=params_version()).exclude(file='').order_by('-updated_at').first()
+
+
+def transform_data(data_before, data_format, user, name=None, incremental=True, memoize=True):
+    """
+    Transform an uploaded dataset to a format, and save the result.
+    If the dataset is a new export of a dataset already transformed to this format (see DataBefore.previous),
+    only the rows that were not in the previous exports are transformed, with the same mapping,
+    and appended to a copy of the previous transformed dataset. CSV outputs are copied and appended to,
+    outputs in other filetypes are read and written again whole.
+
+    Args:
+        data_before (DataBefore): the dataset to transform
+        data_format (DataFormat): the format to transform it to
+        user (User): the owner of the transformed dataset
+        name (str): the name of the transformed dataset (default: the name of data_before)
+        incremental (bool): if true (default), only transform the rows new since the previous export
+        memoize (bool): if true (default), return the dataset already transformed from the same content
+            to the same format, if there is one (see find_transformed)
+
+    Returns:
+        DataAfter: the transformed dataset
+    """
+    if memoize:
+        data_after = find_transformed(data_before, data_format, user)
+        if data_after is not None:
+            logger.info('%s was already transformed to %s', data_before.name, data_after.name)
+            return data_after
+    model = get_transformer()
+    dataframe = read_dataframe(data_before.file.path)
+    hashes = hash_rows(dataframe)
+    if incremental and data_before.previous_id is not None:
+        previous_after = DataAfter.objects.filter(user=user, data_before=data_before.previous, data_format=data_format) \
+            .exclude(row_hashes='').order_by('-updated_at').first()
+        if previous_after is not None and previous_after.mapping:
+            try:
+                return __append_data(model, previous_after, data_before, dataframe, hashes, user=user, name=name)
+            except KeyError:
+                # the columns of the export changed, so the mapping cannot be reused
+                logger.info('Columns of %s changed, transforming it again', data_before.name)
+    deduplicator = RowDeduplicator()
+    transformed_dataframe = model.transform(dataframe, load_compiled_format(data_format), clues=format_clues(data_format),
+        deduplicator=deduplicator)
+    filename = __output_filename(data_before, data_format)
+    data_after = DataAfter(name=name or data_before.name, user=user, data_before=data_before, data_format=data_format,
+        mapping=transformed_dataframe.attrs['mapping'], source_sha256=data_before.sha256,
+        format_sha256=format_sha256(data_format), params_version=params_version())
+    with tempfile.TemporaryDirectory() as tmp:
+        save_dataframe(transformed_dataframe, os.path.join(tmp, filename))
+        with open(os.path.join(tmp, filename), 'rb') as f:
+            data_after.file.save(filename, File(f), save=False)
+    __save_row_hashes(data_after, np.unique(hashes), deduplicator.seen_hashes)
+    data_after.save()
+    return data_after
+
+
+def __append_data(model, previous_after, data_before, dataframe, hashes, user, name=None):
+    # transform the new rows with the mapping of the previous exports, and append them to a copy
+    # of the previous transformed dataset, which is left as it is
+    seen_hashes = np.load(previous_after.row_hashes.path)
+    new = new_rows(hashes, seen_hashes)
+    # the new rows are also dropped when their output is already in the previous transformed dataset
+    deduplicator = RowDeduplicator(np.load(previous_after.output_hashes.path) if previous_after.output_hashes else None)
+    data_format = previous_after.data_format
+    filename = __output_filename(data_before, data_format)
+    # it also has the rows of the previous exports, so it is not the transformation of the content of data_before
+    # alone, and it is not returned for other uploads of the same content (see find_transformed)
+    data_after = DataAfter(name=name or data_before.name, user=user, data_before=data_before, data_format=data_format,
+        mapping=previous_after.mapping, format_sha256=format_sha256(data_format), params_version=params_version())
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, filename)
+        if new.any():
+            transformed_dataframe = model.transform(dataframe[new], load_compiled_format(data_format),
+                mapping=previous_after.mapping, deduplicator=deduplicator)
+            if filename.endswith('.csv') and previous_after.file.name.endswith('.csv'):
+                shutil.copyfile(previous_after.file.path, path)
+                save_dataframe(transformed_dataframe, path, mode='a', header=False)
+            else:
+                # the other filetypes cannot be appended to, so the whole dataset is written again
+                transformed_dataframe = pd.concat([read_dataframe(previous_after.file.path), transformed_dataframe],
+                    ignore_index=True)
+                save_dataframe(transformed_dataframe, path)
+        else:
+            shutil.copyfile(previous_after.file.path, path)
+        with open(path, 'rb') as f:
+            data_after.file.save(filename, File(f), save=False)
+    __save_row_hashes(data_after, np.union1d(seen_hashes, hashes[new]), deduplicator.seen_hashes)
+    data_after.save()
+    logger.info('Appended %d new rows of %s to a copy of %s', new.sum(), data_before.name, previous_after.name)
+    return data_after
+
+
+def __output_filename(data_before, data_format) -> str:
+    # the output is saved in the filetype of the format
+    filetype = data_format.file.name.split('.')[-1].lower()
+    return f'{os.path.splitext(os.path.basename(data_before.file.name))[0]}.{filetype}'
+
+
+def __save_row_hashes(data_after, hashes, output_hashes):
+    # the sorted hashes of the input rows already transformed, and of the rows of the output
+    for field, values, extension in ((data_after.row_hashes, hashes, '.npy'),
+            (data_after.output_hashes, output_hashes, '.output.npy')):
+        buffer = io.BytesIO()
+        np.save(buffer, values)
+        field.save(os.path.basename(data_after.file.name) + extension, ContentFile(buffer.getvalue()), save=False)
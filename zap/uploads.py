@@ -0,0 +1,127 @@
+# functions for receiving files in chunks, resumable after a failure (see UploadSession)
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from .models import DataBefore, UploadSession
+import hashlib
+import os
+import shutil
+import tempfile
+
+
+# size of the blocks read from the requests and from the files
+BLOCK_SIZE = 1024 * 1024
+
+# hashers of the sessions uploaded to this worker, with the offset they hashed up to
+__hashers = {}
+
+
+class PartFile(File):
+    """
+    The assembled file of an upload session, moved to its storage instead of copied
+    (see FileSystemStorage._save).
+    """
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def part_path(session: UploadSession) -> str:
+    # the file the chunks of a session are written to
+    return default_storage.path(os.path.join('uploads', f'{session.id}.part'))
+
+
+def append_chunk(session: UploadSession, start: int, stream, length=None) -> int:
+    """
+    Write a chunk of an upload session at its offset, reading it from a stream block by block.
+    The chunk is received in a temporary file first, and only written to the file of the session
+    once its offset is moved, so that concurrent chunks at the same offset do not mix.
+
+    Args:
+        session (UploadSession): the session of the chunk
+        start (int): the offset of the chunk, which must be the offset of the session
+        stream: file-like object with the content of the chunk
+        length (int): the length of the chunk, if known (e.g. from its Content-Range)
+
+    Returns:
+        int: the new offset of the session, or -1 if the chunk was not at the offset of the session
+
+    Raises:
+        ValueError: if the chunk is not of the given length
+    """
+    if start != session.offset or session.data_before_id is not None:
+        return -1
+    path = part_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    offset, hasher = __hashers.get(session.id, (None, None))
+    if offset != start:
+        # the previous chunks were received by another worker, the file is hashed when complete
+        hasher = hashlib.sha256() if start == 0 else None
+    else:
+        hasher = hasher.copy()
+    with tempfile.TemporaryFile(dir=os.path.dirname(path)) as chunk:
+        for block in iter(lambda: stream.read(BLOCK_SIZE), b''):
+            chunk.write(block)
+            if hasher is not None:
+                hasher.update(block)
+        end = start + chunk.tell()
+        if length is not None and end - start != length:
+            raise ValueError(f'Chunk of {end - start} bytes instead of {length}')
+        chunk.seek(0)
+        with transaction.atomic():
+            # only one request can move the offset of a session, and it holds the session until the chunk is written
+            # update() does not set updated_at, which the ETag of the lists of sessions depends on
+            if not UploadSession.objects.filter(id=session.id, offset=start, data_before__isnull=True) \
+                    .update(offset=end, updated_at=timezone.now()):
+                return -1
+            with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+                f.seek(start)
+                f.truncate()
+                shutil.copyfileobj(chunk, f, BLOCK_SIZE)
+    session.offset = end
+    __hashers.pop(session.id, None)
+    if hasher is not None:
+        __hashers[session.id] = (end, hasher)
+    return end
+
+
+def complete_upload(session: UploadSession) -> DataBefore:
+    """
+    Turn a complete upload session into a DataBefore, moving its file to the storage of the datasets.
+    The session is locked meanwhile, so that it is completed once.
+
+    Args:
+        session (UploadSession): the session to complete
+
+    Returns:
+        DataBefore: the dataset uploaded, or None if no data was received
+    """
+    with transaction.atomic():
+        locked = UploadSession.objects.select_for_update().filter(id=session.id, data_before__isnull=True).first()
+        if locked is None:
+            # completed by another request
+            session.refresh_from_db()
+            return session.data_before
+        session = locked
+        path = part_path(session)
+        if session.offset == 0 or not os.path.exists(path):
+            return None
+        offset, hasher = __hashers.pop(session.id, (None, None))
+        if offset != session.offset:
+            # hash the chunks received by other workers from the file
+            hasher = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                    hasher.update(block)
+        with open(path, 'rb') as f:
+            file = PartFile(f, name=session.filename)
+            file.sha256 = hasher.hexdigest()
+            data_before = DataBefore.objects.create(name=session.name, user=session.user, file=file,
+                previous=session.previous)
+        # the file was moved to the storage, unless the same file was already there
+        if os.path.exists(path):
+            os.remove(path)
+        session.data_before = data_before
+        session.save(update_fields=['data_before', 'updated_at'])
+    return data_before
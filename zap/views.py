@@ -12,19 +12,37 @@ from django.contrib import messages
 from django.contrib.auth import login
 from django.shortcuts import render, redirect
 from django.http import HttpResponse
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
 from rest_framework import generics, permissions, serializers
 from django.contrib.auth.models import Group
 from oauth2_provider.contrib.rest_framework import TokenHasReadWriteScope, TokenHasScope
 from django.views.generic.base import TemplateView
 from .forms import HomeForm, UserRegisterForm, UserLoginForm
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from rest_framework.permissions import IsAuthenticated
 from transformer import TelematicZapTransformer
 from rest_framework import filters
-from .models import User, DataBefore, DataAfter, DataFormat, DataFormatClues
-from .serializers import DataBeforeSerializer, DataAfterSerializer, DataFormatSerializer, DataFormatCluesSerializer
+from .models import User, DataBefore, DataAfter, DataFormat, DataFormatClues, TransformJob, UploadSession
+from .serializers import DataBeforeSerializer, DataAfterSerializer, DataFormatSerializer, DataFormatCluesSerializer, \
+    TransformJobSerializer, UploadSessionSerializer
 from django_filters.rest_framework import DjangoFilterBackend
 from django.contrib.auth.views import LoginView
+from .transforms import get_transformer
+from .jobs import submit_job
+from .uploads import append_chunk, complete_upload
+from .downloads import file_response
+import hashlib
+import logging
+import os
+import re
+
+
+logger = logging.getLogger(__name__)
+
+# number of the newest records of each kind shown in the dashboard
+DASHBOARD_ITEMS = 50
+
 
 class ApiEndpoint(ProtectedResourceView):
     def get(self, request, *args, **kwargs):
@@ -37,7 +55,7 @@ class HomeFormView(FormView):
     success_url = '/'
 
     def form_valid(self, form):
-        print('transform!')
+        logger.info('transform!')
         valid = super().form_valid(form)
         if valid:
             # get data before and format
@@ -48,7 +66,7 @@ class HomeFormView(FormView):
             tmp_output_filename = 'data_after.'+data_format_type
             tmp_output_path = '/tmp/'+tmp_output_filename
             # transform
-            model = TelematicZapTransformer()
+            model = get_transformer()
             model.transform_from_file(
                 input_file=data_before_path, output_file=tmp_output_path, 
                 output_example_file=data_format_path, limit_rows=100)
@@ -76,14 +94,15 @@ class DashboardFormView(CreateView):  # ProtectedResourceView
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        queryset1 = DataBefore.objects.filter(user=request.user)
-        queryset2 = DataFormat.objects.filter(user=request.user)
-        queryset3 = DataAfter.objects.filter(user=request.user)
-        return render(request, self.template_name, {
-            'queryset1': queryset1,
-            'queryset2': queryset2,
-            'queryset3': queryset3,
-        })
+        return render(request, self.template_name, self.get_querysets(request))
+
+    def get_querysets(self, request):
+        # only the newest records, with the fields shown (see the (user, created_at) indexes)
+        return {
+            f'queryset{i}': model.objects.filter(user=request.user).only('id', 'name', 'created_at')
+                .order_by('-created_at')[:DASHBOARD_ITEMS]
+            for i, model in enumerate([DataBefore, DataFormat, DataAfter], 1)
+        }
 
     def post(self, request, *args, **kwargs):
         if request.method == 'POST':
@@ -100,14 +119,7 @@ class DashboardFormView(CreateView):  # ProtectedResourceView
                 pass
             ## do what ever you want to do for second function ####
             ## return def post###
-        queryset1 = DataBefore.objects.filter(user=request.user)
-        queryset2 = DataFormat.objects.filter(user=request.user)
-        queryset3 = DataAfter.objects.filter(user=request.user)
-        return render(request, self.template_name, {
-            'queryset1': queryset1,
-            'queryset2': queryset2,
-            'queryset3': queryset3,
-        })
+        return render(request, self.template_name, self.get_querysets(request))
 
 
 class ContactFormView(FormView):
@@ -156,6 +168,18 @@ class AuthenticatedListCreateView(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
     filter_backends = [IsOwnerFilterBackend, DjangoFilterBackend]
 
+    def list(self, request, *args, **kwargs):
+        # the list is the same while no record is added, changed or deleted, so clients can revalidate it
+        # with If-None-Match, at the cost of an aggregate on the (user, created_at) index
+        state = self.filter_queryset(self.get_queryset()).aggregate(count=Count('pk'), updated_at=Max('updated_at'))
+        etag = '"{}"'.format(hashlib.sha256(
+            f'{request.user.pk}:{request.get_full_path()}:{state["count"]}:{state["updated_at"]}'.encode()).hexdigest()[:32])
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+            response['ETag'] = etag
+        return response
+
     def perform_create(self, serializer, **kwargs):
         serializer.save(user=self.request.user, **kwargs)
 
@@ -184,6 +208,106 @@ class DataAfterList(AuthenticatedListCreateView):
     queryset = DataAfter.objects.all()
     serializer_class = DataAfterSerializer
 
+    def create(self, request, *args, **kwargs):
+        # queue the transformation of the dataset, unless the transformed file is uploaded,
+        # and return its job to poll (see TransformJobList)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if 'file' in serializer.validated_data:
+            self.perform_create(serializer)
+            return Response(serializer.data, status=status.HTTP_201_CREATED, headers=self.get_success_headers(serializer.data))
+        job = submit_job(serializer.validated_data['data_before'], serializer.validated_data['data_format'],
+            user=request.user, name=serializer.validated_data['name'])
+        return Response(TransformJobSerializer(job, context=self.get_serializer_context()).data,
+            status=status.HTTP_202_ACCEPTED, headers={'Location': reverse('transformjob-detail', args=[job.pk])})
+
 class DataAfterRUD(AuthenticatedRUDView):
     queryset = DataAfter.objects.all()
     serializer_class = DataAfterSerializer
+
+
+class TransformJobList(AuthenticatedListCreateView):
+    queryset = TransformJob.objects.all()
+    serializer_class = TransformJobSerializer
+
+    def perform_create(self, serializer, **kwargs):
+        # queue the transformation, a worker runs it (see the transform_worker command)
+        serializer.instance = submit_job(serializer.validated_data['data_before'],
+            serializer.validated_data['data_format'], user=self.request.user, name=serializer.validated_data.get('name'))
+
+class TransformJobDetail(generics.RetrieveAPIView):
+    permission_classes = [IsAuthenticated]
+    filter_backends = [IsOwnerFilterBackend, DjangoFilterBackend]
+    queryset = TransformJob.objects.all()
+    serializer_class = TransformJobSerializer
+
+
+class UploadSessionList(AuthenticatedListCreateView):
+    queryset = UploadSession.objects.all()
+    serializer_class = UploadSessionSerializer
+
+class UploadSessionDetail(generics.RetrieveAPIView):
+    """
+    Status of an upload session, and its chunks: PUT the raw bytes of a chunk with the header
+    `Content-Range: bytes <start>-<end>/<size or *>`, where start must be the offset of the session.
+    A chunk at another offset gets a 409 response with the offset to resume from.
+    """
+    permission_classes = [IsAuthenticated]
+    filter_backends = [IsOwnerFilterBackend, DjangoFilterBackend]
+    queryset = UploadSession.objects.all()
+    serializer_class = UploadSessionSerializer
+
+    def put(self, request, *args, **kwargs):
+        session = self.get_object()
+        content_range = re.fullmatch(r'bytes (\d+)-(\d+)/(\d+|\*)', request.headers.get('Content-Range', ''))
+        if content_range is None:
+            return Response({'detail': 'Content-Range header required'}, status=status.HTTP_400_BAD_REQUEST)
+        start, end, size = int(content_range.group(1)), int(content_range.group(2)), content_range.group(3)
+        if end < start:
+            return Response({'detail': 'Invalid Content-Range'}, status=status.HTTP_400_BAD_REQUEST)
+        if size != '*' and session.size is None:
+            session.size = int(size)
+            session.save(update_fields=['size', 'updated_at'])
+        if session.size is not None and end >= session.size:
+            return Response({'detail': 'Chunk beyond the size of the file'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            offset = append_chunk(session, start, request.stream, length=end - start + 1)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if offset < 0:
+            session.refresh_from_db()
+            return Response(self.get_serializer(session).data, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(session).data)
+
+class UploadSessionComplete(UploadSessionDetail):
+    http_method_names = ['post', 'options']
+
+    def post(self, request, *args, **kwargs):
+        # the dataset of a session whose chunks were all received
+        session = self.get_object()
+        if session.size is not None and session.offset != session.size:
+            return Response(self.get_serializer(session).data, status=status.HTTP_409_CONFLICT)
+        data_before = complete_upload(session)
+        if data_before is None:
+            # no chunk was received
+            return Response(self.get_serializer(session).data, status=status.HTTP_409_CONFLICT)
+        return Response(DataBeforeSerializer(data_before, context={'request': request}).data, status=status.HTTP_201_CREATED)
+
+
+class FileDownloadView(generics.RetrieveAPIView):
+    """
+    Download of the file of a dataset, streamed, with support for ranges and conditional requests.
+    """
+    permission_classes = [IsAuthenticated]
+    filter_backends = [IsOwnerFilterBackend, DjangoFilterBackend]
+
+    def get(self, request, *args, **kwargs):
+        instance = self.get_object()
+        filename = instance.name + os.path.splitext(instance.file.name)[1]
+        return file_response(request, instance.file, filename, sha256=getattr(instance, 'sha256', None))
+
+class DataBeforeDownload(FileDownloadView):
+    queryset = DataBefore.objects.all()
+
+class DataAfterDownload(FileDownloadView):
+    queryset = DataAfter.objects.all()